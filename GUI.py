@@ -1,13 +1,225 @@
+import time
+STARTUP_T0 = time.perf_counter()
 import sys
-import ctypes
 import json
 import os
+import ctypes
+import ctypes.util
+import multiprocessing
+import threading
 from pathlib import Path
 from PySide6.QtWidgets import (QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, 
                                 QHBoxLayout, QSpinBox, QDoubleSpinBox, QSlider, QCheckBox, 
-                                QGroupBox, QColorDialog, QSystemTrayIcon, QMenu, QComboBox)
-from PySide6.QtCore import Qt, QTimer
-from PySide6.QtGui import QColor, QAction, QIcon, QPixmap
+                                QGroupBox, QColorDialog, QSystemTrayIcon, QMenu, QComboBox, QListWidget, QScrollArea)
+from PySide6.QtCore import Qt, QTimer, QRect, Signal, QObject
+from PySide6.QtGui import QColor, QAction, QIcon, QPixmap, QImage, QPainter, QRegion
+from backends import DllBackend, SoftwareBackend, GdiCapture, preload_engine
+from config_store import ConfigStore, ConfigLoadError, FPS_VALUES, RESAMPLE_KERNELS, COLOR_FILTERS, TRACK_MODES, MAX_LENSES, KEY_PLATFORM, default_lens
+from control_client import SHAPES
+
+BUDGET_TOOLTIP = 'Drops filters, smooth scaling, then frame rate to stay within budget (CPU is % of one core)'
+
+STYLE_SHEET = """
+    QWidget {
+        background: #1e1e1e;
+        color: #ffffff;
+        font-family: Segoe UI;
+        font-size: 10pt;
+    }
+    QLabel {
+        color: #cccccc;
+    }
+    QSpinBox, QDoubleSpinBox {
+        background: #2d2d2d;
+        border: 1px solid #3d3d3d;
+        border-radius: 4px;
+        padding: 5px;
+        color: #ffffff;
+    }
+    QSpinBox::up-button, QDoubleSpinBox::up-button {
+        background: #0d7377;
+        border: none;
+        border-radius: 3px;
+        width: 18px;
+        margin: 2px;
+    }
+    QSpinBox::up-button:hover, QDoubleSpinBox::up-button:hover {
+        background: #14a085;
+    }
+    QSpinBox::down-button, QDoubleSpinBox::down-button {
+        background: #0d7377;
+        border: none;
+        border-radius: 3px;
+        width: 18px;
+        margin: 2px;
+    }
+    QSpinBox::down-button:hover, QDoubleSpinBox::down-button:hover {
+        background: #14a085;
+    }
+    QSpinBox::up-arrow, QDoubleSpinBox::up-arrow {
+        width: 10px;
+        height: 10px;
+    }
+    QSpinBox::down-arrow, QDoubleSpinBox::down-arrow {
+        width: 10px;
+        height: 10px;
+    }
+    QPushButton {
+        background: #0d7377;
+        border: none;
+        border-radius: 6px;
+        padding: 8px;
+        color: #ffffff;
+        font-weight: bold;
+    }
+    QPushButton:checked {
+        background: #14a085;
+    }
+    KeyButton {
+        padding: 4px;
+        font-size: 9pt;
+    }
+    QPushButton:hover {
+        background: #14a085;
+    }
+    QPushButton:pressed {
+        background: #0a5f62;
+    }
+    QGroupBox {
+        border: 1px solid #3d3d3d;
+        border-radius: 6px;
+        margin-top: 10px;
+        padding-top: 10px;
+        font-weight: bold;
+    }
+    QGroupBox::title {
+        color: #14a085;
+    }
+    QSlider::groove:horizontal {
+        background: #2d2d2d;
+        height: 6px;
+        border-radius: 3px;
+    }
+    QSlider::handle:horizontal {
+        background: #0d7377;
+        width: 16px;
+        margin: -5px 0;
+        border-radius: 8px;
+    }
+    QSlider::handle:horizontal:hover {
+        background: #14a085;
+    }
+    QCheckBox::indicator {
+        width: 20px;
+        height: 20px;
+        border: 2px solid #3d3d3d;
+        border-radius: 4px;
+        background: #2d2d2d;
+    }
+    QCheckBox::indicator:checked {
+        background: #0d7377;
+        border-color: #0d7377;
+    }
+    QCheckBox::indicator:checked:hover {
+        background: #14a085;
+        border-color: #14a085;
+    }
+    QComboBox {
+        background: #2d2d2d;
+        border: 1px solid #3d3d3d;
+        border-radius: 4px;
+        padding: 5px;
+        color: #ffffff;
+    }
+    QComboBox:hover {
+        border-color: #0d7377;
+    }
+    QComboBox::drop-down {
+        border: none;
+        width: 20px;
+    }
+    QComboBox::down-arrow {
+        image: none;
+        border-left: 5px solid transparent;
+        border-right: 5px solid transparent;
+        border-top: 5px solid #0d7377;
+        width: 0;
+        height: 0;
+    }
+    QListWidget {
+        background: #2d2d2d;
+        border: 1px solid #3d3d3d;
+        border-radius: 4px;
+        color: #ffffff;
+    }
+    QListWidget::item:selected {
+        background: #0d7377;
+    }
+    QComboBox QAbstractItemView {
+        background: #2d2d2d;
+        border: 1px solid #0d7377;
+        selection-background-color: #0d7377;
+        color: #ffffff;
+    }
+    QScrollArea {
+        border: none;
+    }
+    QScrollBar:vertical {
+        background: #1e1e1e;
+        width: 8px;
+    }
+    QScrollBar::handle:vertical {
+        background: #3d3d3d;
+        border-radius: 4px;
+        min-height: 30px;
+    }
+    QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
+        height: 0;
+    }
+"""
+
+def find_icon(script_dir):
+    for path in (script_dir / 'Scope Z ico.png', Path(sys.executable).parent / 'Scope Z ico.png', Path('./Scope Z ico.png')):
+        if path.exists():
+            return path
+    return None
+
+def init_xlib_threads():
+    # The X11 engine calls Xlib from its preload and render threads. Xlib
+    # has to be told before the first connection is opened, and
+    # QApplication opens one, so this runs before it.
+    path = ctypes.util.find_library('X11')
+    if path:
+        ctypes.CDLL(path).XInitThreads()
+
+class StartupProfiler:
+    # --profile-startup: wall time per startup phase, printed once the engine is loaded
+    def __init__(self, enabled=False, start=None):
+        self.enabled = enabled
+        self.start = STARTUP_T0 if start is None else start
+        self.last = self.start
+        self.phases = []
+        self.background = []
+        self.reported = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000.0, (now - self.start) * 1000.0))
+        self.last = now
+
+    def add_background(self, phase, ms):
+        self.background.append((phase, ms))
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print(f"{'startup phase':<24} {'ms':>8} {'total':>8}")
+        for phase, ms, total in self.phases:
+            print(f"{phase:<24} {ms:>8.1f} {total:>8.1f}")
+        for phase, ms in self.background:
+            print(f"{phase:<24} {ms:>8.1f}   (background)")
+        sys.stdout.flush()
 
 class KeyButton(QPushButton):
     def __init__(self, parent=None):
@@ -105,220 +317,188 @@ class KeyButton(QPushButton):
             self.temp_key_code = None
             self.temp_modifiers = {'ctrl': False, 'shift': False, 'alt': False}
 
-class ScopeZGUI(QWidget):
+class LensOverlay(QWidget):
+    def __init__(self):
+        super().__init__(None, Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool | Qt.WindowTransparentForInput)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.setAttribute(Qt.WA_ShowWithoutActivating)
+        self.image = None
+        self.shaped = None
+
+    def show_frame(self, image, mask, position):
+        height, width = image.shape[:2]
+        self.image = QImage(image.data, width, height, image.strides[0], QImage.Format_RGB32).copy()
+        geometry = QRect(position[0], position[1], width, height)
+        if self.geometry() != geometry:
+            self.setGeometry(geometry)
+        shaped = (width, height) if mask is not None else None
+        if shaped != self.shaped:
+            if mask is not None:
+                self.setMask(QRegion(QRect(0, 0, width, height), QRegion.Ellipse))
+            else:
+                self.clearMask()
+            self.shaped = shaped
+        if not self.isVisible():
+            self.show()
+        self.update()
+
+    def paintEvent(self, event):
+        if self.image is not None:
+            QPainter(self).drawImage(0, 0, self.image)
+
+class LensOverlaySet(QObject):
+    # One overlay window per lens, fed one signal per frame from the render thread
+    frames_ready = Signal(object)
+
     def __init__(self):
         super().__init__()
-        self.dll = None
+        self.windows = []
+        self.suspended = False
+        self.frames_ready.connect(self.show_frames)
+
+    def present(self, frames):
+        self.frames_ready.emit(frames)
+
+    def set_suspended(self, suspended):
+        # Frames already queued when the engine suspends must not re-show the lenses
+        self.suspended = suspended
+        if suspended:
+            for window in self.windows:
+                window.hide()
+
+    def show_frames(self, frames):
+        if self.suspended:
+            return
+        while len(self.windows) < len(frames):
+            self.windows.append(LensOverlay())
+        for window, frame in zip(self.windows, frames):
+            if frame is not None:
+                window.show_frame(*frame)
+        for window in self.windows[len(frames):]:
+            window.hide()
+
+class ScopeZGUI(QWidget):
+    engine_state_changed = Signal()
+    config_error = Signal(object)
+    engine_preloaded = Signal(object, object, float)
+    control_changed = Signal(object, object)
+    
+    def __init__(self, profiler=None):
+        super().__init__()
+        self.profiler = profiler or StartupProfiler()
+        self.backend = None
+        self.lens_overlay = None
+        self.tray = None
+        self.preload_thread = None
+        self.control_server = None
+        self.control_lock = threading.Lock()
+        self.first_paint_done = False
         self.running = False
         self.script_dir = Path(__file__).parent
+        self.icon_path = find_icon(self.script_dir)
         self.config_file = self.script_dir / "config.json"
+        # Queued: a config that fails to load reports before the status label exists
+        self.config_error.connect(self.on_config_error, Qt.QueuedConnection)
         self.load_config()
+        self.profiler.mark('config')
         self.initUI()
+        self.profiler.mark('widgets')
+        # What control clients read and change, kept off the widgets so their threads never touch Qt
+        self.control_settings = self.current_settings()
+        self.engine_state_changed.connect(self.on_engine_state)
+        self.engine_preloaded.connect(self.on_engine_preloaded)
+        self.control_changed.connect(self.on_control_changed)
+        
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            QTimer.singleShot(0, self.after_first_paint)
+            
+    def after_first_paint(self):
+        # Everything the window does not need to appear happens from here on
+        self.profiler.mark('first paint')
         self.setup_tray()
-        self.setup_zoom_sync()
+        self.profiler.mark('tray')
+        if self.control_check.isChecked():
+            self.start_control_server()
+        if self.engine_process_check.isChecked():
+            self.prewarm_engine()
+            self.profiler.mark('engine worker spawn')
+            self.profiler.report()
+            return
+        self.preload_thread = threading.Thread(target=self.preload, name='scope-z-preload', daemon=True)
+        self.preload_thread.start()
+        
+    def preload(self):
+        start = time.perf_counter()
+        try:
+            kind = preload_engine(self.script_dir / 'scope_z.dll')
+            error = None
+        except Exception as e:
+            # create_backend on START runs the same steps and reports it
+            kind, error = None, e
+        self.engine_preloaded.emit(kind, error, (time.perf_counter() - start) * 1000.0)
+        
+    def on_engine_preloaded(self, kind, error, ms):
+        self.profiler.add_background('engine load and bind', ms)
+        self.profiler.report()
+        if self.backend is None:
+            self.update_budget_inputs(kind != 'dll')
         
     def load_config(self):
-        if self.config_file.exists():
-            with open(self.config_file) as f:
-                cfg = json.load(f)
-                self.lens_size = cfg.get("lens_size", 300)
-                self.zoom_factor = cfg.get("zoom_factor", 3.0)
-                self.toggle_key = cfg.get("toggle_key", 0x05)
-                self.toggle_modifiers = cfg.get("toggle_modifiers", {'ctrl': False, 'shift': False, 'alt': False})
-                self.zoom_in_key = cfg.get("zoom_in_key", 0x200)
-                self.zoom_in_modifiers = cfg.get("zoom_in_modifiers", {'ctrl': True, 'shift': False, 'alt': False})
-                self.zoom_out_key = cfg.get("zoom_out_key", 0x201)
-                self.zoom_out_modifiers = cfg.get("zoom_out_modifiers", {'ctrl': True, 'shift': False, 'alt': False})
-                self.lens_shape = cfg.get("lens_shape", 0)
-                self.fps = cfg.get("fps", 60)
-        else:
-            self.lens_size = 300
-            self.zoom_factor = 3.0
-            self.toggle_key = 0x05
-            self.toggle_modifiers = {'ctrl': False, 'shift': False, 'alt': False}
-            self.zoom_in_key = 0x200
-            self.zoom_in_modifiers = {'ctrl': True, 'shift': False, 'alt': False}
-            self.zoom_out_key = 0x201
-            self.zoom_out_modifiers = {'ctrl': True, 'shift': False, 'alt': False}
-            self.lens_shape = 0
-            self.fps = 60
+        self.config = ConfigStore(self.config_file, on_error=self.config_error.emit)
+        cfg = self.config.load()
+        self.lenses = [default_lens(lens_size=cfg["lens_size"], zoom_factor=cfg["zoom_factor"],
+                                    lens_shape=cfg["lens_shape"], resample_kernel=cfg["resample_kernel"])]
+        self.lenses += [dict(lens) for lens in cfg["extra_lenses"]]
+        self.selected_lens = 0
+        self.toggle_key = cfg["toggle_key"]
+        self.toggle_modifiers = cfg["toggle_modifiers"]
+        self.zoom_in_key = cfg["zoom_in_key"]
+        self.zoom_in_modifiers = cfg["zoom_in_modifiers"]
+        self.zoom_out_key = cfg["zoom_out_key"]
+        self.zoom_out_modifiers = cfg["zoom_out_modifiers"]
+        self.fps = cfg["fps"]
+        self.zoom_animation_ms = cfg["zoom_animation_ms"]
+        self.track_mode = cfg["track_mode"]
+        self.track_monitor = cfg["track_monitor"]
+        self.track_x = cfg["track_x"]
+        self.track_y = cfg["track_y"]
+        self.skip_static = cfg["skip_static"]
+        self.engine_process = cfg["engine_process"]
+        self.control_enabled = cfg["control_server"]
+        self.trace_session = cfg["trace_session"]
+        self.frame_budget_ms = cfg["frame_budget_ms"]
+        self.cpu_budget_percent = cfg["cpu_budget_percent"]
+        self.filters_enabled = cfg["filters_enabled"]
+        self.sharpen = cfg["sharpen"]
+        self.contrast = cfg["contrast"]
+        self.gamma = cfg["gamma"]
+        self.color_filter = cfg["color_filter"]
+        self.extra_hotkeys = cfg["hotkeys"]
             
     def save_config(self):
-        try:
-            cfg = {
-                "lens_size": self.lens_input.value(),
-                "zoom_factor": self.zoom_input.value(),
-                "toggle_key": self.toggle_btn.key_code,
-                "toggle_modifiers": self.toggle_btn.modifiers,
-                "zoom_in_key": self.zoom_in_btn.key_code,
-                "zoom_in_modifiers": self.zoom_in_btn.modifiers,
-                "zoom_out_key": self.zoom_out_btn.key_code,
-                "zoom_out_modifiers": self.zoom_out_btn.modifiers,
-                "lens_shape": self.shape_combo.currentIndex(),
-                "fps": self.fps_values[self.fps_slider.value()]
-            }
-            with open(self.config_file, "w") as f:
-                json.dump(cfg, f)
-        except:
-            pass
+        self.config.update(self.current_settings())
+        
+    def on_config_error(self, error):
+        self.status.setText(f'✖ {error}' if isinstance(error, ConfigLoadError) else f'✖ Config not saved: {error}')
+        self.status.setStyleSheet("color: #f44336; font-size: 9pt;")
         
     def initUI(self):
         self.setWindowTitle('Scope Z')
-        icon_paths = [
-            self.script_dir / 'Scope Z ico.png',
-            Path(sys.executable).parent / 'Scope Z ico.png',
-            Path('./Scope Z ico.png')
-        ]
-        icon_path = None
-        for path in icon_paths:
-            if path.exists():
-                icon_path = path
-                break
-        if icon_path:
-            self.setWindowIcon(QIcon(str(icon_path)))
+        if self.icon_path:
+            self.setWindowIcon(QIcon(str(self.icon_path)))
         self.setWindowFlags(Qt.FramelessWindowHint)
-        self.setFixedSize(400, 520)
-        self.setStyleSheet("""
-            QWidget {
-                background: #1e1e1e;
-                color: #ffffff;
-                font-family: Segoe UI;
-                font-size: 10pt;
-            }
-            QLabel {
-                color: #cccccc;
-            }
-            QSpinBox, QDoubleSpinBox {
-                background: #2d2d2d;
-                border: 1px solid #3d3d3d;
-                border-radius: 4px;
-                padding: 5px;
-                color: #ffffff;
-            }
-            QSpinBox::up-button, QDoubleSpinBox::up-button {
-                background: #0d7377;
-                border: none;
-                border-radius: 3px;
-                width: 18px;
-                margin: 2px;
-            }
-            QSpinBox::up-button:hover, QDoubleSpinBox::up-button:hover {
-                background: #14a085;
-            }
-            QSpinBox::down-button, QDoubleSpinBox::down-button {
-                background: #0d7377;
-                border: none;
-                border-radius: 3px;
-                width: 18px;
-                margin: 2px;
-            }
-            QSpinBox::down-button:hover, QDoubleSpinBox::down-button:hover {
-                background: #14a085;
-            }
-            QSpinBox::up-arrow, QDoubleSpinBox::up-arrow {
-                width: 10px;
-                height: 10px;
-            }
-            QSpinBox::down-arrow, QDoubleSpinBox::down-arrow {
-                width: 10px;
-                height: 10px;
-            }
-            QPushButton {
-                background: #0d7377;
-                border: none;
-                border-radius: 6px;
-                padding: 8px;
-                color: #ffffff;
-                font-weight: bold;
-            }
-            QPushButton:checked {
-                background: #14a085;
-            }
-            KeyButton {
-                padding: 4px;
-                font-size: 9pt;
-            }
-            QPushButton:hover {
-                background: #14a085;
-            }
-            QPushButton:pressed {
-                background: #0a5f62;
-            }
-            QGroupBox {
-                border: 1px solid #3d3d3d;
-                border-radius: 6px;
-                margin-top: 10px;
-                padding-top: 10px;
-                font-weight: bold;
-            }
-            QGroupBox::title {
-                color: #14a085;
-            }
-            QSlider::groove:horizontal {
-                background: #2d2d2d;
-                height: 6px;
-                border-radius: 3px;
-            }
-            QSlider::handle:horizontal {
-                background: #0d7377;
-                width: 16px;
-                margin: -5px 0;
-                border-radius: 8px;
-            }
-            QSlider::handle:horizontal:hover {
-                background: #14a085;
-            }
-            QCheckBox::indicator {
-                width: 20px;
-                height: 20px;
-                border: 2px solid #3d3d3d;
-                border-radius: 4px;
-                background: #2d2d2d;
-            }
-            QCheckBox::indicator:checked {
-                background: #0d7377;
-                border-color: #0d7377;
-            }
-            QCheckBox::indicator:checked:hover {
-                background: #14a085;
-                border-color: #14a085;
-            }
-            QComboBox {
-                background: #2d2d2d;
-                border: 1px solid #3d3d3d;
-                border-radius: 4px;
-                padding: 5px;
-                color: #ffffff;
-            }
-            QComboBox:hover {
-                border-color: #0d7377;
-            }
-            QComboBox::drop-down {
-                border: none;
-                width: 20px;
-            }
-            QComboBox::down-arrow {
-                image: none;
-                border-left: 5px solid transparent;
-                border-right: 5px solid transparent;
-                border-top: 5px solid #0d7377;
-                width: 0;
-                height: 0;
-            }
-            QComboBox QAbstractItemView {
-                background: #2d2d2d;
-                border: 1px solid #0d7377;
-                selection-background-color: #0d7377;
-                color: #ffffff;
-            }
-        """)
+        self.setStyleSheet(STYLE_SHEET)
         
         layout = QVBoxLayout()
         layout.setSpacing(0)
         layout.setContentsMargins(0, 0, 0, 0)
         
         title_bar = QWidget()
-        title_bar.setFixedHeight(34)
+        self.title_bar_height = 34
+        title_bar.setFixedHeight(self.title_bar_height)
         title_bar.setStyleSheet("background: #0d7377;")
         title_layout = QHBoxLayout(title_bar)
         title_layout.setContentsMargins(10, 0, 0, 0)
@@ -348,17 +528,31 @@ class ScopeZGUI(QWidget):
         content_layout.setSpacing(15)
         content_layout.setContentsMargins(20, 20, 20, 20)
         
-        settings_group = QGroupBox("Settings")
+        settings_group = QGroupBox("Lenses")
         settings_layout = QVBoxLayout()
         
+        self.lens_list = QListWidget()
+        self.lens_list.setFixedHeight(70)
+        self.lens_list.currentRowChanged.connect(self.on_lens_selected)
+        settings_layout.addWidget(self.lens_list)
+        
+        lens_buttons = QHBoxLayout()
+        self.add_lens_btn = QPushButton('+ Add Lens')
+        self.add_lens_btn.clicked.connect(self.add_lens)
+        self.add_lens_btn.setToolTip('Extra lenses share one capture in the software renderer; the DLL engine draws the main lens only')
+        lens_buttons.addWidget(self.add_lens_btn)
+        self.remove_lens_btn = QPushButton('− Remove')
+        self.remove_lens_btn.clicked.connect(self.remove_lens)
+        lens_buttons.addWidget(self.remove_lens_btn)
+        settings_layout.addLayout(lens_buttons)
+        
         lens_layout = QHBoxLayout()
         lens_layout.addWidget(QLabel('Lens Size:'))
         self.lens_input = QSpinBox()
         self.lens_input.setRange(50, 1000)
         self.lens_input.setSingleStep(50)
-        self.lens_input.setValue(self.lens_size)
         self.lens_input.setButtonSymbols(QSpinBox.PlusMinus)
-        self.lens_input.valueChanged.connect(self.apply_settings)
+        self.lens_input.valueChanged.connect(self.on_lens_edited)
         lens_layout.addWidget(self.lens_input)
         settings_layout.addLayout(lens_layout)
         
@@ -367,16 +561,55 @@ class ScopeZGUI(QWidget):
         self.zoom_input = QDoubleSpinBox()
         self.zoom_input.setRange(1.0, 10.0)
         self.zoom_input.setSingleStep(0.5)
-        self.zoom_input.setValue(self.zoom_factor)
         self.zoom_input.setButtonSymbols(QSpinBox.PlusMinus)
-        self.zoom_input.valueChanged.connect(self.apply_settings)
+        self.zoom_input.valueChanged.connect(self.on_lens_edited)
         zoom_layout.addWidget(self.zoom_input)
         settings_layout.addLayout(zoom_layout)
         
+        position_layout = QHBoxLayout()
+        position_layout.addWidget(QLabel('Offset X / Y:'))
+        self.offset_x_input = QSpinBox()
+        self.offset_y_input = QSpinBox()
+        for offset_input in (self.offset_x_input, self.offset_y_input):
+            offset_input.setRange(-4000, 4000)
+            offset_input.setSingleStep(10)
+            offset_input.setButtonSymbols(QSpinBox.PlusMinus)
+            offset_input.setToolTip('Moves the lens window away from the screen centre; the main lens stays centred')
+            offset_input.valueChanged.connect(self.on_lens_edited)
+            position_layout.addWidget(offset_input)
+        settings_layout.addLayout(position_layout)
+        
+        track_layout = QHBoxLayout()
+        track_layout.addWidget(QLabel('Follow:'))
+        self.track_combo = QComboBox()
+        self.track_combo.addItems(['Monitor centre', 'Cursor', 'Fixed point'])
+        self.track_combo.setCurrentIndex(TRACK_MODES.index(self.track_mode))
+        self.track_combo.setToolTip('Native engine only: what the main lens magnifies; the lens window moves with it and stays on that monitor')
+        self.track_combo.currentIndexChanged.connect(self.on_track_mode_changed)
+        track_layout.addWidget(self.track_combo)
+        self.track_monitor_input = QSpinBox()
+        self.track_monitor_input.setRange(1, 16)
+        self.track_monitor_input.setPrefix('Monitor ')
+        self.track_monitor_input.setValue(self.track_monitor + 1)
+        self.track_monitor_input.setToolTip('1 is the primary monitor, then left to right')
+        track_layout.addWidget(self.track_monitor_input)
+        self.track_x_input = QSpinBox()
+        self.track_y_input = QSpinBox()
+        for point_input, value in ((self.track_x_input, self.track_x), (self.track_y_input, self.track_y)):
+            point_input.setRange(-32768, 32767)
+            point_input.setValue(value)
+            point_input.setToolTip('Desktop coordinates; the primary monitor starts at 0, 0')
+            track_layout.addWidget(point_input)
+        for track_input in (self.track_monitor_input, self.track_x_input, self.track_y_input):
+            track_input.setButtonSymbols(QSpinBox.NoButtons)
+            track_input.valueChanged.connect(self.apply_settings)
+        settings_layout.addLayout(track_layout)
+        self.update_track_inputs()
+        
         fps_layout = QHBoxLayout()
         fps_layout.addWidget(QLabel('FPS Limit:'))
         self.fps_slider = QSlider(Qt.Horizontal)
-        self.fps_values = [30, 60, 75, 120, 144, 240]
+        self.fps_values = FPS_VALUES
         self.fps_slider.setRange(0, len(self.fps_values) - 1)
         self.fps_slider.setValue(self.fps_values.index(self.fps) if self.fps in self.fps_values else 1)
         self.fps_slider.setTickPosition(QSlider.TicksBelow)
@@ -393,13 +626,108 @@ class ScopeZGUI(QWidget):
         shape_layout.addWidget(QLabel('Lens Shape:'))
         self.shape_combo = QComboBox()
         self.shape_combo.addItems(['Circle', 'Rectangle'])
-        self.shape_combo.setCurrentIndex(self.lens_shape)
-        self.shape_combo.currentIndexChanged.connect(self.apply_settings)
+        self.shape_combo.currentIndexChanged.connect(self.on_lens_edited)
         shape_layout.addWidget(self.shape_combo)
         settings_layout.addLayout(shape_layout)
         
+        kernel_layout = QHBoxLayout()
+        kernel_layout.addWidget(QLabel('Scaling:'))
+        self.kernel_combo = QComboBox()
+        self.kernel_combo.addItems(['Nearest', 'Bilinear', 'Pixel art'])
+        self.kernel_combo.setToolTip('Software renderer only; the Magnification API scales on its own')
+        self.kernel_combo.currentIndexChanged.connect(self.on_lens_edited)
+        kernel_layout.addWidget(self.kernel_combo)
+        settings_layout.addLayout(kernel_layout)
+        
+        self.skip_static_check = QCheckBox('Skip unchanged frames')
+        self.skip_static_check.setChecked(self.skip_static)
+        self.skip_static_check.setToolTip('Software renderer only: re-render just the tiles whose source changed')
+        self.skip_static_check.toggled.connect(self.apply_settings)
+        settings_layout.addWidget(self.skip_static_check)
+        
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel('Budget:'))
+        self.frame_budget_input = QDoubleSpinBox()
+        self.frame_budget_input.setRange(0.0, 50.0)
+        self.frame_budget_input.setSingleStep(0.5)
+        self.frame_budget_input.setSuffix(' ms')
+        self.frame_budget_input.setSpecialValueText('no ms limit')
+        self.frame_budget_input.setValue(self.frame_budget_ms)
+        budget_layout.addWidget(self.frame_budget_input)
+        self.cpu_budget_input = QSpinBox()
+        self.cpu_budget_input.setRange(0, 100)
+        self.cpu_budget_input.setSingleStep(5)
+        self.cpu_budget_input.setSuffix(' % CPU')
+        self.cpu_budget_input.setSpecialValueText('no CPU limit')
+        self.cpu_budget_input.setValue(self.cpu_budget_percent)
+        budget_layout.addWidget(self.cpu_budget_input)
+        for budget_input in (self.frame_budget_input, self.cpu_budget_input):
+            budget_input.setButtonSymbols(QSpinBox.PlusMinus)
+            budget_input.setToolTip(BUDGET_TOOLTIP)
+            budget_input.valueChanged.connect(self.apply_settings)
+        settings_layout.addLayout(budget_layout)
+        
+        self.engine_process_check = QCheckBox('Run engine in a separate process')
+        self.engine_process_check.setChecked(self.engine_process)
+        self.engine_process_check.setToolTip('Keeps the frame loop away from GUI stalls and restarts the engine if it crashes')
+        self.engine_process_check.toggled.connect(self.on_engine_process_changed)
+        settings_layout.addWidget(self.engine_process_check)
+        
+        self.control_check = QCheckBox('Allow external control (stream decks, scripts)')
+        self.control_check.setChecked(self.control_enabled)
+        self.control_check.setToolTip('Local socket for control_client.py: zoom, lens size, shape, fps and start/stop')
+        self.control_check.toggled.connect(self.on_control_toggled)
+        settings_layout.addWidget(self.control_check)
+        
         settings_group.setLayout(settings_layout)
         content_layout.addWidget(settings_group)
+        self.refresh_lens_list()
+        
+        self.filters_group = QGroupBox("Post-processing")
+        self.filters_group.setCheckable(True)
+        self.filters_group.setChecked(self.filters_enabled)
+        self.filters_group.setToolTip('Software renderer only; applied to every lens after scaling')
+        self.filters_group.toggled.connect(self.on_filters_toggled)
+        filters_layout = QVBoxLayout(self.filters_group)
+        self.filters_body = QWidget()
+        body_layout = QVBoxLayout(self.filters_body)
+        body_layout.setContentsMargins(0, 0, 0, 0)
+        
+        tone_layout = QHBoxLayout()
+        tone_layout.addWidget(QLabel('Sharpen:'))
+        self.sharpen_input = QDoubleSpinBox()
+        self.sharpen_input.setRange(0.0, 2.0)
+        self.sharpen_input.setValue(self.sharpen)
+        tone_layout.addWidget(self.sharpen_input)
+        tone_layout.addWidget(QLabel('Contrast:'))
+        self.contrast_input = QDoubleSpinBox()
+        self.contrast_input.setRange(0.5, 2.0)
+        self.contrast_input.setValue(self.contrast)
+        tone_layout.addWidget(self.contrast_input)
+        body_layout.addLayout(tone_layout)
+        
+        color_layout = QHBoxLayout()
+        color_layout.addWidget(QLabel('Gamma:'))
+        self.gamma_input = QDoubleSpinBox()
+        self.gamma_input.setRange(0.5, 2.5)
+        self.gamma_input.setValue(self.gamma)
+        color_layout.addWidget(self.gamma_input)
+        color_layout.addWidget(QLabel('Colour:'))
+        self.color_combo = QComboBox()
+        self.color_combo.addItems(['None', 'Protanopia', 'Deuteranopia', 'Tritanopia'])
+        self.color_combo.setCurrentIndex(COLOR_FILTERS.index(self.color_filter))
+        self.color_combo.setToolTip('Daltonize for a colour-vision deficiency')
+        self.color_combo.currentIndexChanged.connect(self.apply_settings)
+        color_layout.addWidget(self.color_combo)
+        body_layout.addLayout(color_layout)
+        
+        for filter_input in (self.sharpen_input, self.contrast_input, self.gamma_input):
+            filter_input.setSingleStep(0.1)
+            filter_input.setButtonSymbols(QSpinBox.PlusMinus)
+            filter_input.valueChanged.connect(self.apply_settings)
+        filters_layout.addWidget(self.filters_body)
+        self.filters_body.setVisible(self.filters_enabled)
+        content_layout.addWidget(self.filters_group)
         
         hotkeys_group = QGroupBox("Hotkeys")
         hotkeys_layout = QVBoxLayout()
@@ -440,6 +768,19 @@ class ScopeZGUI(QWidget):
         zoom_out_layout.addWidget(self.zoom_out_btn)
         hotkeys_layout.addLayout(zoom_out_layout)
         
+        zoom_anim_layout = QHBoxLayout()
+        zoom_anim_layout.addWidget(QLabel('Zoom Smoothing:'))
+        self.zoom_anim_input = QSpinBox()
+        self.zoom_anim_input.setRange(0, 1000)
+        self.zoom_anim_input.setSingleStep(20)
+        self.zoom_anim_input.setSuffix(' ms')
+        self.zoom_anim_input.setValue(self.zoom_animation_ms)
+        self.zoom_anim_input.setButtonSymbols(QSpinBox.PlusMinus)
+        self.zoom_anim_input.setToolTip('How long a hotkey or wheel zoom takes to ease in; 0 jumps straight there')
+        self.zoom_anim_input.valueChanged.connect(self.apply_settings)
+        zoom_anim_layout.addWidget(self.zoom_anim_input)
+        hotkeys_layout.addLayout(zoom_anim_layout)
+        
         hotkeys_group.setLayout(hotkeys_layout)
         content_layout.addWidget(hotkeys_group)
         
@@ -453,8 +794,24 @@ class ScopeZGUI(QWidget):
         self.status.setStyleSheet("color: #14a085; font-size: 11pt;")
         content_layout.addWidget(self.status)
         
-        layout.addWidget(content)
+        self.stats_btn = QPushButton('▸ Performance')
+        self.stats_btn.setCheckable(True)
+        self.stats_btn.setStyleSheet("QPushButton { background: transparent; color: #14a085; text-align: left; padding: 2px; } QPushButton:hover { background: #2d2d2d; }")
+        self.stats_btn.toggled.connect(self.toggle_stats_panel)
+        content_layout.addWidget(self.stats_btn)
+        # Built on first use; most sessions never open it
+        self.stats_panel = None
+        self.content_layout = content_layout
+        self.content = content
+        
+        # The window fits its content up to the screen height and scrolls past that
+        scroll = QScrollArea()
+        scroll.setWidget(content)
+        scroll.setWidgetResizable(True)
+        scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        layout.addWidget(scroll)
         self.setLayout(layout)
+        self.update_window_size()
         
         self.drag_pos = None
         title_bar.mousePressEvent = self.title_bar_mouse_press
@@ -468,88 +825,307 @@ class ScopeZGUI(QWidget):
         if event.buttons() == Qt.LeftButton and self.drag_pos:
             self.move(event.globalPosition().toPoint() - self.drag_pos)
             
+    def lens_label(self, index):
+        lens = self.lenses[index]
+        shape = 'circle' if lens['lens_shape'] == 0 else 'rectangle'
+        label = f"Lens {index + 1}: {lens['lens_size']}px, {lens['zoom_factor']:.1f}x, {shape}"
+        return label + ' (main)' if index == 0 else label
+    
+    def refresh_lens_list(self):
+        self.lens_list.blockSignals(True)
+        self.lens_list.clear()
+        self.lens_list.addItems([self.lens_label(i) for i in range(len(self.lenses))])
+        self.lens_list.setCurrentRow(self.selected_lens)
+        self.lens_list.blockSignals(False)
+        self.add_lens_btn.setEnabled(len(self.lenses) < MAX_LENSES)
+        self.load_lens_editor()
+        
+    def load_lens_editor(self):
+        lens = self.lenses[self.selected_lens]
+        editors = (self.lens_input, self.zoom_input, self.offset_x_input, self.offset_y_input, self.shape_combo, self.kernel_combo)
+        for widget in editors:
+            widget.blockSignals(True)
+        self.lens_input.setValue(lens['lens_size'])
+        self.zoom_input.setValue(lens['zoom_factor'])
+        self.offset_x_input.setValue(lens['offset_x'])
+        self.offset_y_input.setValue(lens['offset_y'])
+        self.shape_combo.setCurrentIndex(lens['lens_shape'])
+        self.kernel_combo.setCurrentIndex(RESAMPLE_KERNELS.index(lens['resample_kernel']))
+        for widget in editors:
+            widget.blockSignals(False)
+        # The main lens is the scope itself and the only one the DLL engine draws
+        self.offset_x_input.setEnabled(self.selected_lens != 0)
+        self.offset_y_input.setEnabled(self.selected_lens != 0)
+        self.remove_lens_btn.setEnabled(self.selected_lens != 0)
+        
+    def on_lens_selected(self, row):
+        if row >= 0:
+            self.selected_lens = row
+            self.load_lens_editor()
+            
+    def on_lens_edited(self):
+        self.lenses[self.selected_lens].update({
+            'lens_size': self.lens_input.value(),
+            'zoom_factor': self.zoom_input.value(),
+            'lens_shape': self.shape_combo.currentIndex(),
+            'resample_kernel': RESAMPLE_KERNELS[self.kernel_combo.currentIndex()],
+            'offset_x': self.offset_x_input.value() if self.selected_lens else 0,
+            'offset_y': self.offset_y_input.value() if self.selected_lens else 0
+        })
+        self.lens_list.item(self.selected_lens).setText(self.lens_label(self.selected_lens))
+        self.apply_settings()
+        
+    def add_lens(self):
+        if len(self.lenses) >= MAX_LENSES:
+            return
+        # A small high-zoom picture-in-picture lens beside the main one
+        main = self.lenses[0]
+        self.lenses.append(default_lens(lens_size=200, zoom_factor=min(10.0, main['zoom_factor'] * 2),
+                                        offset_x=main['lens_size'] // 2 + 150 * len(self.lenses)))
+        self.selected_lens = len(self.lenses) - 1
+        self.refresh_lens_list()
+        self.apply_settings()
+        
+    def remove_lens(self):
+        if self.selected_lens == 0:
+            return
+        del self.lenses[self.selected_lens]
+        self.selected_lens = min(self.selected_lens, len(self.lenses) - 1)
+        self.refresh_lens_list()
+        self.apply_settings()
+            
+    def on_filters_toggled(self, checked):
+        self.filters_body.setVisible(checked)
+        self.update_window_size()
+        self.apply_settings()
+        
+    def update_window_size(self):
+        height = self.title_bar_height + self.content.sizeHint().height()
+        screen = self.screen()
+        if screen is not None:
+            height = min(height, screen.availableGeometry().height())
+        self.setFixedSize(400, height)
+            
+    def update_track_inputs(self):
+        mode = TRACK_MODES[self.track_combo.currentIndex()]
+        self.track_monitor_input.setVisible(mode == 'monitor')
+        self.track_x_input.setVisible(mode == 'point')
+        self.track_y_input.setVisible(mode == 'point')
+        
+    def on_track_mode_changed(self):
+        self.update_track_inputs()
+        self.apply_settings()
+            
     def on_fps_changed(self):
         fps = self.fps_values[self.fps_slider.value()]
         self.fps_label.setText(str(fps))
         self.apply_settings()
             
+    def current_settings(self):
+        main = self.lenses[0]
+        return {
+            "lens_size": main['lens_size'],
+            "zoom_factor": main['zoom_factor'],
+            "key_platform": KEY_PLATFORM,
+            "toggle_key": self.toggle_btn.key_code,
+            "toggle_modifiers": self.toggle_btn.modifiers,
+            "zoom_in_key": self.zoom_in_btn.key_code,
+            "zoom_in_modifiers": self.zoom_in_btn.modifiers,
+            "zoom_out_key": self.zoom_out_btn.key_code,
+            "zoom_out_modifiers": self.zoom_out_btn.modifiers,
+            "lens_shape": main['lens_shape'],
+            "fps": self.fps_values[self.fps_slider.value()],
+            "zoom_animation_ms": self.zoom_anim_input.value(),
+            "track_mode": TRACK_MODES[self.track_combo.currentIndex()],
+            "track_monitor": self.track_monitor_input.value() - 1,
+            "track_x": self.track_x_input.value(),
+            "track_y": self.track_y_input.value(),
+            "resample_kernel": main['resample_kernel'],
+            "skip_static": self.skip_static_check.isChecked(),
+            "engine_process": self.engine_process_check.isChecked(),
+            "control_server": self.control_check.isChecked(),
+            "trace_session": self.trace_session,
+            "frame_budget_ms": round(self.frame_budget_input.value(), 2),
+            "cpu_budget_percent": self.cpu_budget_input.value(),
+            "filters_enabled": self.filters_group.isChecked(),
+            "sharpen": round(self.sharpen_input.value(), 2),
+            "contrast": round(self.contrast_input.value(), 2),
+            "gamma": round(self.gamma_input.value(), 2),
+            "color_filter": COLOR_FILTERS[self.color_combo.currentIndex()],
+            "extra_lenses": [dict(lens) for lens in self.lenses[1:]],
+            "hotkeys": self.extra_hotkeys
+        }
+            
     def apply_settings(self):
-        if self.running and self.dll:
+        self.save_config()
+        settings = self.current_settings()
+        with self.control_lock:
+            self.control_settings = settings
+            if self.running and self.backend:
+                self.backend.update(settings)
+        if self.control_server:
+            self.control_server.publish(self.control_state())
+            
+    def on_control_toggled(self, checked):
+        self.save_config()
+        if checked:
+            self.start_control_server()
+        elif self.control_server:
+            self.control_server.close()
+            self.control_server = None
+            
+    def start_control_server(self):
+        from control_server import ControlServer
+        try:
+            self.control_server = ControlServer(self.control_state, self.control_apply)
+            self.control_server.start()
+        except OSError as e:
+            self.control_server = None
+            self.status.setText(f'✖ External control: {e}')
+            self.status.setStyleSheet("color: #f44336; font-size: 9pt;")
+            
+    def control_state(self):
+        # Called from control connection threads as well as the GUI thread
+        with self.control_lock:
+            settings = self.control_settings
+            visible = self.running
+        return {
+            'zoom': settings['zoom_factor'],
+            'lens_size': settings['lens_size'],
+            'shape': SHAPES[settings['lens_shape']],
+            'visible': int(visible),
+            'fps': settings['fps']
+        }
+        
+    def control_apply(self, changes):
+        # Runs on a control connection thread. Every change in one command
+        # goes into a single backend snapshot, so they land on the same frame;
+        # the widgets and config catch up on the GUI thread.
+        names = {'zoom': 'zoom_factor', 'lens_size': 'lens_size', 'fps': 'fps'}
+        updates = {names[key]: value for key, value in changes.items() if key in names}
+        if 'shape' in changes:
+            updates['lens_shape'] = SHAPES.index(changes['shape'])
+        with self.control_lock:
+            settings = dict(self.control_settings, **updates)
+            self.control_settings = settings
+            if updates and self.running and self.backend:
+                self.backend.update(settings)
+        done = threading.Event()
+        self.control_changed.emit((updates, changes.get('visible')), done)
+        if 'visible' in changes:
+            # START can take a moment; answer with the state it ends in
+            done.wait(2.0)
+        return self.control_state()
+        
+    def on_control_changed(self, change, done):
+        updates, visible = change
+        if updates:
+            main = self.lenses[0]
+            main.update({key: value for key, value in updates.items() if key != 'fps'})
+            if 'fps' in updates:
+                self.fps_slider.blockSignals(True)
+                self.fps_slider.setValue(self.fps_values.index(updates['fps']))
+                self.fps_slider.blockSignals(False)
+                self.fps_label.setText(str(updates['fps']))
+            self.lens_list.item(0).setText(self.lens_label(0))
+            if self.selected_lens == 0:
+                self.load_lens_editor()
             self.save_config()
-            self.dll.UpdateSettings(
-                self.lens_input.value(),
-                ctypes.c_float(self.zoom_input.value()),
-                self.shape_combo.currentIndex(),
-                0,
-                0,
-                0,
-                0,
-                0,
-                self.fps_values[self.fps_slider.value()]
-            )
+        if visible is not None and bool(visible) != self.running:
+            self.toggle()
+        done.set()
+            
+    def create_backend(self):
+        if self.engine_process_check.isChecked():
+            from engine_worker import ProcessBackend
+            if self.lens_overlay is None:
+                self.lens_overlay = LensOverlaySet()
+            kind = 'x11' if sys.platform.startswith('linux') else 'dll'
+            return ProcessBackend(kind, self.script_dir / 'scope_z.dll', self.lens_overlay.present)
+        if sys.platform.startswith('linux'):
+            from x11_backend import X11Backend
+            return X11Backend()
+        try:
+            return DllBackend(self.script_dir / 'scope_z.dll')
+        except OSError as dll_error:
+            try:
+                capture = GdiCapture()
+            except OSError:
+                raise dll_error
+            if self.lens_overlay is None:
+                self.lens_overlay = LensOverlaySet()
+            return SoftwareBackend(capture, self.lens_overlay.present)
         
+    def ensure_backend(self):
+        if self.backend is None:
+            self.backend = self.create_backend()
+            self.backend.set_state_callback(self.engine_state_changed.emit)
+        return self.backend
+        
+    def update_budget_inputs(self, governed):
+        # The DLL engine has no quality governor, so a budget would be ignored
+        for budget_input in (self.frame_budget_input, self.cpu_budget_input):
+            budget_input.setEnabled(governed)
+            budget_input.setToolTip(BUDGET_TOOLTIP if governed else 'Not available with the DLL engine, which has no quality governor')
+        
+    def prewarm_engine(self):
+        try:
+            self.ensure_backend()
+        except Exception:
+            # START creates it again and reports the error
+            self.backend = None
+            
+    def on_engine_process_changed(self):
+        self.apply_settings()
+        if self.running:
+            self.toggle()
+        if self.backend:
+            self.backend.shutdown()
+            self.backend = None
+        if self.engine_process_check.isChecked():
+            self.prewarm_engine()
+            
     def toggle(self):
         if not self.running:
             try:
                 self.save_config()
-                self.dll = ctypes.CDLL(str(self.script_dir / 'scope_z.dll'))
-                self.dll.StartMagnifier.argtypes = [ctypes.c_int, ctypes.c_float, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
-                self.dll.UpdateSettings.argtypes = [ctypes.c_int, ctypes.c_float, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
-                self.dll.GetCurrentZoom.argtypes = []
-                self.dll.GetCurrentZoom.restype = ctypes.c_float
-                self.dll.StartMagnifier(
-                    self.lens_input.value(),
-                    ctypes.c_float(self.zoom_input.value()),
-                    self.toggle_btn.key_code,
-                    self.zoom_in_btn.key_code,
-                    1 if self.zoom_in_btn.modifiers['ctrl'] else 0,
-                    1 if self.zoom_in_btn.modifiers['shift'] else 0,
-                    1 if self.zoom_in_btn.modifiers['alt'] else 0,
-                    self.zoom_out_btn.key_code,
-                    1 if self.zoom_out_btn.modifiers['ctrl'] else 0,
-                    1 if self.zoom_out_btn.modifiers['shift'] else 0,
-                    1 if self.zoom_out_btn.modifiers['alt'] else 0,
-                    self.shape_combo.currentIndex(),
-                    0,
-                    0,
-                    0,
-                    0,
-                    0,
-                    self.fps_values[self.fps_slider.value()]
-                )
+                if self.preload_thread:
+                    # START during the background load waits for it instead of loading twice
+                    self.preload_thread.join()
+                self.ensure_backend()
+                if self.lens_overlay:
+                    self.lens_overlay.set_suspended(False)
+                self.backend.start(self.current_settings())
+                self.update_budget_inputs(self.backend.governed)
                 self.running = True
                 self.launch_btn.setText('■ STOP')
                 self.launch_btn.setStyleSheet("background: #d32f2f;")
                 self.status.setText('● Running')
                 self.status.setStyleSheet("color: #4caf50; font-size: 11pt;")
-                self.zoom_timer.start()
+                if self.control_server:
+                    self.control_server.publish(self.control_state())
             except Exception as e:
                 self.status.setText(f'✖ {str(e)}')
                 self.status.setStyleSheet("color: #f44336; font-size: 9pt;")
         else:
-            if self.dll:
-                self.dll.StopMagnifier()
-            self.running = False
-            self.launch_btn.setText('▶ START')
-            self.launch_btn.setStyleSheet("")
+            if self.backend:
+                self.backend.stop()
+            self.set_stopped()
             self.status.setText('● Stopped')
             self.status.setStyleSheet("color: #ff9800; font-size: 11pt;")
-            self.zoom_timer.stop()
+            
+    def set_stopped(self):
+        if self.lens_overlay:
+            self.lens_overlay.set_suspended(True)
+        self.running = False
+        self.launch_btn.setText('▶ START')
+        self.launch_btn.setStyleSheet("")
+        if self.control_server:
+            self.control_server.publish(self.control_state())
             
     def setup_tray(self):
-        icon_paths = [
-            self.script_dir / 'Scope Z ico.png',
-            Path(sys.executable).parent / 'Scope Z ico.png',
-            Path('./Scope Z ico.png')
-        ]
-        icon_path = None
-        for path in icon_paths:
-            if path.exists():
-                icon_path = path
-                break
-        
-        if icon_path:
-            self.tray = QSystemTrayIcon(QIcon(str(icon_path)), self)
+        if self.icon_path:
+            self.tray = QSystemTrayIcon(QIcon(str(self.icon_path)), self)
         else:
             pixmap = QPixmap(16, 16)
             pixmap.fill(QColor('#0d7377'))
@@ -570,34 +1146,150 @@ class ScopeZGUI(QWidget):
             self.show()
             
     def quit_app(self):
-        if self.running and self.dll:
-            self.dll.StopMagnifier()
+        if self.control_server:
+            self.control_server.close()
+        if self.backend:
+            self.backend.shutdown()
+        self.config.close()
         QApplication.quit()
         
-    def setup_zoom_sync(self):
-        self.zoom_timer = QTimer()
-        self.zoom_timer.timeout.connect(self.sync_zoom)
-        self.zoom_timer.setInterval(50)
+    def build_stats_panel(self):
+        self.stats_panel = QWidget()
+        stats_layout = QVBoxLayout(self.stats_panel)
+        stats_layout.setContentsMargins(0, 0, 0, 0)
+        self.stats_label = QLabel('Not running')
+        self.stats_label.setStyleSheet("color: #cccccc; font-family: Consolas; font-size: 9pt;")
+        stats_layout.addWidget(self.stats_label)
+        stats_buttons = QHBoxLayout()
+        trace_check = QCheckBox('Record trace')
+        trace_check.setChecked(self.trace_session)
+        trace_check.setToolTip('Native engine only: appends frame and input timing to scope_z_trace.bin; open it with trace_analyzer.py')
+        trace_check.toggled.connect(self.on_trace_toggled)
+        stats_buttons.addWidget(trace_check)
+        export_btn = QPushButton('Export JSON')
+        export_btn.clicked.connect(self.export_stats)
+        stats_buttons.addWidget(export_btn)
+        stats_layout.addLayout(stats_buttons)
+        self.content_layout.addWidget(self.stats_panel)
         
-    def sync_zoom(self):
-        if self.running and self.dll:
-            try:
-                current_zoom = self.dll.GetCurrentZoom()
-                if abs(current_zoom - self.zoom_input.value()) > 0.01:
-                    self.zoom_input.blockSignals(True)
-                    self.zoom_input.setValue(current_zoom)
-                    self.zoom_input.blockSignals(False)
-            except:
-                pass
+        self.stats_timer = QTimer()
+        self.stats_timer.setInterval(500)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+        
+    def toggle_stats_panel(self, checked):
+        if self.stats_panel is None:
+            self.build_stats_panel()
+        self.stats_panel.setVisible(checked)
+        self.stats_btn.setText('▾ Performance' if checked else '▸ Performance')
+        self.update_window_size()
+        if checked:
+            self.refresh_stats()
+            self.stats_timer.start()
+        else:
+            self.stats_timer.stop()
+            
+    def on_trace_toggled(self, checked):
+        self.trace_session = checked
+        self.apply_settings()
+        
+    def refresh_stats(self):
+        if not (self.running and self.backend):
+            self.stats_label.setText('Not running')
+            return
+        stats = self.backend.get_stats()
+        lines = [
+            f"Frames       {stats.get('frames_rendered', 0)} @ {stats.get('target_fps', 0)} fps",
+            f"Frame ms     p50 {stats.get('frame_ms_p50', 0):.3f}  p99 {stats.get('frame_ms_p99', 0):.3f}  max {stats.get('frame_ms_max', 0):.3f}",
+            f"Hook ms      p50 {stats.get('hook_ms_p50', 0):.3f}  p99 {stats.get('hook_ms_p99', 0):.3f}  ({stats.get('hook_events', 0)} events)",
+            f"Deadlines    {stats.get('late_frames', 0)} late, {stats.get('missed_deadlines', 0)} missed",
+            f"Syscalls     {stats.get('syscalls_per_frame', 0):.2f} / frame (last {stats.get('last_frame_syscalls', 0)})"
+        ]
+        if 'governor_status' in stats:
+            lines.append(f"Governor     {stats['governor_status']} (load {stats['governor_load']:.0%}, {stats['governor_changes']} changes)")
+        if 'zoom_animations' in stats:
+            lines.append(f"Zoom anims   {stats['zoom_animations']}")
+        if 'trace_file' in stats:
+            lines.append(f"Trace        {Path(stats['trace_file']).name}")
+        if 'worker' in stats:
+            lines.append(f"Worker       {stats['worker']}, {stats['worker_restarts']} restarts")
+        for i, lens in enumerate(stats.get('lenses', [])):
+            line = f"Lens {i + 1}       {lens['render_ms_p50']:.2f}/{lens['render_ms_p99']:.2f} ms"
+            if 'tile_render_ratio' in lens:
+                line += f"  {lens['tile_frames_skipped']} skipped, {lens['tile_render_ratio']:.0%} redrawn"
+            lines.append(line)
+        if 'filter_sharpen_ms_p50' in stats or 'filter_color_ms_p50' in stats:
+            lines.append(f"Filters ms   sharpen {stats.get('filter_sharpen_ms_p50', 0):.2f}  colour {stats.get('filter_color_ms_p50', 0):.2f}")
+        if 'capture_ms_p50' in stats:
+            lines.append(f"Capture ms   p50 {stats['capture_ms_p50']:.3f}  p99 {stats['capture_ms_p99']:.3f}")
+            lines.append(f"Present ms   p50 {stats['present_ms_p50']:.3f}  p99 {stats['present_ms_p99']:.3f}")
+        self.stats_label.setText('\n'.join(lines))
+        
+    def export_stats(self):
+        if not (self.running and self.backend):
+            return
+        stats = dict(self.backend.get_stats(), backend=self.backend.name)
+        path = self.script_dir / 'scope_z_stats.json'
+        try:
+            with open(path, 'w') as f:
+                json.dump(stats, f, indent=2)
+            self.status.setText(f'● Stats saved to {path.name}')
+        except OSError as e:
+            self.status.setText(f'✖ {e}')
+            
+    def on_engine_state(self):
+        if not (self.running and self.backend):
+            return
+        state = self.backend.get_state()
+        if state.get('error_code') and not state['running']:
+            self.set_stopped()
+            self.status.setText(f"✖ {state['error']}")
+            self.status.setStyleSheet("color: #f44336; font-size: 9pt;")
+            return
+        if not state.get('running'):
+            return
+        # Hotkeys act on the main lens only
+        main = self.lenses[0]
+        if (abs(state['zoom'] - main['zoom_factor']) > 0.01 or state['lens_size'] != main['lens_size'] or
+                state['lens_shape'] != main['lens_shape']):
+            main.update(zoom_factor=round(state['zoom'], 2), lens_size=state['lens_size'], lens_shape=state['lens_shape'])
+            self.lens_list.item(0).setText(self.lens_label(0))
+            if self.selected_lens == 0:
+                self.load_lens_editor()
+            with self.control_lock:
+                self.control_settings = dict(self.control_settings, zoom_factor=main['zoom_factor'],
+                                             lens_size=main['lens_size'], lens_shape=main['lens_shape'])
+            if self.control_server:
+                self.control_server.publish(self.control_state())
+        self.save_config()
+        status = '● Running' if state['visible'] else '● Running (hidden)'
+        level = state.get('quality_level')
+        if level:
+            # The governor stepped quality down to stay within the budget; a
+            # worker's stats can trail its state by one stats interval
+            stats = self.backend.get_stats()
+            status += f" · {stats['governor_status'] if stats.get('governor_level') == level else f'quality level {level}'}"
+        if state.get('error_code'):
+            # A warning, such as hooks that failed to install: the lens keeps running
+            self.status.setText(f"⚠ {state['error']}")
+            self.status.setStyleSheet("color: #ff9800; font-size: 9pt;")
+            return
+        self.status.setText(status)
+        self.status.setStyleSheet("color: #4caf50; font-size: 11pt;")
                 
     def closeEvent(self, event):
-        if hasattr(self, 'zoom_timer'):
-            self.zoom_timer.stop()
         event.ignore()
         self.hide()
 
 if __name__ == '__main__':
+    # The engine worker is a spawned process; frozen builds route it here
+    multiprocessing.freeze_support()
+    profiler = StartupProfiler('--profile-startup' in sys.argv)
+    profiler.mark('imports')
+    if sys.platform.startswith('linux'):
+        init_xlib_threads()
     app = QApplication(sys.argv)
-    gui = ScopeZGUI()
+    profiler.mark('QApplication')
+    gui = ScopeZGUI(profiler)
     gui.show()
+    profiler.mark('show')
     sys.exit(app.exec()) 
@@ -0,0 +1,587 @@
+import ctypes
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from config_store import HOTKEY_ACTIONS, TRACK_MODES
+
+
+class ScopeZStats(ctypes.Structure):
+    # Mirrors struct ScopeZStats in stats.h
+    _fields_ = [
+        ('version', ctypes.c_uint),
+        ('size', ctypes.c_uint),
+        ('frames_rendered', ctypes.c_ulonglong),
+        ('frame_ms_p50', ctypes.c_double),
+        ('frame_ms_p95', ctypes.c_double),
+        ('frame_ms_p99', ctypes.c_double),
+        ('frame_ms_max', ctypes.c_double),
+        ('hook_events', ctypes.c_ulonglong),
+        ('hook_ms_p50', ctypes.c_double),
+        ('hook_ms_p95', ctypes.c_double),
+        ('hook_ms_p99', ctypes.c_double),
+        ('late_frames', ctypes.c_ulonglong),
+        ('missed_deadlines', ctypes.c_ulonglong),
+        ('max_lateness_ms', ctypes.c_double),
+        ('syscalls_per_frame', ctypes.c_double),
+        ('last_frame_syscalls', ctypes.c_uint),
+        ('target_fps', ctypes.c_int),
+        ('settings_updates', ctypes.c_ulonglong),
+        ('settings_applied', ctypes.c_ulonglong),
+        ('zoom_animations', ctypes.c_ulonglong)
+    ]
+
+
+class ScopeZState(ctypes.Structure):
+    # Mirrors struct ScopeZState in engine_state.h
+    _fields_ = [
+        ('seq', ctypes.c_uint),
+        ('zoom', ctypes.c_float),
+        ('lens_size', ctypes.c_int),
+        ('lens_shape', ctypes.c_int),
+        ('visible', ctypes.c_int),
+        ('running', ctypes.c_int),
+        ('error_code', ctypes.c_int),
+        ('error', ctypes.c_char * 116)
+    ]
+
+
+STATE_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_uint)
+
+ENGINE_ERR_RENDER = 6
+
+# Session trace written next to the DLL; read it with trace_analyzer.py
+TRACE_FILE = 'scope_z_trace.bin'
+TRACE_MAX_BYTES = 64 << 20
+
+
+def read_state_block(block):
+    # Seqlock read: retry while the writer holds an odd seq or bumped it meanwhile
+    while True:
+        seq = block.seq
+        if seq & 1:
+            time.sleep(0)
+            continue
+        state = {
+            'seq': seq,
+            'zoom': block.zoom,
+            'lens_size': block.lens_size,
+            'lens_shape': block.lens_shape,
+            'visible': block.visible,
+            'running': block.running,
+            'error_code': block.error_code,
+            'error': block.error.decode(errors='replace')
+        }
+        if block.seq == seq:
+            return state
+
+
+def write_state_block(block, state):
+    block.seq += 1
+    block.zoom = state['zoom']
+    block.lens_size = state['lens_size']
+    block.lens_shape = state['lens_shape']
+    block.visible = state['visible']
+    block.running = state['running']
+    block.error_code = state['error_code']
+    block.error = state['error'].encode(errors='replace')[:type(block).error.size - 1]
+    block.seq += 1
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+class MagnifierBackend:
+    name = 'backend'
+    state_callback = None
+    # Whether the quality governor keeps this backend within frame_budget_ms and cpu_budget_percent
+    governed = False
+
+    def set_state_callback(self, callback):
+        self.state_callback = callback
+
+    def get_state(self):
+        return {}
+
+    def get_stats(self):
+        return {}
+
+    def start(self, settings):
+        raise NotImplementedError
+
+    def update(self, settings):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def shutdown(self, timeout=1.0):
+        self.stop()
+        return True
+
+    def get_zoom(self):
+        raise NotImplementedError
+
+
+def _flag(modifiers, key):
+    return 1 if modifiers.get(key) else 0
+
+
+_loaded_dlls = {}
+
+
+def load_engine_dll(path):
+    # The engine keeps its thread, windows and Magnification state alive between
+    # start and stop, so the DLL is loaded and declared once per process.
+    path = str(path)
+    if path in _loaded_dlls:
+        return _loaded_dlls[path]
+    dll = ctypes.CDLL(path)
+    dll.StartMagnifier.argtypes = [ctypes.c_int, ctypes.c_float] + [ctypes.c_int] * 16
+    dll.StartMagnifier.restype = ctypes.c_int
+    dll.UpdateSettings.argtypes = [ctypes.c_int, ctypes.c_float] + [ctypes.c_int] * 7
+    dll.StopMagnifier.argtypes = []
+    dll.StopMagnifier.restype = ctypes.c_int
+    dll.ShutdownMagnifier.argtypes = [ctypes.c_int]
+    dll.ShutdownMagnifier.restype = ctypes.c_int
+    dll.ClearHotkeys.argtypes = []
+    dll.AddHotkey.argtypes = [ctypes.c_int] * 5 + [ctypes.c_float]
+    dll.SetZoomAnimation.argtypes = [ctypes.c_int]
+    dll.SetSourceTracking.argtypes = [ctypes.c_int] * 3
+    dll.GetCurrentZoom.argtypes = []
+    dll.GetCurrentZoom.restype = ctypes.c_float
+    dll.GetStats.argtypes = [ctypes.POINTER(ScopeZStats)]
+    dll.GetStats.restype = None
+    dll.GetStateBlock.argtypes = []
+    dll.GetStateBlock.restype = ctypes.POINTER(ScopeZState)
+    dll.SetStateCallback.argtypes = [STATE_CALLBACK]
+    dll.StartTrace.argtypes = [ctypes.c_char_p, ctypes.c_int]
+    dll.StartTrace.restype = ctypes.c_int
+    dll.StopTrace.argtypes = []
+    dll.StopTrace.restype = ctypes.c_ulonglong
+    _loaded_dlls[path] = dll
+    return dll
+
+
+def preload_engine(dll_path):
+    # Loads and binds what create_backend will need, so it can run off the
+    # GUI thread before START. Raises what the real backend would raise.
+    if sys.platform.startswith('linux'):
+        from x11_backend import load_xlib
+        load_xlib()
+        return 'x11'
+    try:
+        load_engine_dll(dll_path)
+        return 'dll'
+    except OSError:
+        # The GDI fallback: NumPy and the software renderer
+        import multi_lens
+        return 'software'
+
+
+class DllBackend(MagnifierBackend):
+    name = 'dll'
+
+    def __init__(self, path):
+        self.dll = load_engine_dll(path)
+        self.stats = ScopeZStats()
+        self.state_block = self.dll.GetStateBlock().contents
+        self.native_callback = None
+        self.trace_path = os.path.join(os.path.dirname(os.path.abspath(str(path))), TRACE_FILE)
+        self.tracing = False
+
+    def set_state_callback(self, callback):
+        # The engine calls this from its own thread at frame boundaries only;
+        # keep a reference so ctypes does not free the trampoline.
+        self.state_callback = callback
+        self.native_callback = STATE_CALLBACK(lambda seq: callback()) if callback else STATE_CALLBACK()
+        self.dll.SetStateCallback(self.native_callback)
+
+    def get_state(self):
+        return read_state_block(self.state_block)
+
+    def set_hotkeys(self, hotkeys):
+        self.dll.ClearHotkeys()
+        for hotkey in hotkeys:
+            modifiers = hotkey.get('modifiers', {})
+            self.dll.AddHotkey(
+                hotkey['key'],
+                _flag(modifiers, 'ctrl'),
+                _flag(modifiers, 'shift'),
+                _flag(modifiers, 'alt'),
+                HOTKEY_ACTIONS[hotkey['action']],
+                ctypes.c_float(hotkey.get('param', 0.0))
+            )
+
+    def set_tracing(self, enabled):
+        # Kept across stop and start, so one file covers the whole session
+        if enabled == self.tracing:
+            return
+        if enabled:
+            # A file that cannot be opened leaves tracing off; the next update tries again
+            self.tracing = bool(self.dll.StartTrace(os.fsencode(self.trace_path), TRACE_MAX_BYTES))
+        else:
+            self.dll.StopTrace()
+            self.tracing = False
+
+    def set_tracking(self, settings):
+        mode = settings.get('track_mode', 'monitor')
+        if mode == 'monitor':
+            self.dll.SetSourceTracking(0, settings.get('track_monitor', 0), 0)
+        else:
+            self.dll.SetSourceTracking(TRACK_MODES.index(mode), settings.get('track_x', 0), settings.get('track_y', 0))
+
+    def start(self, settings):
+        self.set_hotkeys(settings.get('hotkeys', []))
+        self.dll.SetZoomAnimation(settings.get('zoom_animation_ms', 120))
+        self.set_tracking(settings)
+        self.set_tracing(settings.get('trace_session', False))
+        zoom_in = settings['zoom_in_modifiers']
+        zoom_out = settings['zoom_out_modifiers']
+        started = self.dll.StartMagnifier(
+            settings['lens_size'],
+            ctypes.c_float(settings['zoom_factor']),
+            settings['toggle_key'],
+            settings['zoom_in_key'],
+            _flag(zoom_in, 'ctrl'),
+            _flag(zoom_in, 'shift'),
+            _flag(zoom_in, 'alt'),
+            settings['zoom_out_key'],
+            _flag(zoom_out, 'ctrl'),
+            _flag(zoom_out, 'shift'),
+            _flag(zoom_out, 'alt'),
+            settings['lens_shape'],
+            0,
+            0,
+            0,
+            0,
+            0,
+            settings['fps']
+        )
+        if not started:
+            raise OSError(self.get_state()['error'] or "Magnifier did not start in time")
+
+    def update(self, settings):
+        self.dll.SetZoomAnimation(settings.get('zoom_animation_ms', 120))
+        self.set_tracking(settings)
+        self.set_tracing(settings.get('trace_session', False))
+        self.dll.UpdateSettings(
+            settings['lens_size'],
+            ctypes.c_float(settings['zoom_factor']),
+            settings['lens_shape'],
+            0,
+            0,
+            0,
+            0,
+            0,
+            settings['fps']
+        )
+
+    def stop(self):
+        return bool(self.dll.StopMagnifier())
+
+    def shutdown(self, timeout=1.0):
+        done = bool(self.dll.ShutdownMagnifier(int(timeout * 1000)))
+        if done:
+            # ShutdownMagnifier closes the trace too
+            self.tracing = False
+        return done
+
+    def get_zoom(self):
+        return self.dll.GetCurrentZoom()
+
+    def get_stats(self):
+        self.dll.GetStats(ctypes.byref(self.stats))
+        stats = {name: getattr(self.stats, name) for name, _ in ScopeZStats._fields_[2:]}
+        if self.tracing:
+            stats['trace_file'] = self.trace_path
+        return stats
+
+
+class SoftwareBackend(MagnifierBackend):
+    name = 'software'
+    governed = True
+
+    def __init__(self, capture, present):
+        # present receives one (image, mask, position) per lens each frame, or
+        # None in place of a lens whose image did not change
+        from multi_lens import MultiLensRenderer, lens_specs, filter_settings
+        from governor import QualityGovernor, Quality
+        self.lens_specs = lens_specs
+        self.filter_settings = filter_settings
+        self.quality = Quality
+        self.capture = capture
+        self.present = present
+        self.lenses = MultiLensRenderer(*capture.screen_size())
+        self.governor = QualityGovernor()
+        self.fps = 60
+        self.settings = (0, None)
+        self.snapshot = None
+        self.applied_version = 0
+        self.thread = None
+        self.active = threading.Event()
+        self.idle = threading.Event()
+        self.wake = threading.Event()
+        self.shutdown_requested = False
+        self.frame_times = deque(maxlen=1000)
+        self.frames_rendered = 0
+        self.late_frames = 0
+        self.missed_deadlines = 0
+        self.state_lock = threading.Lock()
+        self.state = {'seq': 0, 'zoom': 0.0, 'lens_size': 0, 'lens_shape': 0, 'visible': 0,
+                      'running': 0, 'error_code': 0, 'error': '', 'quality_level': 0}
+
+    def start(self, settings):
+        # The render thread is created once and then only suspended/resumed
+        if self.active.is_set():
+            return
+        self.update(settings)
+        self.idle.clear()
+        self.active.set()
+        self.wake.set()
+        if not (self.thread and self.thread.is_alive()):
+            self.shutdown_requested = False
+            self.thread = threading.Thread(target=self.run, name='scope-z-software', daemon=True)
+            self.thread.start()
+
+    def update(self, settings):
+        # Publish an immutable snapshot; the render thread picks up the newest
+        # one at its next frame boundary, so bursts coalesce into one apply.
+        snapshot = (self.lens_specs(settings), settings['fps'], settings.get('skip_static', True),
+                    settings.get('render_workers', 0), self.filter_settings(settings),
+                    (settings.get('frame_budget_ms', 0.0), settings.get('cpu_budget_percent', 0)))
+        self.settings = (self.settings[0] + 1, snapshot)
+
+    def apply_pending_settings(self):
+        version, snapshot = self.settings
+        if version == self.applied_version:
+            return False
+        specs, fps, skip_static, workers, filters, budget = snapshot
+        self.governor.configure(self.quality(specs, fps, filters), *budget)
+        self.snapshot = snapshot
+        self.apply_quality()
+        self.applied_version = version
+        return True
+
+    def apply_quality(self):
+        # The user's settings as reduced by the governor's current level
+        quality = self.governor.quality
+        skip_static, workers = self.snapshot[2:4]
+        self.lenses.configure(quality.specs, skip_static, workers, quality.filters)
+        self.fps = max(1, quality.fps)
+
+    def stop(self, timeout=1.0):
+        if not self.active.is_set():
+            return True
+        self.active.clear()
+        self.wake.set()
+        return self.idle.wait(timeout)
+
+    def shutdown(self, timeout=1.0):
+        self.shutdown_requested = True
+        self.active.clear()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return False
+        self.thread = None
+        self.lenses.close()
+        self.capture.close()
+        return True
+
+    @property
+    def engine(self):
+        # The primary lens, the one state and zoom are reported for
+        return self.lenses.primary
+
+    def get_zoom(self):
+        return self.engine.zoom
+
+    def on_suspend(self):
+        # Runs on the render thread once the frame loop has stopped
+        pass
+
+    def get_state(self):
+        with self.state_lock:
+            return dict(self.state)
+
+    def publish_state(self, **fields):
+        with self.state_lock:
+            if all(self.state[key] == value for key, value in fields.items()):
+                return False
+            self.state.update(fields)
+            self.state['seq'] += 2
+        if self.state_callback:
+            self.state_callback()
+        return True
+
+    def get_stats(self):
+        times = sorted(self.frame_times)
+        stats = {
+            'frames_rendered': self.frames_rendered,
+            'frame_ms_p50': _percentile(times, 50),
+            'frame_ms_p95': _percentile(times, 95),
+            'frame_ms_p99': _percentile(times, 99),
+            'frame_ms_max': times[-1] if times else 0.0,
+            'late_frames': self.late_frames,
+            'missed_deadlines': self.missed_deadlines,
+            'target_fps': self.fps,
+            'render_workers': self.lenses.bands.workers,
+            'lenses': [self.lens_stats(lens) for lens in self.lenses.lenses]
+        }
+        if self.governor.enabled:
+            stats.update(self.governor.stats())
+        # Cost of each post-processing stage per frame, all lenses together
+        for stage, stage_times in self.lenses.filters.stage_times.items():
+            if stage_times and self.lenses.filters.active:
+                values = sorted(stage_times)
+                stats[f'filter_{stage}_ms_p50'] = _percentile(values, 50)
+                stats[f'filter_{stage}_ms_p99'] = _percentile(values, 99)
+        return stats
+
+    def lens_stats(self, lens):
+        times = sorted(lens.render_times)
+        return {
+            'lens_size': lens.engine.lens_size,
+            'zoom': lens.engine.zoom,
+            'frames_rendered': lens.frames_rendered,
+            'render_ms_p50': _percentile(times, 50),
+            'render_ms_p99': _percentile(times, 99),
+            **(lens.tile_cache.stats() if lens.tile_cache else {})
+        }
+
+    def render_once(self):
+        rect = self.lenses.source_rect()
+        frame = self.capture.grab(rect)
+        frames = []
+        for lens, (image, regions) in zip(self.lenses.lenses, self.lenses.render(frame, rect[:2])):
+            if regions == []:
+                frames.append(None)
+                continue
+            if lens.tile_cache:
+                # The cache keeps rendering into this buffer, so hand out a copy
+                image = image.copy()
+            frames.append((image, lens.engine.mask, lens.position()))
+        if any(frames):
+            self.present(frames)
+        return frames
+
+    def run(self):
+        while not self.shutdown_requested:
+            if not self.active.is_set():
+                self.idle.set()
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            self.publish_state(error_code=0, error='')
+            # The lenses were hidden while suspended, so the first frame must be presented
+            self.lenses.reset()
+            try:
+                self.frame_loop()
+            except Exception as e:
+                self.active.clear()
+                self.publish_state(running=0, visible=0, error_code=ENGINE_ERR_RENDER, error=str(e))
+            else:
+                self.publish_state(running=0, visible=0)
+            self.on_suspend()
+        self.idle.set()
+
+    def render_cpu_time(self):
+        return time.thread_time() + self.lenses.bands.cpu_time
+
+    def frame_loop(self):
+        deadline = time.perf_counter()
+        # This thread's CPU time plus what band workers spent on its frames,
+        # so the GUI thread sharing the process does not count against the budget
+        cpu = self.render_cpu_time()
+        while self.active.is_set():
+            start = time.perf_counter()
+            self.apply_pending_settings()
+            self.render_once()
+            end = time.perf_counter()
+            engine = self.engine
+            frame_ms = (end - start) * 1000.0
+            self.frame_times.append(frame_ms)
+            self.frames_rendered += 1
+            previous_cpu, cpu = cpu, self.render_cpu_time()
+            if self.governor.record(end, frame_ms, (cpu - previous_cpu) * 1000.0):
+                self.apply_quality()
+            self.publish_state(zoom=engine.zoom, lens_size=engine.lens_size, lens_shape=engine.shape, visible=1, running=1,
+                               quality_level=self.governor.level)
+            period = 1.0 / self.fps
+            deadline += period
+            delay = deadline - end
+            if delay > 0:
+                if self.wake.wait(delay):
+                    self.wake.clear()
+            else:
+                self.late_frames += 1
+                self.missed_deadlines += int(-delay / period)
+                deadline = end
+
+
+class GdiCapture:
+    def __init__(self):
+        if sys.platform != 'win32':
+            raise OSError("GDI capture is only available on Windows")
+        self.user32 = ctypes.windll.user32
+        self.gdi32 = ctypes.windll.gdi32
+        self.user32.GetDC.restype = ctypes.c_void_p
+        self.gdi32.CreateCompatibleDC.restype = ctypes.c_void_p
+        self.gdi32.CreateDIBSection.restype = ctypes.c_void_p
+        self.gdi32.SelectObject.restype = ctypes.c_void_p
+        self.screen_dc = None
+        self.mem_dc = None
+        self.bitmap = None
+        self.bits = None
+        self.size = (0, 0)
+
+    def screen_size(self):
+        return self.user32.GetSystemMetrics(0), self.user32.GetSystemMetrics(1)
+
+    def _allocate(self, width, height):
+        import numpy as np
+        self.close()
+
+        class BITMAPINFOHEADER(ctypes.Structure):
+            _fields_ = [('biSize', ctypes.c_uint32), ('biWidth', ctypes.c_int32), ('biHeight', ctypes.c_int32),
+                        ('biPlanes', ctypes.c_uint16), ('biBitCount', ctypes.c_uint16), ('biCompression', ctypes.c_uint32),
+                        ('biSizeImage', ctypes.c_uint32), ('biXPelsPerMeter', ctypes.c_int32), ('biYPelsPerMeter', ctypes.c_int32),
+                        ('biClrUsed', ctypes.c_uint32), ('biClrImportant', ctypes.c_uint32)]
+
+        header = BITMAPINFOHEADER(ctypes.sizeof(BITMAPINFOHEADER), width, -height, 1, 32, 0, 0, 0, 0, 0, 0)
+        bits = ctypes.c_void_p()
+        self.screen_dc = self.user32.GetDC(None)
+        self.mem_dc = self.gdi32.CreateCompatibleDC(ctypes.c_void_p(self.screen_dc))
+        self.bitmap = self.gdi32.CreateDIBSection(ctypes.c_void_p(self.mem_dc), ctypes.byref(header), 0, ctypes.byref(bits), None, 0)
+        if not self.bitmap:
+            raise OSError("CreateDIBSection failed")
+        self.gdi32.SelectObject(ctypes.c_void_p(self.mem_dc), ctypes.c_void_p(self.bitmap))
+        buffer = (ctypes.c_uint8 * (width * height * 4)).from_address(bits.value)
+        self.bits = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4)
+        self.size = (width, height)
+
+    def grab(self, rect):
+        left, top, right, bottom = rect
+        width, height = right - left, bottom - top
+        if (width, height) != self.size:
+            self._allocate(width, height)
+        self.gdi32.BitBlt(ctypes.c_void_p(self.mem_dc), 0, 0, width, height,
+                          ctypes.c_void_p(self.screen_dc), left, top, 0x00CC0020)
+        return self.bits
+
+    def close(self):
+        if self.bitmap:
+            self.gdi32.DeleteObject(ctypes.c_void_p(self.bitmap))
+        if self.mem_dc:
+            self.gdi32.DeleteDC(ctypes.c_void_p(self.mem_dc))
+        if self.screen_dc:
+            self.user32.ReleaseDC(None, ctypes.c_void_p(self.screen_dc))
+        self.screen_dc = self.mem_dc = self.bitmap = self.bits = None
+        self.size = (0, 0)
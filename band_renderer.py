@@ -0,0 +1,82 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from filters import expand_region
+
+MAX_WORKERS = 8
+# Below this many output pixels a band costs more to dispatch than to render
+MIN_BAND_PIXELS = 65536
+# A few bands per worker so one slow band does not leave the others idle
+BANDS_PER_WORKER = 2
+
+
+def default_workers():
+    return max(1, min(MAX_WORKERS, os.cpu_count() or 1))
+
+
+def split_bands(region, workers, min_pixels=MIN_BAND_PIXELS):
+    # Cuts a (top, bottom, left, right) region into horizontal bands sized for the worker count
+    top, bottom, left, right = region
+    rows, width = bottom - top, right - left
+    count = max(1, min(workers * BANDS_PER_WORKER, rows * width // min_pixels, rows))
+    step = -(-rows // count)
+    return [(y, min(y + step, bottom), left, right) for y in range(top, bottom, step)]
+
+
+class BandRenderer:
+    # Splits lens renders into horizontal bands and runs them on a persistent
+    # pool. The resample and mask kernels are NumPy calls that release the GIL,
+    # so bands of one lens run concurrently. workers=1 renders inline, in band
+    # order, on the calling thread.
+    def __init__(self, workers=None):
+        self.workers = default_workers() if workers is None else max(1, int(workers))
+        self.pool = None
+        self.bands_rendered = 0
+        # CPU seconds pool threads spent on bands; inline bands count on the caller's thread
+        self.cpu_time = 0.0
+
+    def set_workers(self, workers):
+        workers = default_workers() if not workers else max(1, int(workers))
+        if workers != self.workers:
+            self.close()
+            self.workers = workers
+
+    def render(self, engine, frame, origin, out, regions=None):
+        # Renders regions (the whole lens if None) into out, which must be preallocated
+        size = engine.lens_size
+        regions = list(regions) if regions is not None else [(0, size, 0, size)]
+        if engine.filters is None:
+            self.run(lambda band: engine.render(frame, origin, out, band), regions)
+            return out
+        # Filters read neighbouring rows, so every band is scaled before any is filtered
+        engine.prepare(frame)
+        self.run(lambda band: engine.resample_region(frame, origin, band), regions)
+        halo = engine.filters.halo
+        self.run(lambda band: engine.finish_region(out, band), [expand_region(r, halo, size) for r in regions])
+        return out
+
+    def run(self, work, regions):
+        bands = []
+        for region in regions:
+            bands.extend(split_bands(region, self.workers) if self.workers > 1 else (region,))
+        self.bands_rendered += len(bands)
+        if len(bands) == 1 or self.workers == 1:
+            for band in bands:
+                work(band)
+            return
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scope-z-band')
+        futures = [self.pool.submit(self.timed, work, band) for band in bands]
+        self.cpu_time += sum(future.result() for future in futures)
+
+    @staticmethod
+    def timed(work, band):
+        start = time.thread_time()
+        work(band)
+        return time.thread_time() - start
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=True)
+        self.pool = None
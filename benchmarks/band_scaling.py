@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from band_renderer import BandRenderer
+from software_engine import SoftwareEngine, LENS_CIRCLE
+
+SCREEN = (1920, 1080)
+
+
+def measure(engine, frame, workers, frames, warmup):
+    renderer = BandRenderer(workers)
+    size = engine.lens_size
+    out = np.empty((size, size, 4), dtype=np.uint8)
+    try:
+        for _ in range(warmup):
+            renderer.render(engine, frame, (0, 0), out)
+        start = time.perf_counter()
+        for _ in range(frames):
+            renderer.render(engine, frame, (0, 0), out)
+        elapsed = time.perf_counter() - start
+    finally:
+        renderer.close()
+    ms = elapsed * 1000.0 / frames
+    return {'ms_per_frame': ms, 'mpixels_per_s': size * size / ms / 1000.0, 'fps': 1000.0 / ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Band rendering throughput for 1, 2, 4 and 8 workers")
+    parser.add_argument('--sizes', default='600,1000', help="comma-separated lens sizes")
+    parser.add_argument('--workers', default='1,2,4,8', help="comma-separated worker counts")
+    parser.add_argument('--kernels', default='nearest,bilinear,pixel_art')
+    parser.add_argument('--zoom', type=float, default=2.5)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    frame = np.random.default_rng(0).integers(0, 256, (SCREEN[1], SCREEN[0], 4), dtype=np.uint8)
+    engine = SoftwareEngine(*SCREEN)
+    workers = [int(w) for w in args.workers.split(',')]
+    results = []
+    for kernel in args.kernels.split(','):
+        for size in (int(s) for s in args.sizes.split(',')):
+            engine.configure(size, args.zoom, LENS_CIRCLE, kernel)
+            runs = {w: measure(engine, frame, w, args.frames, args.warmup) for w in workers}
+            base = runs[workers[0]]['ms_per_frame']
+            for w, run in runs.items():
+                run['speedup'] = base / run['ms_per_frame']
+            results.append({'kernel': kernel, 'lens': size, 'workers': runs})
+
+    if args.json:
+        print(json.dumps({'cpus': os.cpu_count(), 'zoom': args.zoom, 'results': results}, indent=2))
+        return
+    print(f"{os.cpu_count()} cpus, zoom {args.zoom}x, {args.frames} frames")
+    print(f"{'kernel':>10} {'lens':>6} {'workers':>8} {'ms':>8} {'Mpx/s':>8} {'fps':>8} {'speedup':>8}")
+    for result in results:
+        for w, run in result['workers'].items():
+            print(f"{result['kernel']:>10} {result['lens']:>6} {w:>8} {run['ms_per_frame']:>8.3f} "
+                  f"{run['mpixels_per_s']:>8.1f} {run['fps']:>8.0f} {run['speedup']:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from control_client import ControlClient, ControlError, address_family
+from control_server import ControlServer
+from suite import summarize
+
+# The round trip a stream deck button should cost
+TARGET_P50_MS = 1.0
+# The longest a publish on the GUI thread may take with a subscriber that stopped reading
+TARGET_PUBLISH_MS = 5.0
+
+
+class FakeTarget:
+    # Stands in for the GUI: the same locking and state shape, no display
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = {'zoom': 2.0, 'lens_size': 300, 'shape': 'circle', 'visible': 1, 'fps': 60}
+        self.applies = 0
+
+    def get_state(self):
+        with self.lock:
+            return dict(self.state)
+
+    def apply(self, changes):
+        with self.lock:
+            self.state.update(changes)
+            self.applies += 1
+            return dict(self.state)
+
+
+def hammer(address, requests, seed, results):
+    # One client process: a mix of the calls a stream deck profile makes
+    times = []
+    errors = 0
+    with ControlClient(address) as client:
+        for i in range(requests):
+            start = time.perf_counter()
+            try:
+                kind = (i + seed) % 4
+                if kind == 0:
+                    client.get()
+                elif kind == 1:
+                    client.step(zoom=0.5 if i % 8 < 4 else -0.5)
+                elif kind == 2:
+                    client.set(lens_size=100 + 50 * (i % 10))
+                else:
+                    with client.batch():
+                        client.set(shape='rectangle' if i % 2 else 'circle')
+                        client.set(fps=60)
+            except ControlError:
+                errors += 1
+            times.append((time.perf_counter() - start) * 1000.0)
+    results.put((times, errors))
+
+
+def watch(address, counts, stop):
+    client = ControlClient(address)
+    events = 0
+    for _ in client.subscribe():
+        events += 1
+        counts[0] = events
+        if stop.is_set():
+            break
+    client.close()
+
+
+def stalled_subscriber(server, target, publishes=5000):
+    # A subscriber that never reads must not hold up publish, and is dropped once far enough behind
+    others = set(server.subscribers)
+    stalled = Client(server.address, family=address_family(server.address))
+    stalled.send_bytes(b'subscribe')
+    deadline = time.perf_counter() + 1.0
+    while not set(server.subscribers) - others and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    conns = set(server.subscribers) - others
+    times = []
+    for i in range(publishes):
+        state = target.apply({'lens_size': 100 + i % 900, 'zoom': 1.0 + i % 90 / 10})
+        start = time.perf_counter()
+        server.publish(state)
+        times.append((time.perf_counter() - start) * 1000.0)
+    dropped = bool(conns) and not conns & set(server.subscribers)
+    stalled.close()
+    return summarize(times), dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer the control socket with concurrent clients")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent client processes")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per client")
+    parser.add_argument('--address', help="an already running Scope Z (default: a private in-process server)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    server = target = None
+    address = args.address
+    if address is None:
+        address = str(Path(tempfile.mkdtemp()) / 'control.sock') if sys.platform != 'win32' else None
+        target = FakeTarget()
+        server = ControlServer(target.get_state, target.apply, address)
+        server.start()
+        address = server.address
+
+    # Idle round trip first, then the same under load
+    with ControlClient(address) as client:
+        idle = summarize([client.ping() for _ in range(500)])
+
+    counts, stop = [0], threading.Event()
+    watcher = threading.Thread(target=watch, args=(address, counts, stop), daemon=True)
+    watcher.start()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=hammer, args=(address, args.requests, seed, results))
+               for seed in range(args.clients)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+    stop.set()
+
+    times = [t for worker_times, _ in outcomes for t in worker_times]
+    report = {
+        'clients': args.clients,
+        'requests': len(times),
+        'errors': sum(errors for _, errors in outcomes),
+        'throughput_per_s': len(times) / elapsed,
+        'idle_ms': idle,
+        'loaded_ms': summarize(times),
+        'state_events': counts[0],
+        'applies': target.applies if target else None
+    }
+    ok = report['errors'] == 0 and idle['p50'] < TARGET_P50_MS
+    if server:
+        report['stalled_publish_ms'], report['stalled_dropped'] = stalled_subscriber(server, target)
+        ok &= report['stalled_dropped'] and report['stalled_publish_ms']['max'] < TARGET_PUBLISH_MS
+        server.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['requests']} requests from {args.clients} clients in {elapsed:.2f} s "
+              f"({report['throughput_per_s']:.0f}/s), {report['errors']} errors, {report['state_events']} state events")
+        for label, summary in (('idle', idle), ('loaded', report['loaded_ms'])):
+            print(f"{label:>8} round trip p50 {summary['p50']:.3f} ms  p99 {summary['p99']:.3f} ms  max {summary['max']:.3f} ms")
+        if server:
+            summary = report['stalled_publish_ms']
+            print(f"stalled subscriber: publish p50 {summary['p50']:.3f} ms  max {summary['max']:.3f} ms, "
+                  f"{'dropped' if report['stalled_dropped'] else 'NOT dropped'}")
+        print(f"target: idle p50 under {TARGET_P50_MS} ms, publish under {TARGET_PUBLISH_MS} ms past a stalled "
+              f"subscriber -> {'ok' if ok else 'MISSED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+// Engine header checks on fake platforms: a fake clock for FramePacer,
+// synthetic input for HotkeyEngine, scripted frames for the RenderState
+// diff, a fake monitor layout for DisplayGeometry and SourceTracker, a
+// racing writer for the stats seqlock, and a scripted producer for the
+// settings mailbox. Built and run by engine_checks.py.
+#include <cmath>
+#include <cstdio>
+#include <vector>
+
+#include "frame_pacer.h"
+#include "hotkeys.h"
+#include "render_state.h"
+#include "display_geometry.h"
+#include "stats.h"
+#include "settings_channel.h"
+
+static int checks = 0;
+static int failures = 0;
+
+static void check(bool ok, const char* expr, int line) {
+    checks++;
+    if (!ok) {
+        failures++;
+        printf("  FAIL line %d: %s\n", line, expr);
+    }
+}
+
+#define CHECK(cond) check((cond), #cond, __LINE__)
+
+static bool near(double a, double b) { return fabs(a - b) < 1e-6; }
+
+// FramePacer
+
+struct FakeClock {
+    double now;
+    double slice;       // the most one wait moves the clock; less than the timeout is an early wake
+    int waits;
+    bool abandon;
+};
+
+static double fake_now(void* ctx) { return ((FakeClock*)ctx)->now; }
+
+static bool fake_wait(void* ctx, double timeout_ms) {
+    FakeClock* clock = (FakeClock*)ctx;
+    clock->waits++;
+    if (clock->abandon) return false;
+    clock->now += timeout_ms < clock->slice ? timeout_ms : clock->slice;
+    return true;
+}
+
+static void check_frame_pacer() {
+    FakeClock clock = { 1000.0, 1e9, 0, false };
+    PacerPlatform platform = { fake_now, fake_wait, &clock };
+    FramePacer pacer(platform, 60);
+    double period = 1000.0 / 60;
+    CHECK(near(pacer.period_ms(), period));
+
+    // The first frame is due at once
+    CHECK(pacer.wait_for_frame() && clock.waits == 0 && near(clock.now, 1000.0));
+
+    // 5 ms of work a frame: every frame starts on the grid, no drift after many
+    for (int i = 1; i <= 600; i++) {
+        clock.now += 5.0;
+        pacer.wait_for_frame();
+    }
+    CHECK(near(clock.now, 1000.0 + 600 * period));
+    CHECK(pacer.counters().frames == 601 && pacer.counters().late_frames == 0 && pacer.counters().missed_deadlines == 0);
+
+    // A wait that returns early is simply repeated
+    clock.now += 5.0;
+    clock.slice = 4.0;
+    clock.waits = 0;
+    double due = pacer.next_deadline();
+    pacer.wait_for_frame();
+    CHECK(clock.waits >= 3 && near(clock.now, due) && pacer.counters().late_frames == 0);
+    clock.slice = 1e9;
+
+    // A late frame runs immediately and keeps the grid
+    clock.now += 20.0;
+    double grid = pacer.next_deadline();
+    clock.waits = 0;
+    CHECK(pacer.wait_for_frame() && clock.waits == 0);
+    CHECK(pacer.counters().late_frames == 1 && near(pacer.counters().last_lateness_ms, 20.0 - period));
+    CHECK(near(pacer.next_deadline(), grid + period));
+
+    // Overrunning several periods drops the whole ones and counts them as missed
+    double start = pacer.next_deadline();
+    clock.now = start;
+    pacer.wait_for_frame();
+    clock.now = start + 55.0;
+    pacer.wait_for_frame();
+    CHECK(pacer.counters().missed_deadlines == 2);
+    CHECK(near(pacer.counters().last_lateness_ms, 55.0 - 3 * period));
+    CHECK(near(pacer.next_deadline(), start + 4 * period));
+    CHECK(near(pacer.counters().max_lateness_ms, 55.0 - 3 * period));
+
+    // An abandoned wait does not count a frame
+    unsigned long long frames = pacer.counters().frames;
+    clock.abandon = true;
+    CHECK(!pacer.wait_for_frame() && pacer.counters().frames == frames);
+    clock.abandon = false;
+
+    // A rate change starts the new grid at the next deadline
+    double next = pacer.next_deadline();
+    pacer.set_fps(30);
+    CHECK(near(pacer.next_deadline(), next) && near(pacer.period_ms(), 1000.0 / 30));
+    clock.now = next;
+    pacer.wait_for_frame();
+    CHECK(near(pacer.next_deadline(), next + 1000.0 / 30));
+
+    // reset starts a new epoch and clears the counters
+    clock.now = 5000.0;
+    pacer.reset();
+    CHECK(pacer.counters().frames == 0 && near(pacer.next_deadline(), 5000.0));
+
+    FramePacer slow(platform, 0);
+    FramePacer fast(platform, 5000);
+    CHECK(near(slow.period_ms(), 1000.0) && near(fast.period_ms(), 1.0));
+}
+
+// HotkeyEngine
+
+static int fired(HotkeyEngine& engine, int vk, bool down) {
+    InputEvent ev = { vk, down };
+    const HotkeyBinding* b = engine.feed(ev);
+    return b ? b->action : ACTION_NONE;
+}
+
+static void check_hotkeys() {
+    const int F1 = 0x70, F2 = 0x71, LCTRL = 0xA2, RCTRL = 0xA3, LSHIFT = 0xA0, LALT = 0xA4;
+    HotkeyBinding list[] = {
+        { F1, 0, ACTION_TOGGLE, 0.0f },
+        { F1, HOTKEY_MOD_CTRL, ACTION_ZOOM_PRESET, 4.0f },
+        { F1, HOTKEY_MOD_CTRL | HOTKEY_MOD_SHIFT, ACTION_CYCLE_SHAPE, 0.0f },
+        { HOTKEY_WHEEL_UP, HOTKEY_MOD_CTRL, ACTION_ZOOM_IN, 0.0f },
+        { F2, 0, ACTION_NONE, 0.0f },
+        { F2, 0, 99, 0.0f },
+        { F2, HOTKEY_MOD_ALT, ACTION_LENS_STEP, 50.0f },
+        { F2, HOTKEY_MOD_ALT, ACTION_LENS_STEP, -50.0f }
+    };
+    HotkeyEngine engine;
+    engine.compile(std::vector<HotkeyBinding>(list, list + sizeof(list) / sizeof(list[0])));
+
+    // Only the up-to-down transition fires; auto-repeat does not
+    CHECK(fired(engine, F1, true) == ACTION_TOGGLE);
+    CHECK(fired(engine, F1, true) == ACTION_NONE);
+    CHECK(fired(engine, F1, false) == ACTION_NONE);
+    CHECK(fired(engine, F1, true) == ACTION_TOGGLE);
+    fired(engine, F1, false);
+
+    // Bindings with invalid actions are never compiled in
+    CHECK(fired(engine, F2, true) == ACTION_NONE);
+    fired(engine, F2, false);
+
+    // The binding requiring the most held modifiers wins; extra ones are allowed
+    CHECK(fired(engine, LCTRL, true) == ACTION_NONE && engine.modifiers() == HOTKEY_MOD_CTRL);
+    CHECK(fired(engine, F1, true) == ACTION_ZOOM_PRESET);
+    fired(engine, F1, false);
+    fired(engine, LSHIFT, true);
+    CHECK(fired(engine, F1, true) == ACTION_CYCLE_SHAPE);
+    fired(engine, F1, false);
+    fired(engine, LSHIFT, false);
+    fired(engine, LALT, true);
+    CHECK(fired(engine, F1, true) == ACTION_ZOOM_PRESET);
+    fired(engine, F1, false);
+    fired(engine, LALT, false);
+
+    // Releasing one side keeps the other held
+    fired(engine, RCTRL, true);
+    fired(engine, LCTRL, false);
+    CHECK(engine.modifiers() == HOTKEY_MOD_CTRL);
+    fired(engine, RCTRL, false);
+    CHECK(engine.modifiers() == 0);
+
+    // Wheel notches have no up event and fire every time
+    CHECK(fired(engine, HOTKEY_WHEEL_UP, true) == ACTION_NONE);
+    fired(engine, LCTRL, true);
+    CHECK(fired(engine, HOTKEY_WHEEL_UP, true) == ACTION_ZOOM_IN);
+    CHECK(fired(engine, HOTKEY_WHEEL_UP, true) == ACTION_ZOOM_IN);
+    fired(engine, LCTRL, false);
+
+    // Later bindings win ties
+    engine.set_modifiers(HOTKEY_MOD_ALT);
+    InputEvent f2 = { F2, true };
+    const HotkeyBinding* step = engine.feed(f2);
+    CHECK(step && step->action == ACTION_LENS_STEP && step->param == -50.0f);
+    fired(engine, F2, false);
+
+    // Seeded modifiers are released like real ones
+    fired(engine, LALT, false);
+    CHECK(engine.modifiers() == 0);
+
+    // Keys outside the tracked range are ignored
+    CHECK(fired(engine, 0x1FF, true) == ACTION_NONE && fired(engine, -1, true) == ACTION_NONE);
+
+    engine.compile(std::vector<HotkeyBinding>());
+    CHECK(engine.table_size() == 0 && fired(engine, F1, true) == ACTION_NONE);
+}
+
+// RenderState diff
+
+static unsigned op_bits(unsigned a) { return RENDER_OP_BIT(a); }
+
+// One engine frame: diff, count one call per op as a stand-in for the Win32 calls, mark applied
+static unsigned render_frame(RenderState& state, RenderApplied& applied, RenderCounters& counters) {
+    unsigned ops = DiffRenderState(state, applied);
+    unsigned calls = 0;
+    for (int op = 0; op < OP_COUNT; op++) {
+        if (ops & RENDER_OP_BIT(op)) calls++;
+    }
+    MarkRenderApplied(state, applied, ops);
+    CountRenderOps(counters, ops, calls);
+    return ops;
+}
+
+static void check_render_state() {
+    RenderState state;
+    RenderApplied applied;
+    RenderCounters counters = {};
+    LensGeometry geometry = { 810, 390, 300, 300 };
+    LensRegion region = { 300, 300, 0 };
+    OverlayStyle overlay = { false, 4, 255, 0, 0 };
+    state.set_view(960, 540, 300, 300, 3.0f);
+    state.geometry.set(geometry);
+    state.region.set(region);
+    state.visible.set(true);
+    state.overlay.set(overlay);
+
+    // The first frame applies everything
+    unsigned all = op_bits(OP_TRANSFORM) | op_bits(OP_GEOMETRY) | op_bits(OP_REGION) | op_bits(OP_SOURCE) |
+                   op_bits(OP_VISIBILITY) | op_bits(OP_OVERLAY);
+    CHECK(render_frame(state, applied, counters) == all);
+
+    // Unchanged inputs, even when set again, need no state ops; a visible lens only refreshes its content
+    CHECK(render_frame(state, applied, counters) == op_bits(OP_REFRESH));
+    state.set_view(960, 540, 300, 300, 3.0f);
+    state.geometry.set(geometry);
+    state.overlay.set(overlay);
+    CHECK(render_frame(state, applied, counters) == op_bits(OP_REFRESH));
+
+    // Each changed input yields only its own op
+    state.zoom.set(4.0f);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_TRANSFORM) | op_bits(OP_REFRESH)));
+    state.set_view(1000, 540, 300, 300, 4.0f);
+    CHECK(render_frame(state, applied, counters) == op_bits(OP_SOURCE));
+    geometry.x += 10;
+    state.geometry.set(geometry);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_GEOMETRY) | op_bits(OP_REFRESH)));
+    region.shape = 1;
+    state.region.set(region);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_REGION) | op_bits(OP_REFRESH)));
+    overlay.r = 0;
+    state.overlay.set(overlay);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_OVERLAY) | op_bits(OP_REFRESH)));
+
+    // A visible dot is redrawn with every refresh
+    overlay.dot_enabled = true;
+    state.overlay.set(overlay);
+    render_frame(state, applied, counters);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_OVERLAY) | op_bits(OP_REFRESH)));
+    overlay.dot_enabled = false;
+    state.overlay.set(overlay);
+    render_frame(state, applied, counters);
+
+    // Hidden: only the hide itself, then nothing; a source change waits until the lens is shown
+    state.visible.set(false);
+    CHECK(render_frame(state, applied, counters) == op_bits(OP_VISIBILITY));
+    CHECK(render_frame(state, applied, counters) == 0);
+    state.set_view(1100, 540, 300, 300, 4.0f);
+    CHECK(render_frame(state, applied, counters) == 0);
+    state.visible.set(true);
+    CHECK(render_frame(state, applied, counters) == (op_bits(OP_VISIBILITY) | op_bits(OP_SOURCE)));
+
+    // 15 frames needing 6, 1, 1, 2, 1, 2, 2, 2, 2, 2, 2, 1, 0, 0 and 2 calls
+    CHECK(counters.frames == 15);
+    CHECK(counters.syscalls == 26 && counters.last_frame_syscalls == 2);
+    CHECK(counters.op_calls[OP_TRANSFORM] == 2 && counters.op_calls[OP_SOURCE] == 3 && counters.op_calls[OP_VISIBILITY] == 3);
+    CHECK(counters.op_calls[OP_REFRESH] == 9 && counters.op_calls[OP_OVERLAY] == 5);
+    CHECK(counters.op_calls[OP_GEOMETRY] == 2 && counters.op_calls[OP_REGION] == 2);
+}
+
+// DisplayGeometry and SourceTracker
+
+struct FakeLayout {
+    MonitorRect monitors[DISPLAY_MAX_MONITORS];
+    int count;
+    int calls;
+};
+
+static int fake_enumerate(void* ctx, MonitorRect* out, int max) {
+    FakeLayout* layout = (FakeLayout*)ctx;
+    layout->calls++;
+    int n = layout->count < max ? layout->count : max;
+    for (int i = 0; i < n; i++) out[i] = layout->monitors[i];
+    return n;
+}
+
+static void check_display_geometry() {
+    // Enumerated as: right monitor, primary, portrait monitor on the left and lower down
+    FakeLayout layout = { { { 1920, 0, 4480, 1440, false }, { 0, 0, 1920, 1080, true }, { -1080, 200, 0, 2120, false } }, 3, 0 };
+    DisplayPlatform platform = { fake_enumerate, &layout };
+    DisplayGeometry displays(platform);
+
+    // Enumerated once, then kept until invalidated
+    CHECK(displays.stale());
+    CHECK(displays.refresh_if_stale() && !displays.refresh_if_stale() && layout.calls == 1);
+
+    // Primary first, then left to right
+    CHECK(displays.count() == 3 && displays.monitor(0).primary);
+    CHECK(displays.monitor(1).left == -1080 && displays.monitor(2).left == 1920);
+    CHECK(&displays.monitor(7) == &displays.monitor(0) && &displays.monitor(-1) == &displays.monitor(0));
+
+    // Points on a monitor, in gaps between monitors and off the desktop
+    CHECK(displays.monitor_at(100, 100) == 0);
+    CHECK(displays.monitor_at(2000, 1300) == 2);
+    CHECK(displays.monitor_at(-5, 300) == 1);
+    CHECK(displays.monitor_at(1000, 1200) == 0);
+    CHECK(displays.monitor_at(-500, 50) == 1);
+    CHECK(displays.monitor_at(99999, 5) == 2);
+    CHECK(displays.monitor_at(1919, 1079) == 0 && displays.monitor_at(1920, 0) == 2);
+
+    // A layout change is picked up on the next refresh
+    layout.monitors[1].right = 3840;
+    layout.monitors[1].bottom = 2160;
+    layout.monitors[0].left = 3840;
+    layout.monitors[0].right = 6400;
+    layout.count = 2;
+    displays.invalidate();
+    CHECK(displays.refresh_if_stale() && displays.refreshes() == 2);
+    CHECK(displays.count() == 2 && displays.monitor(0).right == 3840 && displays.monitor(1).left == 3840);
+    CHECK(displays.monitor_at(-500, 50) == 0);
+
+    // Nothing to enumerate mid mode change: the last layout is kept
+    layout.count = 0;
+    displays.invalidate();
+    displays.refresh_if_stale();
+    CHECK(displays.count() == 2 && displays.monitor(1).right == 6400);
+
+    // Nothing ever enumerated: a 1x1 primary stands in
+    DisplayGeometry empty(platform);
+    empty.refresh();
+    CHECK(empty.count() == 1 && empty.monitor(0).primary && empty.monitor_at(500, 500) == 0);
+
+    SourceTracker tracker;
+    TrackedView view;
+
+    // The primary's centre by default
+    tracker.resolve(displays, 0, 0, 300, 300, &view);
+    CHECK(view.cx == 1920 && view.cy == 1080 && view.lens_x == 1770 && view.lens_y == 930 && view.monitor == 0);
+
+    TrackTarget second = { TRACK_MONITOR, 1, 0 };
+    tracker.set_target(second);
+    tracker.resolve(displays, 0, 0, 300, 300, &view);
+    CHECK(view.cx == 5120 && view.monitor == 1);
+
+    // A monitor that went away means the primary
+    TrackTarget gone = { TRACK_MONITOR, 9, 0 };
+    tracker.set_target(gone);
+    tracker.resolve(displays, 0, 0, 300, 300, &view);
+    CHECK(view.monitor == 0 && view.cx == 1920);
+
+    // Near a corner the lens is clamped onto the cursor's monitor
+    TrackTarget cursor = { TRACK_CURSOR, 0, 0 };
+    tracker.set_target(cursor);
+    tracker.resolve(displays, 3830, 10, 300, 300, &view);
+    CHECK(view.cx == 3830 && view.cy == 10 && view.lens_x == 3540 && view.lens_y == 0 && view.monitor == 0);
+    tracker.resolve(displays, 3850, 10, 300, 300, &view);
+    CHECK(view.monitor == 1 && view.lens_x == 3840);
+
+    // A lens larger than the monitor is pinned to its top-left corner
+    TrackTarget point = { TRACK_POINT, 100, 2150 };
+    tracker.set_target(point);
+    tracker.resolve(displays, 0, 0, 4000, 300, &view);
+    CHECK(view.cx == 100 && view.lens_x == 0 && view.lens_y == 1860);
+    tracker.resolve(displays, 0, 0, 300, 3000, &view);
+    CHECK(view.lens_y == 0);
+
+    // A point off the desktop uses the nearest monitor
+    TrackTarget outside = { TRACK_POINT, 9000, -300 };
+    tracker.set_target(outside);
+    tracker.resolve(displays, 0, 0, 300, 300, &view);
+    CHECK(view.monitor == 1 && view.lens_x == 6100 && view.lens_y == 0);
+}
+
+// Stats seqlock
+
+static void check_stats_seqlock() {
+    SeqlockCell<EngineCounters> cell;
+    CHECK(cell.read().pacing.frames == 0 && cell.read().frame_ms_max == 0.0);
+
+    // Every field of a publish carries the same number, so a torn read shows up as a mismatch
+    std::atomic<bool> done(false);
+    std::thread writer([&cell, &done] {
+        for (unsigned long long i = 1; i <= 500000; i++) {
+            EngineCounters counters = EngineCounters();
+            counters.pacing.frames = counters.pacing.missed_deadlines = i;
+            counters.render.frames = counters.render.op_calls[OP_COUNT - 1] = i;
+            counters.frame_ms_max = (double)i;
+            cell.publish(counters);
+        }
+        done.store(true);
+    });
+    unsigned long long reads = 0, torn = 0, last = 0, backwards = 0;
+    while (!done.load()) {
+        EngineCounters counters = cell.read();
+        unsigned long long n = counters.pacing.frames;
+        if (counters.pacing.missed_deadlines != n || counters.render.frames != n ||
+            counters.render.op_calls[OP_COUNT - 1] != n || counters.frame_ms_max != (double)n) torn++;
+        if (n < last) backwards++;
+        last = n;
+        reads++;
+    }
+    writer.join();
+    CHECK(reads > 0 && torn == 0 && backwards == 0);
+    CHECK(cell.read().render.frames == 500000);
+
+    ScopeZStats out;
+    LatencyHistogram frame_time, hook_latency;
+    FillStats(&out, frame_time, hook_latency, cell.read(), 60);
+    CHECK(out.frames_rendered == 500000 && out.missed_deadlines == 500000 && out.frame_ms_max == 500000.0);
+}
+
+// Settings mailbox
+
+static void check_settings_mailbox() {
+    TripleBuffer<SettingsSnapshot> mailbox;
+    SettingsSnapshot snap = SettingsSnapshot();
+    CHECK(!mailbox.read(&snap) && mailbox.read_count() == 0);
+
+    // A burst collapses into its last snapshot, read once
+    for (unsigned v = 1; v <= 3; v++) {
+        snap.version = v;
+        mailbox.write(snap);
+    }
+    SettingsSnapshot out = SettingsSnapshot();
+    CHECK(mailbox.read(&out) && out.version == 3);
+    CHECK(!mailbox.read(&out) && mailbox.written() == 3 && mailbox.read_count() == 1);
+
+    // Snapshots dropped on resume are not counted as applied
+    snap.version = 4;
+    mailbox.write(snap);
+    mailbox.discard();
+    mailbox.discard();
+    CHECK(!mailbox.read(&out) && mailbox.read_count() == 1);
+
+    // and the next write still gets through, on every slot rotation
+    bool delivered = true;
+    for (unsigned v = 5; v <= 10; v++) {
+        snap.version = v;
+        mailbox.write(snap);
+        if (v % 2) mailbox.discard();
+        else delivered &= mailbox.read(&out) && out.version == v;
+    }
+    CHECK(delivered && mailbox.written() == 10 && mailbox.read_count() == 4);
+}
+
+int main() {
+    struct { const char* name; void (*run)(); } groups[] = {
+        { "frame_pacer", check_frame_pacer },
+        { "hotkeys", check_hotkeys },
+        { "render_state", check_render_state },
+        { "display_geometry", check_display_geometry },
+        { "stats_seqlock", check_stats_seqlock },
+        { "settings_mailbox", check_settings_mailbox }
+    };
+    int failed_groups = 0;
+    for (size_t i = 0; i < sizeof(groups) / sizeof(groups[0]); i++) {
+        int before_checks = checks, before_failures = failures;
+        groups[i].run();
+        int failed = failures - before_failures;
+        printf("%18s %4d checks  %s\n", groups[i].name, checks - before_checks, failed ? "FAILED" : "ok");
+        if (failed) failed_groups++;
+    }
+    return failed_groups ? 1 : 0;
+}
@@ -0,0 +1,46 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCE = Path(__file__).with_suffix('.cpp')
+
+# The headers are plain C++11 with no Windows dependencies, so any host compiler builds them
+COMPILERS = ('c++', 'g++', 'clang++')
+
+
+def find_compiler(requested):
+    if requested:
+        return requested
+    for name in (os.environ.get('CXX'),) + COMPILERS:
+        if name and shutil.which(name):
+            return name
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and run the engine header checks (frame pacer, hotkeys, render "
+                                                 "state, display geometry, stats seqlock, settings mailbox) against "
+                                                 "fake platforms")
+    parser.add_argument('--cxx', help="C++ compiler (default: $CXX, then c++, g++, clang++)")
+    args = parser.parse_args()
+
+    compiler = find_compiler(args.cxx)
+    if compiler is None:
+        print("no C++ compiler found; set CXX or pass --cxx", file=sys.stderr)
+        sys.exit(2)
+    with tempfile.TemporaryDirectory() as build:
+        binary = Path(build) / ('engine_checks.exe' if sys.platform == 'win32' else 'engine_checks')
+        command = [compiler, '-std=c++11', '-O1', '-Wall', '-pthread', '-I', str(ROOT), str(SOURCE), '-o', str(binary)]
+        if subprocess.run(command).returncode != 0:
+            print(f"build failed: {' '.join(command)}", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(subprocess.run([str(binary)]).returncode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from governor import QualityGovernor, Quality
+from multi_lens import DEFAULT_LENS
+from resample import BILINEAR
+
+# Relative cost of each rung: filters off, then nearest scaling. Rate rungs
+# change how often a frame is paid for, not what it costs.
+RUNG_COST = {'filters off': 0.55, 'nearest scaling': 0.7}
+
+
+def frame_cost(governor, base_ms):
+    cost = base_ms
+    for label, _ in governor.ladder[1:governor.level + 1]:
+        cost *= RUNG_COST.get(label, 1.0)
+    return cost
+
+
+def replay(trace, frame_budget_ms=0.0, cpu_budget=0.0, fps=60, seed=0):
+    # trace yields the full-quality frame cost in ms for each frame; the
+    # clock advances by one period of whatever rate the governor allows
+    rng = random.Random(seed)
+    governor = QualityGovernor()
+    quality = Quality((DEFAULT_LENS._replace(kernel=BILINEAR),), fps, (0.5, 1.2, 1.0, 'none'))
+    governor.configure(quality, frame_budget_ms, cpu_budget)
+    now = 0.0
+    for base_ms in trace(rng):
+        frame_ms = frame_cost(governor, base_ms)
+        now += max(frame_ms / 1000.0, 1.0 / governor.quality.fps)
+        governor.record(now, frame_ms, frame_ms)
+    return governor
+
+
+def steady(ms, frames=6000, jitter=0.05):
+    return lambda rng: (ms * rng.uniform(1 - jitter, 1 + jitter) for _ in range(frames))
+
+
+def spikes(ms, spike_ms, every=20, frames=6000):
+    return lambda rng: (spike_ms if i % every == 0 else ms * rng.uniform(0.95, 1.05) for i in range(frames))
+
+
+def phases(*parts):
+    def trace(rng):
+        for ms, frames in parts:
+            for _ in range(frames):
+                yield ms * rng.uniform(0.95, 1.05)
+    return trace
+
+
+def walk(low, high, frames=12000):
+    # A slow random walk between low and high, like panning across a scene
+    def trace(rng):
+        ms = (low + high) / 2
+        for _ in range(frames):
+            ms = min(high, max(low, ms + rng.gauss(0, (high - low) / 200)))
+            yield ms
+    return trace
+
+
+# name, trace, frame budget, CPU budget, (max changes, final level or None)
+SCENARIOS = [
+    ('under budget', steady(3.0), 5.0, 0, (0, 0)),
+    ('over, first rung fits', steady(6.0), 5.0, 0, (1, 1)),
+    ('over, needs two rungs', steady(9.0), 5.0, 0, (2, 2)),
+    ('hovering at budget', steady(5.0, jitter=0.08), 5.0, 0, (4, None)),
+    ('rare spikes', spikes(3.0, 30.0), 5.0, 0, (0, 0)),
+    ('heavy then light', phases((9.0, 3000), (2.0, 6000)), 5.0, 0, (4, 0)),
+    ('slow walk', walk(3.0, 8.0), 5.0, 0, (12, None)),
+    ('CPU budget', steady(4.0), 0, 15, (2, 1)),
+    ('CPU budget, lower rate', steady(8.0), 0, 15, (4, 3)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic frame-time traces through the quality governor")
+    parser.add_argument('--seeds', type=int, default=5, help="random seeds per scenario")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for name, trace, frame_budget, cpu_budget, (max_changes, final) in SCENARIOS:
+        for seed in range(args.seeds):
+            governor = replay(trace, frame_budget, cpu_budget, seed=seed)
+            ok = governor.changes <= max_changes and (final is None or governor.level == final)
+            failed |= not ok
+            results.append({'scenario': name, 'seed': seed, 'changes': governor.changes, 'final_level': governor.level,
+                            'status': governor.status, 'ok': ok, 'events': [list(e) for e in governor.events]})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scenario':>24} {'seed':>5} {'changes':>8} {'level':>6}  status")
+        for result in results:
+            mark = '' if result['ok'] else '  UNSTABLE'
+            print(f"{result['scenario']:>24} {result['seed']:>5} {result['changes']:>8} {result['final_level']:>6}  "
+                  f"{result['status']}{mark}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
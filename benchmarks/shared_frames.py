@@ -0,0 +1,90 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config_store import MAX_LENSES, default_config, default_lens
+from engine_worker import SharedFrameBackend, SharedRegion
+from suite import StillCapture, SCREEN
+
+
+def make_backend(region, lenses=1):
+    frame = np.random.default_rng(0).integers(0, 256, (SCREEN[1], SCREEN[0], 4), dtype=np.uint8)
+    capture = StillCapture(frame)
+    sent = []
+    backend = SharedFrameBackend(capture, region, sent.append)
+    config = default_config()
+    config['skip_static'] = True
+    config['extra_lenses'] = [default_lens(lens_size=200, offset_x=400 * i) for i in range(1, lenses)]
+    backend.update(config)
+    backend.apply_pending_settings()
+    return backend, capture, sent
+
+
+def changed_then_skipped(region):
+    # Frame N changes the lens, frame N+1 is skipped by the tile cache, and
+    # only then does the listener get to read: it must still see frame N
+    backend, capture, sent = make_backend(region)
+    presented = [0] * MAX_LENSES
+    backend.render_once()
+    results = backend.render_once()
+    yield 'second frame skipped', results[0][1] == [] and len(sent) == 1
+    frames = region.read_frames(presented)
+    yield 'changed frame presented', frames is not None and frames[0] is not None
+    frames = region.read_frames(presented)
+    yield 'nothing presented twice', frames == [None]
+
+
+def torn_read(region):
+    # A read overlapping a frame is not lost: presented is left alone and the retry delivers it
+    backend, capture, sent = make_backend(region)
+    presented = [0] * MAX_LENSES
+    backend.render_once()
+    region.read_frames(presented)
+    capture.frame = capture.frame[:, ::-1].copy()
+    backend.render_once()
+    seqs = list(presented)
+    region.begin_frame()
+    yield 'torn read refused', region.read_frames(presented) is None and presented == seqs
+    region.end_frame()
+    frames = region.read_frames(presented)
+    yield 'retry presents it', frames is not None and frames[0] is not None
+
+
+def one_of_two_changed(region):
+    backend, capture, sent = make_backend(region, lenses=2)
+    presented = [0] * MAX_LENSES
+    backend.render_once()
+    frames = region.read_frames(presented)
+    yield 'both lenses presented first', frames is not None and all(frame is not None for frame in frames)
+    # Both magnify the screen centre; the smaller second lens sees less of it,
+    # so a change near the corner of the first lens's source is its alone
+    left, top = backend.lenses.lenses[0].engine.source_rect()[:2]
+    capture.frame[top + 2:top + 10, left + 2:left + 10] ^= 0xFF
+    backend.render_once()
+    frames = region.read_frames(presented)
+    yield 'only the changed lens presented', frames is not None and frames[0] is not None and frames[1] is None
+
+
+SCENARIOS = [changed_then_skipped, torn_read, one_of_two_changed]
+
+
+def main():
+    argparse.ArgumentParser(description="Check that lens frames shared by the engine worker reach the GUI").parse_args()
+    failed = False
+    for scenario in SCENARIOS:
+        region = SharedRegion()
+        try:
+            for name, ok in scenario(region):
+                failed |= not ok
+                print(f"{scenario.__name__:>22}  {name:<32} {'ok' if ok else 'FAILED'}")
+        finally:
+            region.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import SoftwareBackend
+from config_store import default_config, default_lens
+from multi_lens import MultiLensRenderer, lens_specs
+from resample import KERNELS
+from software_engine import SoftwareEngine, LENS_CIRCLE, LENS_RECTANGLE, lens_mask, lens_outside, source_rect
+
+SCREEN = (1920, 1080)
+# Every lens size and zoom step the GUI spin boxes allow
+LENS_SIZES = list(range(50, 1001, 50))
+ZOOMS = [z / 2 for z in range(2, 21)]
+QUICK_SIZES = [50, 300, 600, 1000]
+QUICK_ZOOMS = [1.0, 2.5, 5.0, 10.0]
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+SUITE_VERSION = 1
+CALIBRATION = 'calibration/machine'
+
+
+class StillCapture:
+    # A fixed random screen, so the settings path runs without a display
+    def __init__(self, frame):
+        self.frame = frame
+
+    def screen_size(self):
+        return SCREEN
+
+    def grab(self, rect):
+        left, top, right, bottom = rect
+        return self.frame[top:bottom, left:right]
+
+    def close(self):
+        pass
+
+
+def summarize(times):
+    times = sorted(times)
+    n = len(times)
+    return {
+        'n': n,
+        'p50': times[n // 2],
+        'p90': times[min(n - 1, int(0.9 * n))],
+        'p99': times[min(n - 1, int(0.99 * n))],
+        'mean': sum(times) / n,
+        'min': times[0],
+        'max': times[-1]
+    }
+
+
+def timed_rounds(cases, repeat, warmup):
+    # One timed call per case per round, so a burst of machine noise is spread
+    # over many cases instead of landing on a few consecutive ones
+    for _, work, _ in cases:
+        for _ in range(warmup):
+            work()
+    times = {name: [] for name, _, _ in cases}
+    for _ in range(repeat):
+        for name, work, calls in cases:
+            start = time.perf_counter()
+            work()
+            times[name].append((time.perf_counter() - start) * 1000.0 / calls)
+    return {name: summarize(values) for name, values in times.items()}
+
+
+def bench_calibration():
+    # Fixed NumPy and interpreter work; compare divides by its change so a
+    # slower or busier machine does not read as a regression in the code
+    a = np.arange(1 << 20, dtype=np.uint32)
+    b = np.empty_like(a)
+
+    def work():
+        np.multiply(a, 3, out=b)
+        np.add(b, a, out=b)
+        sum(range(2000))
+    yield CALIBRATION, work, 1
+
+
+def bench_source_rect(sizes, zooms):
+    # The update() math for every GUI combination in one pass, per call
+    combos = [(size, zoom) for size in sizes for zoom in zooms]
+    cx, cy = SCREEN[0] // 2, SCREEN[1] // 2
+
+    def single():
+        for size, zoom in combos:
+            source_rect(cx, cy, size, size, zoom)
+
+    renderer = MultiLensRenderer(*SCREEN)
+    config = default_config()
+    config['extra_lenses'] = [default_lens(lens_size=200, zoom_factor=6.0, offset_x=400 * i) for i in (-1, 1, 2)]
+    renderer.configure(lens_specs(config), skip_static=False, workers=1)
+    yield 'source_rect/update', single, len(combos)
+    yield 'source_rect/four_lens_union', renderer.source_rect, 1
+
+
+def bench_resample(frame, sizes, zooms, kernels):
+    engine = SoftwareEngine(*SCREEN)
+    outputs = {size: np.empty((size, size, 4), dtype=np.uint8) for size in sizes}
+    for kernel in kernels:
+        for size in sizes:
+            out = outputs[size]
+            for zoom in zooms:
+                def work(zoom=zoom, size=size, kernel=kernel, out=out):
+                    engine.configure(size, zoom, LENS_RECTANGLE, kernel)
+                    engine.resample_region(frame, out=out)
+                yield f'resample/{kernel}/{size}/{zoom:g}', work, 1
+
+
+def bench_mask(sizes):
+    engine = SoftwareEngine(*SCREEN)
+    for size in sizes:
+        out = np.full((size, size, 4), 255, dtype=np.uint8)
+        for name, shape in (('circle', LENS_CIRCLE), ('rectangle', LENS_RECTANGLE)):
+            def apply(size=size, shape=shape, out=out):
+                engine.configure(size, 3.0, shape)
+                engine.finish_region(out)
+            yield f'mask/apply/{name}/{size}', apply, 1
+
+        def build(size=size):
+            # First use of a size: both cached masks are computed from scratch
+            lens_mask.cache_clear()
+            lens_outside.cache_clear()
+            lens_outside(size, LENS_CIRCLE)
+        yield f'mask/build/{size}', build, 1
+
+
+def bench_settings(frame, lens_counts):
+    for count in lens_counts:
+        backend = SoftwareBackend(StillCapture(frame), None)
+        config = default_config()
+        config['extra_lenses'] = [default_lens(lens_size=200, offset_x=300 * i) for i in range(1, count)]
+        zooms = itertools.cycle(ZOOMS)
+
+        def apply(backend=backend, config=config, zooms=zooms):
+            # A GUI edit: publish a snapshot, then the frame boundary applies it
+            config['zoom_factor'] = next(zooms)
+            backend.update(config)
+            backend.apply_pending_settings()
+        yield f'settings_apply/{count}_lens', apply, 1
+
+
+def run_suite(args):
+    sizes, zooms = (QUICK_SIZES, QUICK_ZOOMS) if args.quick else (LENS_SIZES, ZOOMS)
+    frame = np.random.default_rng(0).integers(0, 256, (SCREEN[1], SCREEN[0], 4), dtype=np.uint8)
+    groups = [
+        bench_calibration(),
+        bench_source_rect(sizes, zooms),
+        bench_resample(frame, sizes, zooms, args.kernels.split(',')),
+        bench_mask(sizes),
+        bench_settings(frame, (1, 4))
+    ]
+    cases = [case for case in itertools.chain(*groups) if not args.filter or args.filter in case[0] or case[0] == CALIBRATION]
+    results = timed_rounds(cases, args.repeat, args.warmup)
+    if args.verbose:
+        for name, summary in results.items():
+            print(f"{name:>40} p50 {summary['p50']:.4f} ms  p99 {summary['p99']:.4f} ms", file=sys.stderr)
+    return {
+        'suite_version': SUITE_VERSION,
+        'quick': args.quick,
+        'unit': 'ms',
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count()
+        },
+        'results': results
+    }
+
+
+def group_name(case):
+    # resample/bilinear/300/2.5 -> resample/bilinear, mask/apply/circle/300 -> mask/apply/circle
+    parts = case.split('/')
+    return '/'.join(parts[:-2] if parts[0] == 'resample' else parts[:-1] if len(parts) > 2 else parts[:1])
+
+
+def compare(run, baseline, metric, threshold, floor_ms, normalize=True):
+    # A case regresses when it is slower than the baseline by more than
+    # threshold (relative) and floor_ms (absolute, to ignore timer noise). A
+    # group regresses when the geometric mean of its case ratios does: one
+    # case can be unlucky, a whole group of them is a real slowdown. Ratios
+    # are taken relative to the calibration case unless normalize is off.
+    regressions, improvements, missing = [], [], []
+    ratios = {}
+    scale = 1.0
+    if normalize and CALIBRATION in baseline['results'] and CALIBRATION in run['results']:
+        scale = run['results'][CALIBRATION][metric] / baseline['results'][CALIBRATION][metric]
+    for name, old in baseline['results'].items():
+        if name == CALIBRATION:
+            continue
+        new = run['results'].get(name)
+        if new is None:
+            missing.append(name)
+            continue
+        new = {metric: new[metric] / scale}
+        delta = new[metric] - old[metric]
+        ratio = new[metric] / old[metric] if old[metric] > 0 else float('inf')
+        ratios.setdefault(group_name(name), []).append(max(new[metric], floor_ms) / max(old[metric], floor_ms))
+        if delta > floor_ms and ratio > 1.0 + threshold:
+            regressions.append((name, old[metric], new[metric], ratio))
+        elif -delta > floor_ms and ratio < 1.0 - threshold:
+            improvements.append((name, old[metric], new[metric], ratio))
+    groups = {group: math.exp(sum(math.log(r) for r in values) / len(values)) for group, values in ratios.items()}
+    return scale, groups, regressions, improvements, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the magnifier hot path, with regression baselines")
+    parser.add_argument('--quick', action='store_true', help="a few lens sizes and zoom steps instead of every GUI value")
+    parser.add_argument('--kernels', default=','.join(KERNELS))
+    parser.add_argument('--filter', help="only run cases whose name contains this")
+    parser.add_argument('--repeat', type=int, default=15, help="timed runs per case")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', nargs='?', const=str(BASELINE), help="compare against a baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument('--metric', default='p50', choices=('p50', 'p90', 'p99', 'mean', 'min'))
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative slowdown that counts as a regression")
+    parser.add_argument('--floor-ms', type=float, default=0.02, help="ignore differences smaller than this")
+    parser.add_argument('--no-normalize', action='store_true', help="compare raw times, without the calibration scale")
+    parser.add_argument('--strict', action='store_true', help="fail on single-case regressions too, not only whole groups")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as benchmarks/baseline.json")
+    parser.add_argument('--verbose', action='store_true', help="print each case to stderr as it finishes")
+    args = parser.parse_args()
+
+    run = run_suite(args)
+    if args.save_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(run, indent=2))
+    if not args.compare:
+        return
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    if args.filter or baseline.get('quick') != run['quick']:
+        # Only the cases both runs measured
+        baseline['results'] = {name: r for name, r in baseline['results'].items() if name in run['results']}
+    scale, groups, regressions, improvements, missing = compare(run, baseline, args.metric, args.threshold, args.floor_ms,
+                                                                not args.no_normalize)
+    print(f"{len(run['results'])} cases, {args.metric}, threshold {args.threshold:.0%} / {args.floor_ms} ms, "
+          f"machine {scale - 1.0:+.1%} vs baseline")
+    slow_groups = [group for group, ratio in groups.items() if ratio > 1.0 + args.threshold]
+    for group, ratio in sorted(groups.items()):
+        label = 'REGRESSION' if group in slow_groups else 'group'
+        print(f"{label:>10} {group:>40} geomean {ratio - 1.0:+.1%}")
+    case_label = 'REGRESSION' if args.strict else 'slower'
+    for label, rows in ((case_label, regressions), ('faster', improvements)):
+        for name, old, new, ratio in rows:
+            print(f"{label:>10} {name:>40} {old:.4f} -> {new:.4f} ms ({ratio - 1.0:+.0%})")
+    for name in missing:
+        print(f"{'missing':>10} {name:>40}")
+    if baseline.get('machine') != run['machine']:
+        print("note: baseline was recorded on a different machine or library version", file=sys.stderr)
+    sys.exit(1 if slow_groups or missing or (args.strict and regressions) else 0)
+
+
+if __name__ == '__main__':
+    main()
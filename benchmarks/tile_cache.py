@@ -0,0 +1,89 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from software_engine import SoftwareEngine, LENS_CIRCLE
+from tile_cache import TileCache
+
+SCREEN = (1920, 1080)
+
+
+def scenes(rng):
+    base = rng.integers(0, 256, (SCREEN[1], SCREEN[0], 4), dtype=np.uint8)
+    cx, cy = SCREEN[0] // 2, SCREEN[1] // 2
+
+    def static(i):
+        return base
+
+    def sprite(i):
+        # A 24 px target drifting through the middle of the scope
+        frame = base.copy()
+        x = cx - 60 + (i * 3) % 120
+        frame[cy - 12:cy + 12, x:x + 24] = (0, 0, 255, 255)
+        return frame
+
+    def moving(i):
+        # Camera pan: every source pixel changes every frame
+        return np.roll(base, i * 2, axis=1)
+
+    return {'static': static, 'sprite': sprite, 'moving': moving}
+
+
+def measure(engine, make_frame, frames, cached):
+    # Frames are built up front so only the render pipeline is timed
+    inputs = [make_frame(i) for i in range(frames)]
+    cache = TileCache() if cached else None
+    out = np.zeros((engine.lens_size, engine.lens_size, 4), dtype=np.uint8)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for frame in inputs:
+        if cache:
+            cache.render(engine, frame, (0, 0), out)
+        else:
+            engine.render(frame, (0, 0), out=out)
+    result = {
+        'cpu_ms_per_frame': (time.process_time() - cpu) * 1000.0 / frames,
+        'wall_ms_per_frame': (time.perf_counter() - wall) * 1000.0 / frames
+    }
+    if cache:
+        result.update(cache.stats())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU saved by tile change detection on static and moving content")
+    parser.add_argument('--lens', type=int, default=600)
+    parser.add_argument('--zoom', type=float, default=3.0)
+    parser.add_argument('--kernel', default='nearest')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    engine = SoftwareEngine(*SCREEN)
+    engine.configure(args.lens, args.zoom, LENS_CIRCLE, args.kernel)
+    results = {}
+    for name, make_frame in scenes(np.random.default_rng(0)).items():
+        plain = measure(engine, make_frame, args.frames, cached=False)
+        cached = measure(engine, make_frame, args.frames, cached=True)
+        saved = 1.0 - cached['cpu_ms_per_frame'] / plain['cpu_ms_per_frame'] if plain['cpu_ms_per_frame'] else 0.0
+        results[name] = {'plain': plain, 'cached': cached, 'cpu_saved': saved}
+
+    if args.json:
+        print(json.dumps({'lens': args.lens, 'zoom': args.zoom, 'kernel': args.kernel, 'scenes': results}, indent=2))
+        return
+    print(f"lens {args.lens}px, zoom {args.zoom}x, kernel {args.kernel}, {args.frames} frames")
+    print(f"{'scene':>8} {'plain ms':>9} {'cached ms':>10} {'saved':>7} {'skipped':>8} {'partial':>8} {'full':>5}")
+    for name, r in results.items():
+        c = r['cached']
+        print(f"{name:>8} {r['plain']['cpu_ms_per_frame']:>9.3f} {c['cpu_ms_per_frame']:>10.3f} {r['cpu_saved']:>7.0%} "
+              f"{c['tile_frames_skipped']:>8} {c['tile_frames_partial']:>8} {c['tile_frames_full']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import _percentile
+from software_engine import SoftwareEngine, LENS_CIRCLE
+from x11_backend import XDisplay, XShmCapture, ShapedOverlay
+
+
+def start_xvfb(display, geometry):
+    xvfb = shutil.which('Xvfb')
+    if not xvfb:
+        raise SystemExit("no DISPLAY set and Xvfb is not installed")
+    process = subprocess.Popen([xvfb, display, '-screen', '0', geometry, '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            XDisplay(display).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit(f"Xvfb exited with status {process.returncode}")
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit("Xvfb did not come up")
+
+
+def summarize(times):
+    values = sorted(times)
+    return {
+        'mean': sum(values) / len(values),
+        'p50': _percentile(values, 50),
+        'p95': _percentile(values, 95),
+        'p99': _percentile(values, 99),
+        'max': values[-1]
+    }
+
+
+def run(display_name, lens_size, zoom, kernel, frames, warmup):
+    display = XDisplay(display_name)
+    capture = XShmCapture(display)
+    overlay = ShapedOverlay(display)
+    engine = SoftwareEngine(*capture.screen_size())
+    engine.configure(lens_size, zoom, LENS_CIRCLE, kernel)
+    stages = {'capture': [], 'render': [], 'present': []}
+    try:
+        rect = engine.source_rect()
+        capture.pick_source(rect, exclude=(overlay.window,))
+        for i in range(warmup + frames):
+            start = time.perf_counter()
+            frame = capture.grab(rect)
+            captured = time.perf_counter()
+            image = engine.render(frame, origin=rect[:2], out=overlay.buffer(lens_size, lens_size))
+            rendered = time.perf_counter()
+            overlay.present(image, engine.mask)
+            presented = time.perf_counter()
+            if i >= warmup:
+                stages['capture'].append((captured - start) * 1000.0)
+                stages['render'].append((rendered - captured) * 1000.0)
+                stages['present'].append((presented - rendered) * 1000.0)
+    finally:
+        overlay.close()
+        capture.close()
+        display.close()
+    return {name: summarize(times) for name, times in stages.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture and present timings for the X11 backend")
+    parser.add_argument('--display', help="X display to use (default: $DISPLAY, else a private Xvfb)")
+    parser.add_argument('--geometry', default='1920x1080x24', help="Xvfb screen geometry")
+    parser.add_argument('--sizes', default='300,600,1000', help="comma-separated lens sizes")
+    parser.add_argument('--zoom', type=float, default=3.0)
+    parser.add_argument('--kernel', default='nearest')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    xvfb = None
+    display = args.display or os.environ.get('DISPLAY')
+    if not display:
+        display = ':99'
+        xvfb = start_xvfb(display, args.geometry)
+    try:
+        results = {}
+        for size in (int(s) for s in args.sizes.split(',')):
+            results[size] = run(display, size, args.zoom, args.kernel, args.frames, args.warmup)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+            xvfb.wait()
+
+    if args.json:
+        print(json.dumps({'display': display, 'zoom': args.zoom, 'kernel': args.kernel, 'lens': results}, indent=2))
+        return
+    print(f"display {display}, zoom {args.zoom}x, kernel {args.kernel}, {args.frames} frames")
+    print(f"{'lens':>6} {'stage':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for size, stages in results.items():
+        for name, s in stages.items():
+            print(f"{size:>6} {name:>8} {s['mean']:>8.3f} {s['p50']:>8.3f} {s['p95']:>8.3f} {s['p99']:>8.3f} {s['max']:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
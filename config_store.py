@@ -0,0 +1,327 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CONFIG_VERSION = 1
+
+FPS_VALUES = [30, 60, 75, 120, 144, 240]
+
+# Same names as resample.KERNELS and filters.CVD_MODES, repeated so loading the config does not import NumPy
+RESAMPLE_KERNELS = ('nearest', 'bilinear', 'pixel_art')
+COLOR_FILTERS = ('none', 'protanopia', 'deuteranopia', 'tritanopia')
+# What the lens magnifies, in TrackMode order (display_geometry.h)
+TRACK_MODES = ('monitor', 'cursor', 'point')
+
+# HotkeyAction codes (hotkeys.h) by config name
+HOTKEY_ACTIONS = {
+    'toggle': 1,
+    'zoom_in': 2,
+    'zoom_out': 3,
+    'zoom_preset': 4,
+    'lens_step': 5,
+    'cycle_shape': 6
+}
+
+# Highest key code a binding can hold, by the platform it was recorded on:
+# Windows virtual keys (with the wheel at 0x200/0x201), or X11 keysyms, which
+# is what nativeVirtualKey reports there
+KEY_CODE_MAX = {'win32': 0x201, 'x11': 0x1FFFFFFF}
+KEY_PLATFORM = 'x11' if sys.platform.startswith('linux') else 'win32'
+KEY_FIELDS = ('toggle_key', 'zoom_in_key', 'zoom_out_key')
+
+NO_MODIFIERS = {'ctrl': False, 'shift': False, 'alt': False}
+CTRL = {'ctrl': True, 'shift': False, 'alt': False}
+
+
+def _int_range(low, high):
+    def check(value):
+        return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+    return check
+
+
+def _float_range(low, high):
+    def check(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+    return check
+
+
+def _one_of(choices):
+    return lambda value: value in choices
+
+
+def _boolean(value):
+    return isinstance(value, bool)
+
+
+def _modifiers(value):
+    return isinstance(value, dict) and set(value) <= set(NO_MODIFIERS) and all(isinstance(v, bool) for v in value.values())
+
+
+# Any platform's key code; validate_config narrows it to the recording platform's
+_key_code = _int_range(0x01, max(KEY_CODE_MAX.values()))
+
+
+def _hotkey(item, key_code=_key_code):
+    # What DllBackend.set_hotkeys can pass to AddHotkey; param is a zoom or a lens size step
+    return (isinstance(item, dict) and key_code(item.get('key')) and
+            isinstance(item.get('action'), str) and item['action'] in HOTKEY_ACTIONS and
+            _modifiers(item.get('modifiers', {})) and _float_range(-1000.0, 1000.0)(item.get('param', 0.0)))
+
+
+def _hotkey_list(value):
+    # Entries are checked one by one in validate_config
+    return isinstance(value, list)
+
+
+MAX_LENSES = 4
+
+# Per-lens keys. The primary lens uses them at the top level of the config
+# (hotkeys and the DLL engine act on it); extra lenses are entries of
+# extra_lenses and also carry an offset of their centre from the screen centre.
+LENS_SCHEMA = {
+    "lens_size": (300, _int_range(50, 1000)),
+    "zoom_factor": (3.0, _float_range(1.0, 10.0)),
+    "lens_shape": (0, _one_of((0, 1))),
+    "resample_kernel": ('nearest', _one_of(RESAMPLE_KERNELS)),
+    "offset_x": (0, _int_range(-4000, 4000)),
+    "offset_y": (0, _int_range(-4000, 4000))
+}
+
+
+def _lens_list(value):
+    return (isinstance(value, list) and len(value) < MAX_LENSES and
+            all(isinstance(item, dict) and set(item) == set(LENS_SCHEMA) and
+                all(check(item[key]) for key, (_, check) in LENS_SCHEMA.items()) for item in value))
+
+
+def default_lens(**overrides):
+    return dict({key: default for key, (default, _) in LENS_SCHEMA.items()}, **overrides)
+
+
+# key: (default, validator). The single source of defaults for load_config.
+SCHEMA = {
+    "lens_size": LENS_SCHEMA["lens_size"],
+    "zoom_factor": LENS_SCHEMA["zoom_factor"],
+    "key_platform": (KEY_PLATFORM, _one_of(tuple(KEY_CODE_MAX))),
+    "toggle_key": (0x05, _key_code),
+    "toggle_modifiers": (NO_MODIFIERS, _modifiers),
+    "zoom_in_key": (0x200, _key_code),
+    "zoom_in_modifiers": (CTRL, _modifiers),
+    "zoom_out_key": (0x201, _key_code),
+    "zoom_out_modifiers": (CTRL, _modifiers),
+    "lens_shape": LENS_SCHEMA["lens_shape"],
+    "fps": (60, _one_of(FPS_VALUES)),
+    "zoom_animation_ms": (120, _int_range(0, 1000)),
+    "track_mode": ('monitor', _one_of(TRACK_MODES)),
+    "track_monitor": (0, _int_range(0, 15)),
+    "track_x": (0, _int_range(-32768, 32767)),
+    "track_y": (0, _int_range(-32768, 32767)),
+    "resample_kernel": LENS_SCHEMA["resample_kernel"],
+    "skip_static": (True, _boolean),
+    "render_workers": (0, _one_of((0, 1, 2, 4, 8))),
+    "engine_process": (False, _boolean),
+    "control_server": (False, _boolean),
+    "trace_session": (False, _boolean),
+    "frame_budget_ms": (0.0, _float_range(0.0, 50.0)),
+    "cpu_budget_percent": (0, _int_range(0, 100)),
+    "filters_enabled": (False, _boolean),
+    "sharpen": (0.5, _float_range(0.0, 2.0)),
+    "contrast": (1.0, _float_range(0.5, 2.0)),
+    "gamma": (1.0, _float_range(0.5, 2.5)),
+    "color_filter": ('none', _one_of(COLOR_FILTERS)),
+    "extra_lenses": ([], _lens_list),
+    "hotkeys": ([], _hotkey_list)
+}
+
+
+class ConfigLoadError(Exception):
+    pass
+
+
+def _migrate_v0(cfg):
+    # Unversioned files written before the schema existed use the same keys
+    return cfg
+
+
+MIGRATIONS = {0: _migrate_v0}
+
+
+def default_config():
+    return {key: json.loads(json.dumps(default)) for key, (default, _) in SCHEMA.items()}
+
+
+def validate_config(raw):
+    cfg = dict(raw) if isinstance(raw, dict) else {}
+    version = cfg.pop("version", 0)
+    while version in MIGRATIONS and version < CONFIG_VERSION:
+        cfg = MIGRATIONS[version](cfg)
+        version += 1
+    result = default_config()
+    rejected = []
+    for key, (_, check) in SCHEMA.items():
+        if key not in cfg:
+            continue
+        if check(cfg[key]):
+            result[key] = cfg[key]
+        else:
+            rejected.append(key)
+    for key in ("toggle_modifiers", "zoom_in_modifiers", "zoom_out_modifiers"):
+        result[key] = dict(NO_MODIFIERS, **result[key])
+    key_code = _int_range(0x01, KEY_CODE_MAX[result["key_platform"]])
+    for key in KEY_FIELDS:
+        if not key_code(result[key]):
+            result[key] = SCHEMA[key][0]
+            rejected.append(key)
+    # A bad hotkey entry is dropped without losing the others
+    hotkeys = [item for item in result["hotkeys"] if _hotkey(item, key_code)]
+    if len(hotkeys) < len(result["hotkeys"]):
+        rejected.append("hotkeys")
+    result["hotkeys"] = hotkeys
+    return result, rejected
+
+
+class ConfigStore:
+    def __init__(self, path, debounce=0.5, on_error=None):
+        self.path = os.fspath(path)
+        self.debounce = debounce
+        self.on_error = on_error
+        self.values = default_config()
+        self.rejected = []
+        self.last_error = None
+        # Where an unreadable file is moved before the first write replaces it
+        self.backup_path = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.dirty = False
+        self.due = 0.0
+        self.written_version = 0
+        self.failed_version = 0
+        self.version = 0
+        self.closed = False
+        self.worker = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        except (OSError, ValueError) as e:
+            self.backup_path = self.path + '.bad'
+            self.last_error = ConfigLoadError(f"{os.path.basename(self.path)} is unreadable ({e}); using defaults, "
+                                              f"the old file is kept as {os.path.basename(self.backup_path)}")
+            if self.on_error:
+                self.on_error(self.last_error)
+            raw = {}
+        values, self.rejected = validate_config(raw)
+        if self.rejected:
+            self.last_error = ConfigLoadError(f"{os.path.basename(self.path)}: ignored invalid "
+                                              f"{', '.join(self.rejected)}")
+            if self.on_error:
+                self.on_error(self.last_error)
+        with self.lock:
+            self.values = values
+        return dict(values)
+
+    def get(self, key):
+        with self.lock:
+            return self.values[key]
+
+    def update(self, changes):
+        with self.lock:
+            changed = {key: value for key, value in changes.items() if key in SCHEMA and self.values.get(key) != value}
+            if not changed:
+                return False
+            self.values.update(changed)
+            self.version += 1
+            self.dirty = True
+            self.due = time.monotonic() + self.debounce
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='scope-z-config', daemon=True)
+                self.worker.start()
+            self.wakeup.notify()
+        return True
+
+    def flush(self, timeout=2.0):
+        # Pull the deadline in and wait until the worker has written the latest
+        # version; False if that write failed or did not finish in time
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            self.due = 0.0
+            self.wakeup.notify()
+            while self.written_version < self.version:
+                if self.failed_version >= self.version:
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.wakeup.wait(remaining)
+        return True
+
+    def close(self, timeout=2.0):
+        flushed = self.flush(timeout)
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify_all()
+        return flushed
+
+    def run(self):
+        with self.lock:
+            while not self.closed:
+                if not self.dirty:
+                    self.wakeup.wait()
+                    continue
+                delay = self.due - time.monotonic()
+                if delay > 0:
+                    self.wakeup.wait(delay)
+                    continue
+                snapshot = dict(self.values, version=CONFIG_VERSION)
+                version = self.version
+                self.dirty = False
+                self.lock.release()
+                try:
+                    error = self.write(snapshot)
+                except Exception as e:
+                    # Anything else (a value json cannot encode) fails this version
+                    # but must not end the worker, or flush and close wait out their timeout
+                    self.last_error = error = e
+                try:
+                    if error is not None and self.on_error:
+                        self.on_error(error)
+                except Exception:
+                    pass
+                finally:
+                    self.lock.acquire()
+                if error is None:
+                    self.written_version = version
+                else:
+                    self.failed_version = version
+                self.wakeup.notify_all()
+
+    def write(self, cfg):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(cfg, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self.backup_path:
+                    try:
+                        os.replace(self.path, self.backup_path)
+                    except FileNotFoundError:
+                        pass
+                    self.backup_path = None
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            self.last_error = e
+            return e
+        self.last_error = None
+        return None
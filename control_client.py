@@ -0,0 +1,153 @@
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import Client
+
+# Line protocol over a local socket (named pipe on Windows). Each message is
+# one UTF-8 line, framed by multiprocessing.connection's length prefix:
+#   get [key ...]            -> ok key=value ...
+#   set key=value ...        -> ok key=value ...   (all applied in one frame, or none)
+#   set key+=delta ...       relative zoom / lens_size / fps step
+#   subscribe                -> ok key=value ..., then one "state key=value ..." per change
+#   ping                     -> ok
+# Errors come back as "err <message>" and change nothing.
+KEYS = ('zoom', 'lens_size', 'shape', 'visible', 'fps')
+SHAPES = ('circle', 'rectangle')
+
+
+def control_address():
+    if sys.platform == 'win32':
+        import getpass
+        return rf'\\.\pipe\scope-z-control-{getpass.getuser()}'
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime, f'scope-z-control-{os.getuid()}.sock')
+
+
+def address_family(address):
+    return 'AF_PIPE' if address.startswith('\\\\') else 'AF_UNIX'
+
+
+def format_value(value):
+    return f'{value:g}' if isinstance(value, float) else str(value)
+
+
+def format_pairs(values):
+    return ' '.join(f'{key}={format_value(value)}' for key, value in values.items())
+
+
+def parse_value(key, text):
+    if key == 'shape':
+        return text
+    if key == 'zoom':
+        return float(text)
+    return int(text)
+
+
+def parse_pairs(words):
+    values = {}
+    for word in words:
+        key, _, text = word.partition('=')
+        if not text:
+            raise ValueError(f"expected key=value, got {word!r}")
+        values[key] = parse_value(key.rstrip('+'), text)
+    return values
+
+
+class ControlError(Exception):
+    pass
+
+
+class ControlClient:
+    # Synchronous client: one request in flight per connection, so keep one
+    # client per thread. Subscriptions use a connection of their own.
+    def __init__(self, address=None):
+        self.address = address or control_address()
+        self.conn = Client(self.address, family=address_family(self.address))
+        self.pending = None
+        # The state the last batch() was answered with
+        self.last_state = None
+
+    def request(self, line):
+        self.conn.send_bytes(line.encode())
+        reply = self.conn.recv_bytes().decode()
+        status, _, rest = reply.partition(' ')
+        if status != 'ok':
+            raise ControlError(rest)
+        return parse_pairs(rest.split()) if rest else {}
+
+    def get(self, *keys):
+        return self.request(' '.join(('get',) + keys))
+
+    def set(self, **values):
+        if self.pending is not None:
+            self.pending.update(values)
+            return None
+        return self.request('set ' + format_pairs(values))
+
+    def step(self, **deltas):
+        # e.g. step(zoom=0.5): relative to whatever the engine shows now
+        return self.request('set ' + ' '.join(f'{key}+={format_value(delta)}' for key, delta in deltas.items()))
+
+    @contextmanager
+    def batch(self):
+        # set() calls inside the block are sent as one command and land on the same frame
+        self.pending = {}
+        try:
+            yield self
+            values = self.pending
+        finally:
+            self.pending = None
+        if values:
+            self.last_state = self.request('set ' + format_pairs(values))
+
+    def ping(self):
+        start = time.perf_counter()
+        self.request('ping')
+        return (time.perf_counter() - start) * 1000.0
+
+    def subscribe(self):
+        # Yields the current state, then every change until the connection closes
+        conn = Client(self.address, family=address_family(self.address))
+        try:
+            conn.send_bytes(b'subscribe')
+            while True:
+                try:
+                    line = conn.recv_bytes().decode()
+                except EOFError:
+                    return
+                status, _, rest = line.partition(' ')
+                if status == 'err':
+                    raise ControlError(rest)
+                yield parse_pairs(rest.split())
+        finally:
+            conn.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    # python control_client.py set zoom=4 lens_size=400 | get zoom | step zoom=-0.5 | watch | ping
+    args = sys.argv[1:] or ['get']
+    with ControlClient() as client:
+        if args[0] == 'watch':
+            for state in client.subscribe():
+                print(format_pairs(state), flush=True)
+        elif args[0] == 'ping':
+            print(f'{client.ping():.3f} ms')
+        elif args[0] == 'step':
+            print(format_pairs(client.step(**parse_pairs(args[1:]))))
+        else:
+            print(format_pairs(client.request(' '.join(args))))
+
+
+if __name__ == '__main__':
+    main()
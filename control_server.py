@@ -0,0 +1,241 @@
+import os
+import queue
+import socket
+import threading
+from multiprocessing.connection import Listener, Client
+
+from config_store import SCHEMA, FPS_VALUES
+from control_client import KEYS, SHAPES, control_address, address_family, format_pairs, parse_pairs
+
+LIMITS = {'zoom': (1.0, 10.0), 'lens_size': (50, 1000)}
+# Messages a subscriber may have waiting before it is dropped for not reading
+SUBSCRIBER_BACKLOG = 64
+
+
+def _validate(key, value):
+    if key == 'zoom' and SCHEMA['zoom_factor'][1](value):
+        return value
+    if key == 'lens_size' and SCHEMA['lens_size'][1](value):
+        return value
+    if key == 'fps' and SCHEMA['fps'][1](value):
+        return value
+    if key == 'visible' and value in (0, 1):
+        return value
+    if key == 'shape' and value in SHAPES + ('0', '1'):
+        return SHAPES[int(value)] if value in ('0', '1') else value
+    raise ValueError(f"bad value for {key}: {value!r}")
+
+
+def resolve(changes, state):
+    # Absolute values for a batch of key=value / key+=delta pairs, validated
+    # as a whole before anything is applied
+    resolved = {}
+    for key, value in changes.items():
+        relative = key.endswith('+')
+        key = key.rstrip('+')
+        if key not in KEYS:
+            raise ValueError(f"unknown key {key!r}")
+        if relative:
+            if key == 'fps':
+                index = FPS_VALUES.index(state['fps']) if state['fps'] in FPS_VALUES else 0
+                value = FPS_VALUES[max(0, min(len(FPS_VALUES) - 1, index + int(value)))]
+            elif key in LIMITS:
+                low, high = LIMITS[key]
+                value = type(low)(max(low, min(high, state[key] + value)))
+            else:
+                raise ValueError(f"{key} has no relative form")
+        resolved[key] = _validate(key, value)
+    return resolved
+
+
+class Subscriber:
+    # A subscribed connection's outgoing messages. Only its writer thread
+    # sends on the connection, so publish (on the GUI thread) never waits for
+    # a client that stopped reading; the writer closes the connection.
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = queue.Queue(SUBSCRIBER_BACKLOG)
+        self.thread = threading.Thread(target=self.write_loop, name='scope-z-control-push', daemon=True)
+        self.thread.start()
+
+    def put(self, message):
+        # False if the client has fallen SUBSCRIBER_BACKLOG messages behind
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def write_loop(self):
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    return
+                self.conn.send_bytes(message)
+        except OSError:
+            pass
+        finally:
+            self.conn.close()
+
+    def stop(self):
+        with self.queue.mutex:
+            self.queue.queue.clear()
+        self.put(None)
+        if os.name != 'nt':
+            # A writer blocked on a full socket buffer only returns once the
+            # socket is shut down, and the serve thread and client then see EOF
+            try:
+                with socket.socket(fileno=os.dup(self.conn.fileno())) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class ControlServer:
+    # Local control endpoint for stream decks and scripts. get_state() returns
+    # the KEYS as a dict; apply(changes) takes resolved values for some of
+    # them, must apply them as one settings update and may be called from any
+    # connection thread. Subscribers are pushed each state that differs from
+    # the last one they saw.
+    def __init__(self, get_state, apply, address=None):
+        self.get_state = get_state
+        self.apply = apply
+        self.address = address or control_address()
+        self.listener = None
+        self.thread = None
+        self.closing = False
+        self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()
+        self.connections = set()
+        self.subscribers = {}
+        self.last_state = None
+        self.requests = 0
+
+    def start(self):
+        family = address_family(self.address)
+        if family == 'AF_UNIX' and os.path.exists(self.address):
+            try:
+                Client(self.address, family=family).close()
+            except OSError:
+                # Left behind by a process that did not shut down cleanly
+                os.unlink(self.address)
+            else:
+                raise OSError(f"another Scope Z is already listening on {self.address}")
+        self.listener = Listener(self.address, family=family)
+        if family == 'AF_UNIX':
+            os.chmod(self.address, 0o600)
+        self.thread = threading.Thread(target=self.accept_loop, name='scope-z-control', daemon=True)
+        self.thread.start()
+
+    def accept_loop(self):
+        while not self.closing:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self.closing:
+                    return
+                continue
+            if self.closing:
+                conn.close()
+                return
+            with self.lock:
+                self.connections.add(conn)
+            threading.Thread(target=self.serve, args=(conn,), name='scope-z-control-client', daemon=True).start()
+
+    def serve(self, conn):
+        subscriber = None
+        try:
+            while True:
+                line = conn.recv_bytes().decode(errors='replace')
+                if line.strip() == 'subscribe':
+                    subscriber = subscriber or self.subscribe(conn)
+                    continue
+                reply = self.handle(line).encode()
+                if subscriber is None:
+                    conn.send_bytes(reply)
+                elif not subscriber.put(reply):
+                    # Once subscribed the writer owns the connection; a client this far behind is dropped
+                    break
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.lock:
+                self.connections.discard(conn)
+            if subscriber is None:
+                conn.close()
+            else:
+                self.drop(conn, subscriber)
+
+    def handle(self, line):
+        words = line.split()
+        command = words[0] if words else ''
+        self.requests += 1
+        try:
+            if command == 'ping':
+                return 'ok'
+            if command == 'get':
+                state = self.get_state()
+                unknown = [key for key in words[1:] if key not in state]
+                if unknown:
+                    raise ValueError(f"unknown key {unknown[0]!r}")
+                return 'ok ' + format_pairs({key: state[key] for key in words[1:] or KEYS})
+            if command == 'set':
+                changes = parse_pairs(words[1:])
+                if not changes:
+                    raise ValueError("set needs at least one key=value")
+                # Relative steps from several clients must see each other's results
+                with self.apply_lock:
+                    state = self.apply(resolve(changes, self.get_state()))
+                self.publish(state)
+                return 'ok ' + format_pairs(state)
+            raise ValueError(f"unknown command {command!r}")
+        except Exception as e:
+            return f'err {e}'
+
+    def subscribe(self, conn):
+        # The current state is queued before any push can be
+        subscriber = Subscriber(conn)
+        with self.lock:
+            subscriber.put(('ok ' + format_pairs(self.get_state())).encode())
+            self.subscribers[conn] = subscriber
+        return subscriber
+
+    def drop(self, conn, subscriber):
+        with self.lock:
+            self.subscribers.pop(conn, None)
+        subscriber.stop()
+
+    def publish(self, state=None):
+        # Called by the owner whenever the engine state may have changed
+        state = state if state is not None else self.get_state()
+        with self.lock:
+            if state == self.last_state:
+                return
+            self.last_state = dict(state)
+            subscribers = list(self.subscribers.items())
+        message = ('state ' + format_pairs(state)).encode()
+        for conn, subscriber in subscribers:
+            if not subscriber.put(message):
+                self.drop(conn, subscriber)
+
+    def close(self):
+        if self.listener is None:
+            return
+        self.closing = True
+        try:
+            # accept() does not notice the listener closing; a throwaway connection wakes it
+            Client(self.address, family=address_family(self.address)).close()
+        except OSError:
+            pass
+        self.thread.join(1.0)
+        self.listener.close()
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+            self.subscribers.clear()
+            connections = [conn for conn in self.connections if all(s.conn is not conn for s in subscribers)]
+        for subscriber in subscribers:
+            subscriber.stop()
+        for conn in connections:
+            conn.close()
+        self.listener = None
@@ -0,0 +1,172 @@
+#pragma once
+
+#define DISPLAY_MAX_MONITORS 16
+
+struct MonitorRect {
+    int left, top, right, bottom;
+    bool primary;
+};
+
+// Writes up to max monitors to out and returns how many it wrote
+typedef int (*DisplayEnumFunc)(void* ctx, MonitorRect* out, int max);
+
+struct DisplayPlatform {
+    DisplayEnumFunc enumerate;
+    void* ctx;
+};
+
+// Monitor layout of the virtual desktop, enumerated once and kept until
+// invalidate() (WM_DISPLAYCHANGE) instead of requeried per frame. Monitors are
+// ordered primary first, then left to right and top to bottom, so an index
+// means the same monitor to the GUI as long as the layout does not change.
+// Not thread safe: invalidate from the engine thread's window procedure.
+class DisplayGeometry {
+public:
+    explicit DisplayGeometry(DisplayPlatform platform) : platform_(platform), count_(0), last_hit_(0), dirty_(true), refreshes_(0) {}
+
+    void invalidate() { dirty_ = true; }
+    bool stale() const { return dirty_; }
+    int count() const { return count_; }
+    unsigned refreshes() const { return refreshes_; }
+
+    // Returns true if the layout was enumerated again
+    bool refresh_if_stale() {
+        if (!dirty_) return false;
+        refresh();
+        return true;
+    }
+
+    void refresh() {
+        dirty_ = false;
+        refreshes_++;
+        last_hit_ = 0;
+        MonitorRect found[DISPLAY_MAX_MONITORS];
+        int n = platform_.enumerate(platform_.ctx, found, DISPLAY_MAX_MONITORS);
+        if (n > DISPLAY_MAX_MONITORS) n = DISPLAY_MAX_MONITORS;
+        if (n <= 0) {
+            // Mid mode change there can be nothing to enumerate; keep what we had
+            if (count_ > 0) return;
+            MonitorRect none = { 0, 0, 1, 1, true };
+            found[0] = none;
+            n = 1;
+        }
+        // Insertion sort: a handful of monitors, and the order has to be stable
+        for (int i = 1; i < n; i++) {
+            MonitorRect m = found[i];
+            int j = i - 1;
+            while (j >= 0 && before(m, found[j])) {
+                found[j + 1] = found[j];
+                j--;
+            }
+            found[j + 1] = m;
+        }
+        for (int i = 0; i < n; i++) monitors_[i] = found[i];
+        count_ = n;
+    }
+
+    // Out-of-range indices mean the primary monitor
+    const MonitorRect& monitor(int index) const {
+        return monitors_[index >= 0 && index < count_ ? index : 0];
+    }
+
+    // The monitor containing (x, y), or the nearest one for a point in a gap
+    // between monitors or off the desktop. A point usually stays on the
+    // monitor it was on, so that one is tried first.
+    int monitor_at(int x, int y) {
+        if (contains(monitors_[last_hit_], x, y)) return last_hit_;
+        for (int i = 0; i < count_; i++) {
+            if (contains(monitors_[i], x, y)) return last_hit_ = i;
+        }
+        long long best = -1;
+        for (int i = 0; i < count_; i++) {
+            const MonitorRect& m = monitors_[i];
+            long long dx = x < m.left ? m.left - x : (x >= m.right ? x - m.right + 1 : 0);
+            long long dy = y < m.top ? m.top - y : (y >= m.bottom ? y - m.bottom + 1 : 0);
+            long long distance = dx * dx + dy * dy;
+            if (best < 0 || distance < best) {
+                best = distance;
+                last_hit_ = i;
+            }
+        }
+        return last_hit_;
+    }
+
+private:
+    static bool contains(const MonitorRect& m, int x, int y) {
+        return x >= m.left && x < m.right && y >= m.top && y < m.bottom;
+    }
+
+    static bool before(const MonitorRect& a, const MonitorRect& b) {
+        if (a.primary != b.primary) return a.primary;
+        if (a.left != b.left) return a.left < b.left;
+        return a.top < b.top;
+    }
+
+    DisplayPlatform platform_;
+    MonitorRect monitors_[DISPLAY_MAX_MONITORS];
+    int count_;
+    int last_hit_;
+    bool dirty_;
+    unsigned refreshes_;
+};
+
+enum TrackMode {
+    TRACK_MONITOR = 0,  // centre of monitor x (0 is the primary)
+    TRACK_CURSOR,
+    TRACK_POINT         // the desktop point (x, y)
+};
+
+struct TrackTarget {
+    int mode;
+    int x, y;
+};
+
+struct TrackedView {
+    int cx, cy;             // centre of the magnified source
+    int lens_x, lens_y;     // top-left of the lens window
+    int monitor;
+};
+
+// Where the lens looks and where its window goes: centred on the target and
+// kept on the target's monitor. Per frame this is a few compares and adds.
+class SourceTracker {
+public:
+    SourceTracker() {
+        TrackTarget primary = { TRACK_MONITOR, 0, 0 };
+        target_ = primary;
+    }
+
+    void set_target(const TrackTarget& target) { target_ = target; }
+    const TrackTarget& target() const { return target_; }
+
+    void resolve(DisplayGeometry& displays, int cursor_x, int cursor_y, int lens_w, int lens_h, TrackedView* out) const {
+        int index;
+        if (target_.mode == TRACK_CURSOR) {
+            out->cx = cursor_x;
+            out->cy = cursor_y;
+            index = displays.monitor_at(cursor_x, cursor_y);
+        } else if (target_.mode == TRACK_POINT) {
+            out->cx = target_.x;
+            out->cy = target_.y;
+            index = displays.monitor_at(target_.x, target_.y);
+        } else {
+            index = target_.x >= 0 && target_.x < displays.count() ? target_.x : 0;
+            const MonitorRect& m = displays.monitor(index);
+            out->cx = (m.left + m.right) / 2;
+            out->cy = (m.top + m.bottom) / 2;
+        }
+        const MonitorRect& m = displays.monitor(index);
+        out->lens_x = clamp(out->cx - lens_w / 2, m.left, m.right - lens_w);
+        out->lens_y = clamp(out->cy - lens_h / 2, m.top, m.bottom - lens_h);
+        out->monitor = index;
+    }
+
+private:
+    // A lens bigger than the monitor is pinned to its top-left corner
+    static int clamp(int value, int low, int high) {
+        if (value > high) value = high;
+        return value < low ? low : value;
+    }
+
+    TrackTarget target_;
+};
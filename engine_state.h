@@ -0,0 +1,91 @@
+#pragma once
+#include <atomic>
+#include <cstring>
+
+enum EngineError {
+    ENGINE_OK = 0,
+    ENGINE_ERR_LOAD_MAGNIFICATION,
+    ENGINE_ERR_MAG_INITIALIZE,
+    ENGINE_ERR_HOST_WINDOW,
+    ENGINE_ERR_MAG_WINDOW,
+    ENGINE_ERR_HOOK,
+    ENGINE_ERR_RENDER
+};
+
+// Fixed layout shared with GUI.py (ScopeZState in backends.py). seq is a
+// seqlock: odd while the engine is writing, bumped to the next even value when
+// the block is consistent. Readers retry if seq changed or was odd.
+struct ScopeZState {
+    volatile unsigned int seq;
+    float zoom;
+    int lens_size;
+    int lens_shape;
+    int visible;
+    int running;
+    int error_code;
+    char error[116];
+};
+
+typedef void (*StateCallback)(unsigned int seq);
+
+class StatePublisher {
+public:
+    StatePublisher() : callback_(NULL) {
+        memset((void*)&block_, 0, sizeof(block_));
+    }
+
+    ScopeZState* block() { return &block_; }
+    void set_callback(StateCallback callback) { callback_.store(callback); }
+
+    // Publishes only when something changed; returns whether it did.
+    bool publish(float zoom, int lens_size, int lens_shape, bool visible, bool running) {
+        if (block_.seq != 0 && block_.zoom == zoom && block_.lens_size == lens_size &&
+            block_.lens_shape == lens_shape && block_.visible == (int)visible && block_.running == (int)running) {
+            return false;
+        }
+        begin_write();
+        block_.zoom = zoom;
+        block_.lens_size = lens_size;
+        block_.lens_shape = lens_shape;
+        block_.visible = visible;
+        block_.running = running;
+        end_write();
+        return true;
+    }
+
+    // Only a fatal error stops the engine; a warning (hooks that failed to
+    // install) is reported while the lens keeps running
+    void publish_error(int code, const char* message, bool fatal) {
+        begin_write();
+        block_.error_code = code;
+        if (fatal) block_.running = 0;
+        strncpy(block_.error, message, sizeof(block_.error) - 1);
+        block_.error[sizeof(block_.error) - 1] = '\0';
+        end_write();
+    }
+
+    void clear_error() {
+        if (block_.error_code == ENGINE_OK) return;
+        begin_write();
+        block_.error_code = ENGINE_OK;
+        block_.error[0] = '\0';
+        end_write();
+    }
+
+private:
+    void begin_write() {
+        block_.seq = block_.seq + 1;
+        std::atomic_thread_fence(std::memory_order_release);
+    }
+
+    void end_write() {
+        std::atomic_thread_fence(std::memory_order_release);
+        unsigned int seq = block_.seq + 1;
+        block_.seq = seq;
+        StateCallback callback = callback_.load();
+        if (callback) callback(seq);
+    }
+
+    ScopeZState block_;
+    std::atomic<StateCallback> callback_;
+};
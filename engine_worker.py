@@ -0,0 +1,485 @@
+import ctypes
+import json
+import multiprocessing
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+from backends import (MagnifierBackend, SoftwareBackend, DllBackend, GdiCapture, ScopeZState,
+                      read_state_block, write_state_block)
+from config_store import MAX_LENSES
+
+MAX_LENS_SIZE = 1000
+LENS_BYTES = MAX_LENS_SIZE * MAX_LENS_SIZE * 4
+HEADER_BYTES = 4096
+STATS_BYTES = 1 << 16
+STATS_OFFSET = HEADER_BYTES
+PIXELS_OFFSET = STATS_OFFSET + STATS_BYTES
+REGION_BYTES = PIXELS_OFFSET + MAX_LENSES * LENS_BYTES
+REGION_VERSION = 3
+
+STATS_INTERVAL = 0.5
+READY_TIMEOUT = 15.0
+# A frame read that keeps overlapping the worker's writes is retried this often
+FRAME_RETRY = 0.005
+COMMAND_TIMEOUT = 5.0
+# The supervisor gives up after this many crashes inside the window
+MAX_RESTARTS = 3
+RESTART_WINDOW = 30.0
+RESTART_BACKOFF = 0.5
+
+ENGINE_ERR_WORKER = 7
+
+
+class SharedLens(ctypes.Structure):
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('x', ctypes.c_int),
+        ('y', ctypes.c_int),
+        ('masked', ctypes.c_int),
+        # Bumped each time the lens image changes; the reader presents a slot
+        # whose seq differs from the one it presented last
+        ('frame_seq', ctypes.c_uint)
+    ]
+
+
+class SharedHeader(ctypes.Structure):
+    # Start of the shared region. state and the stats blob have their own
+    # seqlocks; frame_seq guards lens_count, lenses and the pixel slots.
+    _fields_ = [
+        ('version', ctypes.c_uint),
+        ('state', ScopeZState),
+        ('stats_seq', ctypes.c_uint),
+        ('stats_length', ctypes.c_uint),
+        ('frame_seq', ctypes.c_uint),
+        ('lens_count', ctypes.c_uint),
+        ('lenses', SharedLens * MAX_LENSES),
+        # Software renderer only: the governor's level, outside the ScopeZState layout
+        ('quality_level', ctypes.c_int)
+    ]
+
+
+class SharedRegion:
+    # State block, stats and one fixed pixel slot per lens in one shared
+    # memory segment. Created by the GUI, attached by the worker; pixels never
+    # travel over the command pipe.
+    def __init__(self, name=None):
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=REGION_BYTES)
+        self.owner = name is None
+        self.header = SharedHeader.from_buffer(self.shm.buf)
+        if self.owner:
+            self.header.version = REGION_VERSION
+        elif self.header.version != REGION_VERSION:
+            raise OSError(f"shared region version {self.header.version}, expected {REGION_VERSION}")
+        self.write_lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def lens_buffer(self, index, width, height):
+        import numpy as np
+        return np.ndarray((height, width, 4), dtype=np.uint8, buffer=self.shm.buf,
+                          offset=PIXELS_OFFSET + index * LENS_BYTES)
+
+    def write_state(self, state):
+        with self.write_lock:
+            self.header.quality_level = state.get('quality_level', 0)
+            write_state_block(self.header.state, state)
+
+    def read_state(self):
+        return dict(read_state_block(self.header.state), quality_level=self.header.quality_level)
+
+    def write_stats(self, stats):
+        data = json.dumps(stats).encode()[:STATS_BYTES]
+        header = self.header
+        header.stats_seq += 1
+        self.shm.buf[STATS_OFFSET:STATS_OFFSET + len(data)] = data
+        header.stats_length = len(data)
+        header.stats_seq += 1
+
+    def read_stats(self):
+        header = self.header
+        while True:
+            seq = header.stats_seq
+            if seq & 1:
+                time.sleep(0)
+                continue
+            data = bytes(self.shm.buf[STATS_OFFSET:STATS_OFFSET + header.stats_length])
+            if header.stats_seq == seq:
+                return json.loads(data) if data else {}
+
+    def begin_frame(self):
+        self.header.frame_seq += 1
+
+    def end_frame(self):
+        self.header.frame_seq += 1
+
+    def read_frames(self, presented):
+        # Copies out every lens image changed since the seqs in presented (one
+        # per slot), then records the new seqs there. Returns None without
+        # touching presented if the worker started a new frame meanwhile.
+        from software_engine import lens_mask
+        header = self.header
+        seq = header.frame_seq
+        if seq & 1:
+            return None
+        frames = []
+        seqs = []
+        for index in range(header.lens_count):
+            lens = header.lenses[index]
+            seqs.append(lens.frame_seq)
+            if lens.frame_seq == presented[index]:
+                frames.append(None)
+                continue
+            image = self.lens_buffer(index, lens.width, lens.height).copy()
+            mask = lens_mask(lens.width, 0) if lens.masked else None
+            frames.append((image, mask, (lens.x, lens.y)))
+        if header.frame_seq != seq:
+            return None
+        presented[:len(seqs)] = seqs
+        return frames
+
+    def recover(self):
+        # A worker killed mid-write leaves a seq odd; even them out for the next one
+        header = self.header
+        for block, field in ((header.state, 'seq'), (header, 'stats_seq'), (header, 'frame_seq')):
+            if getattr(block, field) & 1:
+                setattr(block, field, getattr(block, field) + 1)
+        header.lens_count = 0
+
+    def close(self):
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedFrameBackend(SoftwareBackend):
+    # The software renderer inside the worker: lenses render straight into
+    # their shared slots and the GUI is told a frame is ready.
+    name = 'software'
+
+    def __init__(self, capture, region, notify):
+        super().__init__(capture, None)
+        self.region = region
+        self.notify = notify
+
+    def render_once(self):
+        region = self.region
+        lenses = self.lenses.lenses
+        rect = self.lenses.source_rect()
+        frame = self.capture.grab(rect)
+        buffers = [region.lens_buffer(i, lens.engine.lens_size, lens.engine.lens_size) for i, lens in enumerate(lenses)]
+        region.begin_frame()
+        try:
+            results = self.lenses.render(frame, rect[:2], buffers)
+            header = region.header
+            header.lens_count = len(lenses)
+            for shared, lens, (image, regions) in zip(header.lenses, lenses, results):
+                size = lens.engine.lens_size
+                x, y = lens.position()
+                shared.width, shared.height, shared.x, shared.y = size, size, x, y
+                shared.masked = int(lens.engine.mask is not None)
+                if regions != []:
+                    shared.frame_seq += 1
+        finally:
+            region.end_frame()
+        if any(regions != [] for _, regions in results):
+            self.notify(('frame',))
+        return results
+
+
+def create_worker_backend(kind, dll_path, region, notify):
+    if kind == 'x11':
+        from x11_backend import X11Backend
+        return X11Backend()
+    if kind == 'dll':
+        try:
+            return DllBackend(dll_path)
+        except OSError:
+            pass
+    return SharedFrameBackend(GdiCapture(), region, notify)
+
+
+def handle_command(backend, command, args):
+    if command == 'start':
+        backend.start(*args)
+        return True
+    if command == 'update':
+        backend.update(*args)
+        return True
+    if command == 'stop':
+        return bool(backend.stop())
+    if command == 'shutdown':
+        return bool(backend.shutdown(*args))
+    raise ValueError(f"unknown engine command {command!r}")
+
+
+def worker_main(conn, region_name, kind, dll_path=None):
+    # Runs in the worker process. The backend is created (DLL loaded, capture
+    # and windows set up) before anything is asked of it, so START only has
+    # to resume the engine.
+    region = SharedRegion(region_name)
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                pass
+
+    try:
+        backend = create_worker_backend(kind, dll_path, region, send)
+    except Exception as e:
+        send(('failed', f"{type(e).__name__}: {e}"))
+        region.close()
+        return
+
+    def on_state():
+        region.write_state(backend.get_state())
+        send(('state',))
+
+    backend.set_state_callback(on_state)
+    send(('ready', backend.name))
+    next_stats = 0.0
+    try:
+        while True:
+            if conn.poll(STATS_INTERVAL):
+                request_id, command, args = conn.recv()
+                try:
+                    result = (True, handle_command(backend, command, args))
+                except Exception as e:
+                    result = (False, f"{type(e).__name__}: {e}")
+                if request_id:
+                    send(('reply', request_id) + result)
+                if command == 'shutdown':
+                    break
+            now = time.monotonic()
+            if now >= next_stats:
+                region.write_stats(backend.get_stats())
+                next_stats = now + STATS_INTERVAL
+    except (EOFError, OSError):
+        # The GUI went away; take the engine down with us
+        backend.shutdown()
+    finally:
+        region.close()
+
+
+class ProcessBackend(MagnifierBackend):
+    # Runs one of the other backends in a worker process. Commands go over a
+    # pipe; state, stats and preview frames come back through SharedRegion.
+    # The worker is spawned (pre-warmed) on construction and restarted by the
+    # listener thread if it dies while the GUI still wants it.
+    name = 'process'
+
+    def __init__(self, kind, dll_path=None, present=None):
+        self.kind = kind
+        self.dll_path = None if dll_path is None else str(dll_path)
+        self.present = present
+        self.region = SharedRegion()
+        self.context = multiprocessing.get_context('spawn')
+        self.send_lock = threading.Lock()
+        self.replies = {}
+        self.next_id = 0
+        self.conn = None
+        self.process = None
+        self.ready = threading.Event()
+        self.worker_name = None
+        self.worker_error = None
+        self.settings = None
+        self.running = False
+        self.closing = False
+        self.crashes = deque()
+        self.restarts = 0
+        # Per lens slot, the frame_seq last handed to present
+        self.presented = [0] * MAX_LENSES
+        self.frames_behind = False
+        self.spawn()
+
+    def spawn(self):
+        parent, child = self.context.Pipe()
+        self.ready.clear()
+        self.worker_name = self.worker_error = None
+        process = self.context.Process(target=worker_main, args=(child, self.region.name, self.kind, self.dll_path),
+                                       name='scope-z-engine', daemon=True)
+        process.start()
+        # Only the worker may hold the child end, so its death shows up as EOF here
+        child.close()
+        self.conn, self.process = parent, process
+        threading.Thread(target=self.listen, args=(parent, process), name='scope-z-engine-listener', daemon=True).start()
+
+    def listen(self, conn, process):
+        while True:
+            try:
+                if self.frames_behind and not conn.poll(FRAME_RETRY):
+                    # The last read overlapped a frame; the worker may not send another soon
+                    self.dispatch(('frame',))
+                    continue
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            self.dispatch(message)
+        process.join(1.0)
+        if conn is self.conn and not self.closing:
+            self.on_worker_exit(process)
+
+    def dispatch(self, message):
+        kind = message[0]
+        if kind == 'reply':
+            waiter = self.replies.pop(message[1], None)
+            if waiter:
+                waiter[1] = message[2:]
+                waiter[0].set()
+        elif kind == 'frame':
+            if not self.present:
+                return
+            frames = self.region.read_frames(self.presented)
+            self.frames_behind = frames is None
+            if frames and any(frames):
+                self.present(frames)
+        elif kind == 'state':
+            if self.state_callback:
+                self.state_callback()
+        elif kind == 'ready':
+            self.worker_name = message[1]
+            self.ready.set()
+        elif kind == 'failed':
+            self.worker_error = message[1]
+            self.ready.set()
+
+    def fail_pending(self, error):
+        replies, self.replies = self.replies, {}
+        for waiter in replies.values():
+            waiter[1] = (False, error)
+            waiter[0].set()
+
+    def publish_error(self, error, running):
+        state = dict(self.region.read_state(), error_code=ENGINE_ERR_WORKER, error=error, running=int(running), visible=0)
+        self.region.write_state(state)
+        if self.state_callback:
+            self.state_callback()
+
+    def on_worker_exit(self, process):
+        # Supervisor: restart with backoff and resume if the engine was running
+        self.region.recover()
+        if self.worker_error:
+            # The worker reported why it could not start and exited cleanly;
+            # a new one would fail the same way, so this is not a crash
+            self.fail_pending(self.worker_error)
+            self.conn = None
+            self.running = False
+            self.publish_error(self.worker_error, running=False)
+            return
+        self.fail_pending(f"engine worker exited with code {process.exitcode}")
+        now = time.monotonic()
+        self.crashes.append(now)
+        while self.crashes and now - self.crashes[0] > RESTART_WINDOW:
+            self.crashes.popleft()
+        if len(self.crashes) > MAX_RESTARTS:
+            self.conn = None
+            self.running = False
+            self.publish_error("Engine worker keeps crashing; not restarting", running=False)
+            return
+        self.publish_error(f"Engine worker exited with code {process.exitcode}; restarting", running=self.running)
+        time.sleep(RESTART_BACKOFF * len(self.crashes))
+        if self.closing:
+            return
+        self.restarts += 1
+        self.spawn()
+        if self.running:
+            try:
+                self.wait_ready()
+                self.request('start', self.settings)
+            except OSError as e:
+                self.running = False
+                self.publish_error(str(e), running=False)
+
+    @property
+    def governed(self):
+        # Known once the worker is ready; only the DLL engine has no governor
+        return self.worker_name != 'dll'
+
+    def wait_ready(self):
+        if not self.ready.wait(READY_TIMEOUT):
+            raise OSError("engine worker did not start in time")
+        if self.worker_error:
+            raise OSError(self.worker_error)
+
+    def request(self, command, *args, wait=True, timeout=COMMAND_TIMEOUT):
+        with self.send_lock:
+            if self.conn is None:
+                raise OSError("engine worker is not running")
+            request_id = 0
+            if wait:
+                self.next_id += 1
+                request_id = self.next_id
+                waiter = [threading.Event(), None]
+                self.replies[request_id] = waiter
+            try:
+                self.conn.send((request_id, command, args))
+            except (OSError, ValueError) as e:
+                self.replies.pop(request_id, None)
+                raise OSError(f"engine worker unreachable: {e}")
+        if not wait:
+            return None
+        if not waiter[0].wait(timeout):
+            self.replies.pop(request_id, None)
+            raise OSError(f"engine worker did not answer {command!r} in time")
+        ok, value = waiter[1]
+        if not ok:
+            raise OSError(value)
+        return value
+
+    def start(self, settings):
+        if self.conn is None and not self.closing:
+            # The supervisor gave up earlier; START is an explicit retry
+            self.crashes.clear()
+            self.spawn()
+        self.wait_ready()
+        self.settings = settings
+        self.request('start', settings)
+        self.running = True
+
+    def update(self, settings):
+        self.settings = settings
+        self.request('update', settings, wait=False)
+
+    def stop(self):
+        self.running = False
+        try:
+            return bool(self.request('stop'))
+        except OSError:
+            return False
+
+    def shutdown(self, timeout=1.0):
+        self.closing = True
+        self.running = False
+        stopped = True
+        try:
+            self.request('shutdown', timeout, timeout=timeout + 1.0)
+        except OSError:
+            stopped = False
+        if self.process:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout)
+                stopped = False
+        if self.conn:
+            self.conn.close()
+        self.conn = None
+        self.region.close()
+        return stopped
+
+    def get_state(self):
+        return self.region.read_state()
+
+    def get_stats(self):
+        return dict(self.region.read_stats(), worker=self.worker_name, worker_restarts=self.restarts)
+
+    def get_zoom(self):
+        return self.get_state()['zoom']
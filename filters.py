@@ -0,0 +1,249 @@
+import functools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+CVD_NONE = 'none'
+CVD_MODES = (CVD_NONE, 'protanopia', 'deuteranopia', 'tritanopia')
+
+# Rows per chunk: every stage runs on one chunk while it is still in cache
+# before the next chunk is read, so the frame buffer is streamed through once
+FILTER_CHUNK_PIXELS = 32768
+
+# Dichromat simulation in linear RGB (Vienot et al. 1999; tritan after Brettel)
+_SIMULATION = {
+    'protanopia': ((0.11238, 0.88762, 0.0), (0.11238, 0.88762, 0.0), (0.00401, -0.00401, 1.0)),
+    'deuteranopia': ((0.29275, 0.70725, 0.0), (0.29275, 0.70725, 0.0), (-0.02234, 0.02234, 1.0)),
+    'tritanopia': ((1.0, 0.14461, -0.14461), (0.0, 0.85924, 0.14076), (0.0, 0.85924, 0.14076))
+}
+# Where the lost contrast is moved to (daltonization error shift)
+_SHIFT = {
+    'protanopia': ((0.0, 0.0, 0.0), (0.7, 1.0, 0.0), (0.7, 0.0, 1.0)),
+    'deuteranopia': ((0.0, 0.0, 0.0), (0.7, 1.0, 0.0), (0.7, 0.0, 1.0)),
+    'tritanopia': ((1.0, 0.0, 0.7), (0.0, 1.0, 0.7), (0.0, 0.0, 0.0))
+}
+
+LINEAR_BITS = 12
+LINEAR_MAX = (1 << LINEAR_BITS) - 1
+
+
+def expand_region(region, halo, size):
+    if region is None or not halo:
+        return region
+    top, bottom, left, right = region
+    return max(top - halo, 0), min(bottom + halo, size), max(left - halo, 0), min(right + halo, size)
+
+
+def _srgb_to_linear(v):
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(v):
+    return np.where(v <= 0.0031308, v * 12.92, 1.055 * v ** (1 / 2.4) - 0.055)
+
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+
+
+@functools.lru_cache(maxsize=32)
+def tone_curve(contrast, gamma):
+    # Contrast about mid grey, then gamma, as values in 0..1 for each byte value
+    v = np.arange(256, dtype=np.float64) / 255.0
+    v = np.clip((v - 0.5) * contrast + 0.5, 0.0, 1.0)
+    return v ** (1.0 / gamma)
+
+
+@functools.lru_cache(maxsize=32)
+def byte_lut(contrast, gamma):
+    lut = np.rint(tone_curve(contrast, gamma) * 255.0).astype(np.uint8)
+    _read_only(lut)
+    return lut
+
+
+@functools.lru_cache(maxsize=32)
+def word_lut(contrast, gamma):
+    # The byte table applied two bytes at a time, through the uint16 halves of each pixel
+    lut = byte_lut(contrast, gamma).astype(np.uint16)
+    index = np.arange(65536)
+    table = lut[index & 0xFF] | (lut[index >> 8] << 8)
+    _read_only(table)
+    return table
+
+
+def _encode(linear):
+    return np.rint(_linear_to_srgb(np.clip(linear, 0.0, 1.0)) * 255.0).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=32)
+def cvd_plan(contrast, gamma, mode):
+    # The daltonize matrix is linear in linear light, so each output channel
+    # is sum_j C[i][j] * linear(tone(in_j)). Every matrix row has at most
+    # three non-zero terms: one term is a 256-entry table, two inputs are
+    # folded into one 65536-entry table indexed by both bytes, and a third
+    # adds a 256-entry table before one clip and sRGB encode table.
+    simulate = np.array(_SIMULATION[mode])
+    matrix = np.eye(3) + np.array(_SHIFT[mode]) @ (np.eye(3) - simulate)
+    # Matrix rows and columns are R, G, B; BGRA bytes are B, G, R
+    matrix = matrix[::-1, ::-1]
+    linear = _srgb_to_linear(tone_curve(contrast, gamma))
+    index = np.arange(65536)
+    plan = []
+    for row in matrix:
+        columns = [j for j in range(3) if abs(row[j]) > 1e-6]
+        if len(columns) == 1:
+            tables = (_encode(row[columns[0]] * linear),)
+        elif len(columns) == 2:
+            a, b = columns
+            tables = (_encode(row[a] * linear[index & 0xFF] + row[b] * linear[index >> 8]),)
+        else:
+            a, b, c = columns
+            pair = row[a] * linear[index & 0xFF] + row[b] * linear[index >> 8]
+            tables = (np.rint(pair * LINEAR_MAX).astype(np.int32), np.rint(row[c] * linear * LINEAR_MAX).astype(np.int32))
+        _read_only(*tables)
+        plan.append((tuple(columns), tables))
+    encode = _encode(np.arange(LINEAR_MAX + 1) / LINEAR_MAX)
+    _read_only(encode)
+    return tuple(plan), encode
+
+
+def _byte_pair(words, a, b):
+    # Bytes a and b of each BGRA word as the index byte_a | byte_b << 8
+    if b == a + 1:
+        return (words >> (8 * a)) & 0xFFFF
+    low = (words >> (8 * a)) & 0xFF
+    low |= (words >> (8 * b - 8)) & 0xFF00
+    return low
+
+
+def _halo_block(src, top, bottom, left, right):
+    # Rows top-1..bottom and columns left-1..right as int16, edges replicated
+    height, width = src.shape[:2]
+    block = src[max(top - 1, 0):min(bottom + 1, height), max(left - 1, 0):min(right + 1, width)].astype(np.int16)
+    pad = ((int(top == 0), int(bottom == height)), (int(left == 0), int(right == width)), (0, 0))
+    if any(before or after for before, after in pad):
+        block = np.pad(block, pad, mode='edge')
+    return block
+
+
+def sharpen_rows(src, top, bottom, left, right, amount_q6):
+    # Unsharp mask with the separable [1 2 1] kernel on each axis, all in
+    # int16: the detail term is cut to 8 bits before it is scaled by amount.
+    block = _halo_block(src, top, bottom, left, right)
+    horizontal = block[:, :-2] + block[:, 2:]
+    horizontal += block[:, 1:-1]
+    horizontal += block[:, 1:-1]
+    blurred = horizontal[:-2] + horizontal[2:]
+    blurred += horizontal[1:-1]
+    blurred += horizontal[1:-1]
+    centre = block[1:-1, 1:-1]
+    # The kernel sums to 16
+    detail = centre * 16
+    detail -= blurred
+    detail >>= 4
+    detail *= amount_q6
+    detail >>= 6
+    detail += centre
+    np.clip(detail, 0, 255, out=detail)
+    return detail.astype(np.uint8)
+
+
+class FilterChain:
+    # Post-processing on the scaled lens image. Tone (contrast, gamma) and the
+    # colour-vision remap are folded into lookup tables, so a frame costs at
+    # most two stages, sharpen and one table pass, run chunk by chunk.
+    def __init__(self):
+        self.sharpen = 0.0
+        self.contrast = 1.0
+        self.gamma = 1.0
+        self.cvd = CVD_NONE
+        self.key = None
+        # Per-stage milliseconds of the current frame (bands and lenses add up), then per frame
+        self.frame_ms = {'sharpen': 0.0, 'color': 0.0}
+        self.stage_times = {stage: deque(maxlen=1000) for stage in self.frame_ms}
+        self.lock = threading.Lock()
+
+    def configure(self, sharpen=0.0, contrast=1.0, gamma=1.0, cvd=CVD_NONE):
+        if cvd not in CVD_MODES:
+            raise ValueError(f"unknown colour filter {cvd!r}")
+        self.sharpen = float(sharpen)
+        self.contrast = float(contrast)
+        self.gamma = float(gamma)
+        self.cvd = cvd
+        self.key = (self.sharpen, self.contrast, self.gamma, self.cvd)
+
+    @property
+    def has_color(self):
+        return self.contrast != 1.0 or self.gamma != 1.0 or self.cvd != CVD_NONE
+
+    @property
+    def active(self):
+        return self.sharpen > 0.0 or self.has_color
+
+    @property
+    def halo(self):
+        # How far a pixel's neighbours reach into its filtered value
+        return 1 if self.sharpen > 0.0 else 0
+
+    def apply(self, src, out, region=None):
+        # Reads the scaled image src and writes region of out; src and out must not alias
+        height, width = src.shape[:2]
+        top, bottom, left, right = region if region is not None else (0, height, 0, width)
+        if bottom <= top or right <= left:
+            return out
+        if not (src.ndim == 3 and src.shape[2] == 4 and src.dtype == np.uint8):
+            out[top:bottom, left:right] = src[top:bottom, left:right]
+            return out
+        amount_q6 = int(round(self.sharpen * 64))
+        lut = word_lut(self.contrast, self.gamma) if self.cvd == CVD_NONE and self.has_color else None
+        plan = cvd_plan(self.contrast, self.gamma, self.cvd) if self.cvd != CVD_NONE else None
+        chunk = max(1, FILTER_CHUNK_PIXELS // (right - left))
+        sharpen_time = color_time = 0.0
+        for y in range(top, bottom, chunk):
+            end = min(y + chunk, bottom)
+            target = out[y:end, left:right]
+            start = time.perf_counter()
+            if amount_q6:
+                pixels = sharpen_rows(src, y, end, left, right, amount_q6)
+            else:
+                pixels = src[y:end, left:right]
+            middle = time.perf_counter()
+            sharpen_time += middle - start
+            if lut is not None:
+                np.take(lut, pixels.view(np.uint16), out=target.view(np.uint16))
+            elif plan is not None:
+                self.apply_cvd(pixels, target, *plan)
+            else:
+                target[...] = pixels
+            color_time += time.perf_counter() - middle
+        with self.lock:
+            self.frame_ms['sharpen'] += sharpen_time * 1000.0
+            self.frame_ms['color'] += color_time * 1000.0
+        return out
+
+    def end_frame(self):
+        with self.lock:
+            if self.sharpen > 0.0:
+                self.stage_times['sharpen'].append(self.frame_ms['sharpen'])
+            if self.has_color:
+                self.stage_times['color'].append(self.frame_ms['color'])
+            self.frame_ms = dict.fromkeys(self.frame_ms, 0.0)
+
+    def apply_cvd(self, pixels, target, plan, encode):
+        words = np.ascontiguousarray(pixels).view(np.uint32)[..., 0]
+        for channel, (columns, tables) in enumerate(plan):
+            if len(columns) == 1:
+                index = (words >> (8 * columns[0])) & 0xFF
+            else:
+                index = _byte_pair(words, columns[0], columns[1])
+            if len(tables) == 1:
+                target[..., channel] = np.take(tables[0], index)
+                continue
+            linear = np.take(tables[0], index)
+            linear += np.take(tables[1], (words >> (8 * columns[2])) & 0xFF)
+            np.clip(linear, 0, LINEAR_MAX, out=linear)
+            target[..., channel] = np.take(encode, linear)
+        target[..., 3] = pixels[..., 3]
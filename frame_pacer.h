@@ -0,0 +1,88 @@
+#pragma once
+
+typedef double (*PacerNowFunc)(void* ctx);
+// Returns false to abandon the wait, e.g. when the loop is being suspended.
+typedef bool (*PacerWaitFunc)(void* ctx, double timeout_ms);
+
+struct PacerPlatform {
+    PacerNowFunc now_ms;
+    PacerWaitFunc wait_ms;
+    void* ctx;
+};
+
+struct PacerCounters {
+    unsigned long long frames;
+    unsigned long long late_frames;
+    unsigned long long missed_deadlines;
+    double last_lateness_ms;
+    double max_lateness_ms;
+};
+
+// Paces a loop on an absolute deadline grid: deadline n is epoch + n * period.
+// A late frame runs immediately and the grid is kept, so there is no drift;
+// whole periods that were overrun are dropped and counted as missed.
+class FramePacer {
+public:
+    FramePacer(PacerPlatform platform, int fps)
+        : platform_(platform), period_ms_(1000.0 / clamp_fps(fps)), late_tolerance_ms_(0.5) {
+        reset();
+    }
+
+    void reset() {
+        epoch_ms_ = platform_.now_ms(platform_.ctx);
+        slot_ = 0;
+        counters_ = PacerCounters();
+    }
+
+    void set_fps(int fps) {
+        double period = 1000.0 / clamp_fps(fps);
+        if (period == period_ms_) return;
+        epoch_ms_ = next_deadline();
+        slot_ = 0;
+        period_ms_ = period;
+    }
+
+    double period_ms() const { return period_ms_; }
+    double next_deadline() const { return epoch_ms_ + slot_ * period_ms_; }
+    const PacerCounters& counters() const { return counters_; }
+
+    // Blocks until the next frame is due. The platform wait may return early
+    // (e.g. to service window messages); it is simply called again. Returns
+    // false without counting a frame if the platform wait asked to abandon it.
+    bool wait_for_frame() {
+        double deadline = next_deadline();
+        double now = platform_.now_ms(platform_.ctx);
+        while (now < deadline) {
+            if (!platform_.wait_ms(platform_.ctx, deadline - now)) return false;
+            now = platform_.now_ms(platform_.ctx);
+        }
+
+        double lateness = now - deadline;
+        if (lateness >= period_ms_) {
+            unsigned long long skipped = (unsigned long long)(lateness / period_ms_);
+            counters_.missed_deadlines += skipped;
+            slot_ += skipped;
+            lateness -= skipped * period_ms_;
+        }
+        if (lateness > late_tolerance_ms_) counters_.late_frames++;
+        if (lateness > counters_.max_lateness_ms) counters_.max_lateness_ms = lateness;
+        counters_.last_lateness_ms = lateness;
+        counters_.frames++;
+        slot_++;
+        return true;
+    }
+
+private:
+    static int clamp_fps(int fps) {
+        if (fps < 1) return 1;
+        if (fps > 1000) return 1000;
+        return fps;
+    }
+
+    PacerPlatform platform_;
+    double period_ms_;
+    double late_tolerance_ms_;
+    double epoch_ms_;
+    unsigned long long slot_;
+    PacerCounters counters_;
+};
@@ -0,0 +1,158 @@
+import collections
+from collections import deque
+
+from config_store import FPS_VALUES
+from resample import NEAREST
+
+Quality = collections.namedtuple('Quality', 'specs fps filters')
+
+# The governor never goes below this rate, even past the lowest FPS_VALUES entry
+MIN_FPS = 15
+# Frames per measurement window; decisions are only taken at window ends
+WINDOW_FRAMES = 30
+# A window over budget steps down at once. Stepping up needs UP_WINDOWS calm
+# windows in a row and a predicted load under UP_TARGET at the better level.
+UP_WINDOWS = 3
+UP_TARGET = 0.85
+# Load ratio assumed for a level that was never measured
+DEFAULT_STEP_RATIO = 1.5
+# A step up undone within this many windows doubles the wait before the next try
+BOUNCE_WINDOWS = 4
+MAX_UP_WINDOWS = 240
+
+
+def quality_ladder(quality, rates=True):
+    # Cheapest loss first: post-processing, then smooth scaling, then frame
+    # rate. Each rung keeps the reductions of the ones above it. A lower rate
+    # saves CPU but not time per frame, so rates=False leaves those rungs out.
+    ladder = [('full quality', quality)]
+    if quality.filters:
+        quality = quality._replace(filters=())
+        ladder.append(('filters off', quality))
+    if any(spec.kernel != NEAREST for spec in quality.specs):
+        quality = quality._replace(specs=tuple(spec._replace(kernel=NEAREST) for spec in quality.specs))
+        ladder.append(('nearest scaling', quality))
+    rungs = {fps for fps in FPS_VALUES + [MIN_FPS] if MIN_FPS <= fps < quality.fps} if rates else ()
+    for fps in sorted(rungs, reverse=True):
+        quality = quality._replace(fps=fps)
+        ladder.append((f'{fps} fps', quality))
+    return ladder
+
+
+class QualityGovernor:
+    # Keeps the software renderer inside a frame-time and/or CPU budget by
+    # walking quality_ladder. Load is the measured cost over the budget (1.0
+    # is exactly on budget) for whichever budget is tighter. Pure bookkeeping:
+    # the caller feeds record() and reconfigures when it returns True.
+    def __init__(self):
+        self.frame_budget_ms = 0.0
+        self.cpu_budget = 0.0
+        self.ladder = [('full quality', None)]
+        self.level = 0
+        self.reset()
+
+    def reset(self):
+        self.frame_ms = []
+        self.cpu_ms = 0.0
+        self.window_start = None
+        self.windows = 0
+        self.calm_windows = 0
+        self.load = 0.0
+        # Measured load of level L over level L + 1, from the last step down
+        self.step_ratio = {}
+        self.up_windows = {}
+        self.last_up = None
+        self.pending_ratio = None
+        self.changes = 0
+        self.events = deque(maxlen=20)
+
+    def configure(self, quality, frame_budget_ms=0.0, cpu_budget=0.0):
+        budgets = (float(frame_budget_ms), float(cpu_budget))
+        if budgets != (self.frame_budget_ms, self.cpu_budget):
+            self.frame_budget_ms, self.cpu_budget = budgets
+            self.level = 0
+            self.reset()
+        self.ladder = quality_ladder(quality, rates=self.cpu_budget > 0.0)
+        self.level = min(self.level, len(self.ladder) - 1) if self.enabled else 0
+
+    @property
+    def enabled(self):
+        return self.frame_budget_ms > 0.0 or self.cpu_budget > 0.0
+
+    @property
+    def quality(self):
+        return self.ladder[self.level][1]
+
+    @property
+    def status(self):
+        if self.level == 0:
+            return 'full quality'
+        return ', '.join(label for label, _ in self.ladder[1:self.level + 1])
+
+    def record(self, now, frame_ms, cpu_ms):
+        # now: seconds at the end of the frame; frame_ms: its wall time;
+        # cpu_ms: process CPU time used since the previous record()
+        if not self.enabled:
+            return False
+        if self.window_start is None:
+            self.window_start = now - frame_ms / 1000.0
+        self.frame_ms.append(frame_ms)
+        self.cpu_ms += cpu_ms
+        if len(self.frame_ms) < WINDOW_FRAMES:
+            return False
+        load, reason = self.measure(now)
+        self.frame_ms = []
+        self.cpu_ms = 0.0
+        self.window_start = now
+        self.windows += 1
+        self.load = load
+        if self.pending_ratio is not None:
+            # First full window after a step down: how much that step saved
+            self.step_ratio[self.level - 1] = max(1.0, self.pending_ratio / max(load, 1e-6))
+            self.pending_ratio = None
+        if load > 1.0:
+            self.calm_windows = 0
+            if self.level < len(self.ladder) - 1:
+                if self.last_up is not None and self.windows - self.last_up <= BOUNCE_WINDOWS:
+                    self.up_windows[self.level] = min(2 * self.up_windows.get(self.level, UP_WINDOWS), MAX_UP_WINDOWS)
+                self.pending_ratio = load
+                return self.step(1, reason)
+            return False
+        predicted = load * self.step_ratio.get(self.level - 1, DEFAULT_STEP_RATIO)
+        if self.level > 0 and predicted < UP_TARGET:
+            self.calm_windows += 1
+            if self.calm_windows >= self.up_windows.get(self.level - 1, UP_WINDOWS):
+                self.last_up = self.windows
+                return self.step(-1, f"predicted load {predicted:.0%}")
+        else:
+            self.calm_windows = 0
+        return False
+
+    def measure(self, now):
+        loads = []
+        if self.frame_budget_ms > 0.0:
+            times = sorted(self.frame_ms)
+            p90 = times[int(0.9 * (len(times) - 1))]
+            loads.append((p90 / self.frame_budget_ms, f"frame p90 {p90:.2f} ms, budget {self.frame_budget_ms:g} ms"))
+        if self.cpu_budget > 0.0:
+            span_ms = max((now - self.window_start) * 1000.0, 1e-3)
+            cpu = 100.0 * self.cpu_ms / span_ms
+            loads.append((cpu / self.cpu_budget, f"CPU {cpu:.1f}%, budget {self.cpu_budget:g}%"))
+        return max(loads)
+
+    def step(self, direction, reason):
+        self.level += direction
+        self.calm_windows = 0
+        self.changes += 1
+        self.events.append((self.windows, self.level, self.status, reason))
+        return True
+
+    def stats(self):
+        return {
+            'governor_level': self.level,
+            'governor_levels': len(self.ladder),
+            'governor_status': self.status,
+            'governor_load': self.load,
+            'governor_changes': self.changes,
+            'governor_events': [list(event) for event in self.events]
+        }
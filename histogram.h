@@ -0,0 +1,61 @@
+#pragma once
+#include <atomic>
+
+// Fixed-bucket latency histogram. Bucket edges grow geometrically from 1 us to
+// about 1 s, four buckets per doubling. Recording is a short binary search
+// plus one relaxed increment, so it is safe to call from the input hooks.
+class LatencyHistogram {
+public:
+    enum { BUCKETS = 80 };
+
+    LatencyHistogram() {
+        double edge = 0.001;
+        for (int i = 0; i < BUCKETS; i++) {
+            upper_ms_[i] = edge;
+            edge *= 1.189207115;
+        }
+        reset();
+    }
+
+    void reset() {
+        for (int i = 0; i < BUCKETS; i++) counts_[i].store(0, std::memory_order_relaxed);
+        total_.store(0, std::memory_order_relaxed);
+    }
+
+    void record(double ms) {
+        int lo = 0;
+        for (int step = 64; step > 0; step >>= 1) {
+            int probe = lo + step;
+            if (probe < BUCKETS && upper_ms_[probe - 1] < ms) lo = probe;
+        }
+        counts_[lo].fetch_add(1, std::memory_order_relaxed);
+        total_.fetch_add(1, std::memory_order_relaxed);
+    }
+
+    unsigned long long count() const { return total_.load(std::memory_order_relaxed); }
+    unsigned long long bucket_count(int i) const { return counts_[i].load(std::memory_order_relaxed); }
+    double bucket_upper_ms(int i) const { return upper_ms_[i]; }
+
+    // Upper edge of the bucket holding the given percentile (0-100).
+    double percentile(double p) const {
+        unsigned long long total = 0;
+        unsigned long long snapshot[BUCKETS];
+        for (int i = 0; i < BUCKETS; i++) {
+            snapshot[i] = counts_[i].load(std::memory_order_relaxed);
+            total += snapshot[i];
+        }
+        if (total == 0) return 0.0;
+        unsigned long long rank = (unsigned long long)(p / 100.0 * (double)(total - 1)) + 1;
+        unsigned long long seen = 0;
+        for (int i = 0; i < BUCKETS; i++) {
+            seen += snapshot[i];
+            if (seen >= rank) return upper_ms_[i];
+        }
+        return upper_ms_[BUCKETS - 1];
+    }
+
+private:
+    double upper_ms_[BUCKETS];
+    std::atomic<unsigned long long> counts_[BUCKETS];
+    std::atomic<unsigned long long> total_;
+};
@@ -0,0 +1,139 @@
+#pragma once
+#include <cstddef>
+#include <unordered_map>
+#include <vector>
+
+#define HOTKEY_MOD_CTRL  1
+#define HOTKEY_MOD_SHIFT 2
+#define HOTKEY_MOD_ALT   4
+#define HOTKEY_MOD_ALL   7
+
+// Pseudo virtual keys used by the GUI for wheel bindings
+#define HOTKEY_WHEEL_UP   0x200
+#define HOTKEY_WHEEL_DOWN 0x201
+
+enum HotkeyAction {
+    ACTION_NONE = 0,
+    ACTION_TOGGLE,
+    ACTION_ZOOM_IN,
+    ACTION_ZOOM_OUT,
+    ACTION_ZOOM_PRESET,
+    ACTION_LENS_STEP,
+    ACTION_CYCLE_SHAPE,
+    ACTION_COUNT
+};
+
+struct HotkeyBinding {
+    int vk;
+    unsigned mods;
+    int action;
+    float param;
+};
+
+struct InputEvent {
+    int vk;
+    bool down;
+};
+
+class HotkeyEngine {
+public:
+    HotkeyEngine() : mod_state_(0) {
+        for (int i = 0; i < KEY_STATE_WORDS; i++) pressed_[i] = 0;
+    }
+
+    // A binding fires when its required modifiers are held, extra ones are
+    // allowed (the polling code behaved the same way). Each binding is expanded
+    // to every superset mask so dispatch is a single table lookup; the binding
+    // requiring the most modifiers wins, later bindings win ties.
+    void compile(const std::vector<HotkeyBinding>& bindings) {
+        table_.clear();
+        std::unordered_map<unsigned, int> rank;
+        for (size_t i = 0; i < bindings.size(); i++) {
+            const HotkeyBinding& b = bindings[i];
+            if (b.action <= ACTION_NONE || b.action >= ACTION_COUNT) continue;
+            unsigned required = b.mods & HOTKEY_MOD_ALL;
+            int specificity = popcount(required);
+            for (unsigned mask = 0; mask <= HOTKEY_MOD_ALL; mask++) {
+                if ((mask & required) != required) continue;
+                unsigned key = table_key(b.vk, mask);
+                std::unordered_map<unsigned, int>::iterator it = rank.find(key);
+                if (it != rank.end() && it->second > specificity) continue;
+                rank[key] = specificity;
+                table_[key] = b;
+            }
+        }
+    }
+
+    // Seeds the modifier state, e.g. from GetAsyncKeyState when the hook is installed
+    void set_modifiers(unsigned mods) {
+        set_pressed(0xA2, (mods & HOTKEY_MOD_CTRL) != 0);
+        set_pressed(0xA0, (mods & HOTKEY_MOD_SHIFT) != 0);
+        set_pressed(0xA4, (mods & HOTKEY_MOD_ALT) != 0);
+        mod_state_ = mods & HOTKEY_MOD_ALL;
+    }
+    unsigned modifiers() const { return mod_state_; }
+    size_t table_size() const { return table_.size(); }
+
+    // Feeds one input event; returns the binding to run or NULL. Only the
+    // up-to-down transition of a key dispatches, so auto-repeat is ignored.
+    // Wheel pseudo keys have no up event and dispatch on every notch.
+    const HotkeyBinding* feed(const InputEvent& ev) {
+        if (ev.vk != HOTKEY_WHEEL_UP && ev.vk != HOTKEY_WHEEL_DOWN) {
+            if (ev.vk < 0 || ev.vk >= KEY_STATE_WORDS * 32) return NULL;
+            bool was_down = is_pressed(ev.vk);
+            set_pressed(ev.vk, ev.down);
+            if (modifier_bit(ev.vk)) {
+                update_modifiers();
+                return NULL;
+            }
+            if (!ev.down || was_down) return NULL;
+        } else if (!ev.down) {
+            return NULL;
+        }
+        std::unordered_map<unsigned, HotkeyBinding>::const_iterator it = table_.find(table_key(ev.vk, mod_state_));
+        return it == table_.end() ? NULL : &it->second;
+    }
+
+private:
+    enum { KEY_STATE_WORDS = 8 };
+
+    bool is_pressed(int vk) const {
+        return (pressed_[vk >> 5] & (1u << (vk & 31))) != 0;
+    }
+
+    void set_pressed(int vk, bool down) {
+        if (down) pressed_[vk >> 5] |= 1u << (vk & 31);
+        else pressed_[vk >> 5] &= ~(1u << (vk & 31));
+    }
+
+    // Left/right variants are tracked separately so releasing one side keeps the other held
+    void update_modifiers() {
+        mod_state_ = 0;
+        if (is_pressed(0x11) || is_pressed(0xA2) || is_pressed(0xA3)) mod_state_ |= HOTKEY_MOD_CTRL;
+        if (is_pressed(0x10) || is_pressed(0xA0) || is_pressed(0xA1)) mod_state_ |= HOTKEY_MOD_SHIFT;
+        if (is_pressed(0x12) || is_pressed(0xA4) || is_pressed(0xA5)) mod_state_ |= HOTKEY_MOD_ALT;
+    }
+
+    static unsigned table_key(int vk, unsigned mods) {
+        return ((unsigned)vk << 3) | (mods & HOTKEY_MOD_ALL);
+    }
+
+    static int popcount(unsigned v) {
+        int n = 0;
+        for (; v; v &= v - 1) n++;
+        return n;
+    }
+
+    static unsigned modifier_bit(int vk) {
+        switch (vk) {
+        case 0x11: case 0xA2: case 0xA3: return HOTKEY_MOD_CTRL;
+        case 0x10: case 0xA0: case 0xA1: return HOTKEY_MOD_SHIFT;
+        case 0x12: case 0xA4: case 0xA5: return HOTKEY_MOD_ALT;
+        default: return 0;
+        }
+    }
+
+    std::unordered_map<unsigned, HotkeyBinding> table_;
+    unsigned pressed_[KEY_STATE_WORDS];
+    unsigned mod_state_;
+};
@@ -0,0 +1,113 @@
+import collections
+import time
+from collections import deque
+
+import numpy as np
+
+from band_renderer import BandRenderer
+from filters import FilterChain, CVD_NONE
+from resample import NEAREST
+from software_engine import SoftwareEngine, LENS_CIRCLE
+from tile_cache import TileCache
+
+LensSpec = collections.namedtuple('LensSpec', 'lens_size zoom shape kernel offset_x offset_y')
+
+DEFAULT_LENS = LensSpec(300, 3.0, LENS_CIRCLE, NEAREST, 0, 0)
+
+
+def lens_specs(settings):
+    # The primary lens is described by the top-level keys, any others by extra_lenses
+    lenses = [dict(settings, offset_x=0, offset_y=0)] + list(settings.get('extra_lenses', []))
+    return tuple(LensSpec(int(lens['lens_size']), float(lens['zoom_factor']), int(lens['lens_shape']),
+                          lens.get('resample_kernel', NEAREST), int(lens.get('offset_x', 0)), int(lens.get('offset_y', 0)))
+                 for lens in lenses)
+
+
+def filter_settings(settings):
+    if not settings.get('filters_enabled'):
+        return ()
+    return (settings.get('sharpen', 0.0), settings.get('contrast', 1.0), settings.get('gamma', 1.0),
+            settings.get('color_filter', CVD_NONE))
+
+
+def union_rect(rects):
+    lefts, tops, rights, bottoms = zip(*rects)
+    return min(lefts), min(tops), max(rights), max(bottoms)
+
+
+class Lens:
+    def __init__(self, screen_width, screen_height):
+        self.engine = SoftwareEngine(screen_width, screen_height)
+        self.spec = DEFAULT_LENS
+        self.tile_cache = None
+        self.render_times = deque(maxlen=1000)
+        self.frames_rendered = 0
+
+    def position(self):
+        # Top-left corner on screen; the offsets move the lens window, not what it magnifies
+        engine = self.engine
+        return ((engine.screen_width - engine.lens_size) // 2 + self.spec.offset_x,
+                (engine.screen_height - engine.lens_size) // 2 + self.spec.offset_y)
+
+
+class MultiLensRenderer:
+    # Several lenses fed from one capture: the union of their source rects is
+    # grabbed once per frame and every lens crops and scales its own part.
+    def __init__(self, screen_width, screen_height):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.lenses = [Lens(screen_width, screen_height)]
+        self.bands = BandRenderer()
+        self.filters = FilterChain()
+
+    @property
+    def primary(self):
+        return self.lenses[0].engine
+
+    def configure(self, specs, skip_static, workers=0, filters=()):
+        # Lens objects are kept by index so their buffers and tile caches survive edits
+        while len(self.lenses) < len(specs):
+            self.lenses.append(Lens(self.screen_width, self.screen_height))
+        del self.lenses[max(1, len(specs)):]
+        # One post-processing chain for all lenses
+        self.filters.configure(*filters)
+        for lens, spec in zip(self.lenses, specs):
+            lens.engine.configure(spec.lens_size, spec.zoom, spec.shape, spec.kernel, self.filters)
+            lens.spec = spec
+            if skip_static and lens.tile_cache is None:
+                lens.tile_cache = TileCache()
+            elif not skip_static:
+                lens.tile_cache = None
+        self.bands.set_workers(workers)
+
+    def reset(self):
+        for lens in self.lenses:
+            if lens.tile_cache:
+                lens.tile_cache.reset()
+
+    def source_rect(self):
+        return union_rect([lens.engine.source_rect() for lens in self.lenses])
+
+    def render(self, frame, origin, buffers=None):
+        # One (image, regions) per lens; regions is [] for a lens whose source
+        # did not change and None for one that was redrawn completely
+        results = []
+        for i, lens in enumerate(self.lenses):
+            out = buffers[i] if buffers else None
+            start = time.perf_counter()
+            if lens.tile_cache is None:
+                if out is None:
+                    size = lens.engine.lens_size
+                    out = np.empty((size, size) + frame.shape[2:], dtype=frame.dtype)
+                result = (self.bands.render(lens.engine, frame, origin, out), None)
+            else:
+                result = lens.tile_cache.render(lens.engine, frame, origin, out, self.bands)
+            lens.render_times.append((time.perf_counter() - start) * 1000.0)
+            lens.frames_rendered += 1
+            results.append(result)
+        if self.filters.active:
+            self.filters.end_frame()
+        return results
+
+    def close(self):
+        self.bands.close()
@@ -0,0 +1,131 @@
+#pragma once
+
+template <typename T>
+struct Versioned {
+    T value;
+    unsigned version;
+
+    Versioned() : value(), version(0) {}
+
+    bool set(const T& v) {
+        if (version != 0 && v == value) return false;
+        value = v;
+        version++;
+        return true;
+    }
+};
+
+struct SourceRect {
+    int left, top, right, bottom;
+    bool operator==(const SourceRect& o) const {
+        return left == o.left && top == o.top && right == o.right && bottom == o.bottom;
+    }
+};
+
+struct LensGeometry {
+    int x, y, width, height;
+    bool operator==(const LensGeometry& o) const {
+        return x == o.x && y == o.y && width == o.width && height == o.height;
+    }
+};
+
+struct LensRegion {
+    int width, height, shape;
+    bool operator==(const LensRegion& o) const {
+        return width == o.width && height == o.height && shape == o.shape;
+    }
+};
+
+struct OverlayStyle {
+    bool dot_enabled;
+    int dot_size;
+    int r, g, b;
+    bool operator==(const OverlayStyle& o) const {
+        return dot_enabled == o.dot_enabled && dot_size == o.dot_size && r == o.r && g == o.g && b == o.b;
+    }
+};
+
+enum RenderOp {
+    OP_TRANSFORM = 0,
+    OP_GEOMETRY,
+    OP_REGION,
+    OP_SOURCE,
+    OP_REFRESH,
+    OP_VISIBILITY,
+    OP_OVERLAY,
+    OP_COUNT
+};
+
+#define RENDER_OP_BIT(op) (1u << (op))
+
+struct RenderState {
+    Versioned<float> zoom;
+    Versioned<LensGeometry> geometry;
+    Versioned<LensRegion> region;
+    Versioned<SourceRect> source;
+    Versioned<bool> visible;
+    Versioned<OverlayStyle> overlay;
+
+    // Mirrors the source rect math update() has always used.
+    void set_view(int screen_cx, int screen_cy, int lens_w, int lens_h, float mag) {
+        float src_w = (float)lens_w / mag;
+        float src_h = (float)lens_h / mag;
+        SourceRect rect;
+        rect.left   = (int)(screen_cx - src_w * 0.5f + 0.5f);
+        rect.top    = (int)(screen_cy - src_h * 0.5f + 0.5f);
+        rect.right  = (int)(screen_cx + src_w * 0.5f + 0.5f);
+        rect.bottom = (int)(screen_cy + src_h * 0.5f + 0.5f);
+        zoom.set(mag);
+        source.set(rect);
+    }
+};
+
+struct RenderApplied {
+    unsigned zoom, geometry, region, source, visible, overlay;
+    RenderApplied() : zoom(0), geometry(0), region(0), source(0), visible(0), overlay(0) {}
+};
+
+struct RenderCounters {
+    unsigned long long frames;
+    unsigned long long syscalls;
+    unsigned last_frame_syscalls;
+    unsigned long long op_calls[OP_COUNT];
+};
+
+// Which Win32 calls a frame needs: only the ones whose inputs moved since the
+// last applied version, plus a content refresh while the lens is visible.
+inline unsigned DiffRenderState(const RenderState& s, const RenderApplied& a) {
+    unsigned ops = 0;
+    if (s.zoom.version != a.zoom) ops |= RENDER_OP_BIT(OP_TRANSFORM);
+    if (s.geometry.version != a.geometry) ops |= RENDER_OP_BIT(OP_GEOMETRY);
+    if (s.region.version != a.region) ops |= RENDER_OP_BIT(OP_REGION);
+    if (s.source.version != a.source) ops |= RENDER_OP_BIT(OP_SOURCE);
+    if (s.visible.version != a.visible) ops |= RENDER_OP_BIT(OP_VISIBILITY);
+    if (s.visible.value) {
+        if (!(ops & RENDER_OP_BIT(OP_SOURCE))) ops |= RENDER_OP_BIT(OP_REFRESH);
+        // The magnifier child repaints over the dot, so it is redrawn with each refresh
+        if (s.overlay.version != a.overlay || s.overlay.value.dot_enabled) ops |= RENDER_OP_BIT(OP_OVERLAY);
+    } else {
+        // Source and overlay stay dirty until the lens is shown again
+        ops &= RENDER_OP_BIT(OP_VISIBILITY) | RENDER_OP_BIT(OP_GEOMETRY) | RENDER_OP_BIT(OP_REGION) | RENDER_OP_BIT(OP_TRANSFORM);
+    }
+    return ops;
+}
+
+inline void MarkRenderApplied(const RenderState& s, RenderApplied& a, unsigned ops) {
+    if (ops & RENDER_OP_BIT(OP_TRANSFORM)) a.zoom = s.zoom.version;
+    if (ops & RENDER_OP_BIT(OP_GEOMETRY)) a.geometry = s.geometry.version;
+    if (ops & RENDER_OP_BIT(OP_REGION)) a.region = s.region.version;
+    if (ops & RENDER_OP_BIT(OP_SOURCE)) a.source = s.source.version;
+    if (ops & RENDER_OP_BIT(OP_VISIBILITY)) a.visible = s.visible.version;
+    if (ops & RENDER_OP_BIT(OP_OVERLAY)) a.overlay = s.overlay.version;
+}
+
+inline void CountRenderOps(RenderCounters& c, unsigned ops, unsigned syscalls) {
+    c.frames++;
+    c.syscalls += syscalls;
+    c.last_frame_syscalls = syscalls;
+    for (int op = 0; op < OP_COUNT; op++) {
+        if (ops & RENDER_OP_BIT(op)) c.op_calls[op]++;
+    }
+}
@@ -0,0 +1,188 @@
+import collections
+import functools
+import numpy as np
+
+NEAREST = 'nearest'
+BILINEAR = 'bilinear'
+PIXEL_ART = 'pixel_art'
+KERNELS = (NEAREST, BILINEAR, PIXEL_ART)
+
+# Weights are 8-bit fixed point: a tap pair (i0, i1, w) means (src[i0] * (ONE - w) + src[i1] * w) / ONE
+WEIGHT_BITS = 8
+ONE = 1 << WEIGHT_BITS
+
+BLEND_CHUNK_PIXELS = 32768
+
+AxisTaps = collections.namedtuple('AxisTaps', 'index0 index1 weight nearest fractional')
+
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+
+
+@functools.lru_cache(maxsize=128)
+def axis_taps(out_size, zoom, src_size, kernel):
+    # One axis of the separable kernel. Output pixel i is centred on source
+    # coordinate (i + 0.5) / zoom, the same mapping MAGTRANSFORM uses.
+    if kernel not in KERNELS:
+        raise ValueError(f"unknown resampling kernel {kernel!r}")
+    centres = (np.arange(out_size, dtype=np.float64) + 0.5) / zoom
+    if kernel == NEAREST:
+        index0 = np.minimum(centres.astype(np.intp), src_size - 1)
+        index1 = index0
+        weight = np.zeros(out_size, dtype=np.uint32)
+    else:
+        position = centres - 0.5
+        base = np.floor(position)
+        frac = position - base
+        if kernel == PIXEL_ART:
+            # Sharp bilinear: blend only across the one output pixel that
+            # straddles a source pixel edge, copy everywhere else
+            frac = np.clip((frac - 0.5) * zoom + 0.5, 0.0, 1.0)
+        index0 = np.clip(base.astype(np.intp), 0, src_size - 1)
+        index1 = np.clip(base.astype(np.intp) + 1, 0, src_size - 1)
+        weight = np.rint(frac * ONE).astype(np.uint32)
+        weight[index0 == index1] = 0
+    nearest = np.where(weight == ONE, index1, index0)
+    fractional = (weight != 0) & (weight != ONE)
+    _read_only(index0, index1, weight, nearest, fractional)
+    return AxisTaps(index0, index1, weight, nearest, fractional)
+
+
+def block_factor(zoom, kernel):
+    # Integer zoom with a copy-only kernel is pure block replication
+    if kernel == BILINEAR or zoom != int(zoom):
+        return 0
+    return int(zoom)
+
+
+def blend_bgra(a, b, weight):
+    # Blends packed BGRA words two channels at a time (R/B and A/G each share a
+    # uint32 with 16 bits of headroom per channel), so no float conversion.
+    # A weight of 0 or ONE reproduces a or b exactly.
+    inverse = ONE - weight
+    rb = a & 0x00FF00FF
+    rb *= inverse
+    scratch = b & 0x00FF00FF
+    scratch *= weight
+    rb += scratch
+    rb += 0x00800080
+    rb >>= WEIGHT_BITS
+    rb &= 0x00FF00FF
+    ag = a >> 8
+    ag &= 0x00FF00FF
+    ag *= inverse
+    np.right_shift(b, 8, out=scratch)
+    scratch &= 0x00FF00FF
+    scratch *= weight
+    ag += scratch
+    ag += 0x00800080
+    ag &= 0xFF00FF00
+    rb |= ag
+    return rb
+
+
+def blend_float(a, b, weight):
+    w = (weight.astype(np.float32) / ONE).reshape(weight.shape + (1,) * (a.ndim - weight.ndim))
+    return a * (1.0 - w) + b * w
+
+
+def _replicate_rows(lines, factor, first_block, top, bottom, target):
+    # target holds output rows top..bottom; output row y is lines[y // factor - first_block]
+    head = min(bottom, -(-top // factor) * factor)
+    tail = max(head, bottom // factor * factor)
+    if head > top:
+        target[:head - top] = lines[top // factor - first_block]
+    if tail > head:
+        blocks = target[head - top:tail - top].reshape(-1, factor, target.shape[1])
+        start = head // factor - first_block
+        blocks[...] = lines[start:start + blocks.shape[0], None]
+    if bottom > tail:
+        target[tail - top:] = lines[tail // factor - first_block]
+
+
+def _resample_words(src, target, zoom, kernel, out_h, out_w, top, bottom, left, right):
+    src_h, src_w = src.shape
+    cols = axis_taps(out_w, zoom, src_w, kernel)
+    factor = block_factor(zoom, kernel)
+    if factor:
+        first_block = top // factor
+        rows = np.minimum(np.arange(first_block, (bottom - 1) // factor + 1), src_h - 1)
+        lines = np.take(src[rows], cols.nearest[left:right], axis=1)
+        _replicate_rows(lines, factor, first_block, top, bottom, target)
+        return
+
+    rows = axis_taps(out_h, zoom, src_h, kernel)
+    row0, row1 = rows.index0[top:bottom], rows.index1[top:bottom]
+    lo, hi = int(row0[0]), int(row1[-1]) + 1
+    band = src[lo:hi]
+    width = right - left
+    # Blend in chunks so the temporaries stay in cache instead of spanning the lens
+    chunk = max(1, BLEND_CHUNK_PIXELS // width)
+
+    # Horizontal pass on just the source rows this region needs. A kernel that
+    # blends most columns (bilinear) blends all of them; one that mostly copies
+    # (nearest, pixel art) gathers and then fixes up the few edge columns.
+    c0, c1 = cols.index0[left:right], cols.index1[left:right]
+    col_weight = cols.weight[left:right]
+    blend_cols = np.flatnonzero(cols.fractional[left:right])
+    if blend_cols.size * 2 > width:
+        lines = np.empty((hi - lo, width), dtype=np.uint32)
+        for start in range(0, hi - lo, chunk):
+            part = band[start:start + chunk]
+            lines[start:start + chunk] = blend_bgra(part[:, c0], part[:, c1], col_weight)
+    else:
+        lines = np.take(band, cols.nearest[left:right], axis=1)
+        if blend_cols.size:
+            lines[:, blend_cols] = blend_bgra(band[:, c0[blend_cols]], band[:, c1[blend_cols]], col_weight[blend_cols])
+
+    # Vertical pass at output size, same split
+    row_weight = rows.weight[top:bottom]
+    blend_rows = np.flatnonzero(rows.fractional[top:bottom])
+    if blend_rows.size * 2 > bottom - top:
+        for start in range(0, bottom - top, chunk):
+            end = start + chunk
+            target[start:end] = blend_bgra(lines[row0[start:end] - lo], lines[row1[start:end] - lo], row_weight[start:end, None])
+    else:
+        np.take(lines, rows.nearest[top:bottom] - lo, axis=0, out=target)
+        for start in range(0, blend_rows.size, chunk):
+            sel = blend_rows[start:start + chunk]
+            target[sel] = blend_bgra(lines[row0[sel] - lo], lines[row1[sel] - lo], row_weight[sel, None])
+
+
+def _resample_generic(src, target, zoom, kernel, out_h, out_w, top, bottom, left, right):
+    rows = axis_taps(out_h, zoom, src.shape[0], kernel)
+    cols = axis_taps(out_w, zoom, src.shape[1], kernel)
+    row0, row1 = rows.index0[top:bottom], rows.index1[top:bottom]
+    c0, c1 = cols.index0[left:right], cols.index1[left:right]
+    if kernel == NEAREST:
+        target[...] = src[row0[:, None], c0[None, :]]
+        return
+    data = src.astype(np.float32)
+    lines = blend_float(data[:, c0], data[:, c1], np.broadcast_to(cols.weight[left:right], (1, right - left)))
+    result = blend_float(lines[row0], lines[row1], rows.weight[top:bottom])
+    if np.issubdtype(target.dtype, np.integer):
+        info = np.iinfo(target.dtype)
+        result = np.clip(np.rint(result), info.min, info.max)
+    target[...] = result
+
+
+def resample(src, out_shape, zoom, kernel=NEAREST, out=None, region=None):
+    # Scales src by zoom into an out_shape (height, width) image. region is
+    # (top, bottom, left, right) in output pixels; only that part of out is
+    # written, so callers can render bands or tiles into a shared buffer.
+    out_h, out_w = out_shape
+    if out is None:
+        out = np.empty((out_h, out_w) + src.shape[2:], dtype=src.dtype)
+    top, bottom, left, right = region if region is not None else (0, out_h, 0, out_w)
+    if bottom <= top or right <= left:
+        return out
+    if src.ndim == 3 and src.shape[2] == 4 and src.dtype == np.uint8:
+        # Work on whole BGRA pixels as one 32-bit word instead of four bytes
+        words = src.view(np.uint32)[..., 0]
+        target = out.view(np.uint32)[..., 0][top:bottom, left:right]
+        _resample_words(words, target, zoom, kernel, out_h, out_w, top, bottom, left, right)
+    else:
+        _resample_generic(src, out[top:bottom, left:right], zoom, kernel, out_h, out_w, top, bottom, left, right)
+    return out
@@ -0,0 +1,184 @@
+#pragma once
+#include <atomic>
+#include <chrono>
+#include <cstddef>
+#include <cstdio>
+#include <cstring>
+#include <ctime>
+#include <string>
+#include <thread>
+
+enum LogLevel {
+    LOG_DEBUG = 0,
+    LOG_INFO,
+    LOG_WARN,
+    LOG_ERROR
+};
+
+struct LogRecord {
+    double time_ms;
+    int level;
+    char text[116];
+};
+
+typedef double (*LogClockFunc)();
+
+// Bounded lock-free multi-producer queue of fixed-size records (Vyukov's
+// sequence-per-slot design). Producers never block or allocate; when the
+// flusher falls behind, records are dropped and counted instead.
+class RingLog {
+public:
+    enum { CAPACITY = 1024 };
+
+    RingLog() : head_(0), tail_(0), dropped_(0), level_(LOG_INFO), running_(false),
+        clock_(NULL), file_(NULL), file_size_(0), max_bytes_(1 << 20), keep_files_(3), flush_interval_ms_(100) {
+        for (size_t i = 0; i < CAPACITY; i++) slots_[i].seq.store(i, std::memory_order_relaxed);
+    }
+
+    ~RingLog() { stop(); }
+
+    void set_level(int level) { level_.store(level, std::memory_order_relaxed); }
+    int level() const { return level_.load(std::memory_order_relaxed); }
+    unsigned long long dropped() const { return dropped_.load(std::memory_order_relaxed); }
+
+    void set_rotation(long max_bytes, int keep_files) {
+        max_bytes_ = max_bytes > 0 ? max_bytes : 0;
+        keep_files_ = keep_files > 0 ? keep_files : 0;
+    }
+
+    bool push(int level, const char* text) {
+        if (level < level_.load(std::memory_order_relaxed)) return false;
+        size_t pos = head_.load(std::memory_order_relaxed);
+        Slot* slot;
+        for (;;) {
+            slot = &slots_[pos & (CAPACITY - 1)];
+            size_t seq = slot->seq.load(std::memory_order_acquire);
+            ptrdiff_t diff = (ptrdiff_t)seq - (ptrdiff_t)pos;
+            if (diff == 0) {
+                if (head_.compare_exchange_weak(pos, pos + 1, std::memory_order_relaxed)) break;
+            } else if (diff < 0) {
+                dropped_.fetch_add(1, std::memory_order_relaxed);
+                return false;
+            } else {
+                pos = head_.load(std::memory_order_relaxed);
+            }
+        }
+        slot->record.time_ms = clock_ ? clock_() : 0.0;
+        slot->record.level = level;
+        strncpy(slot->record.text, text, sizeof(slot->record.text) - 1);
+        slot->record.text[sizeof(slot->record.text) - 1] = '\0';
+        slot->seq.store(pos + 1, std::memory_order_release);
+        return true;
+    }
+
+    void start(const char* path, LogClockFunc clock) {
+        if (running_.exchange(true)) return;
+        path_ = path;
+        clock_ = clock;
+        wall_base_ = time(NULL);
+        clock_base_ms_ = clock_ ? clock_() : 0.0;
+        flusher_ = std::thread(&RingLog::flush_loop, this);
+    }
+
+    void stop() {
+        if (!running_.exchange(false)) return;
+        if (flusher_.joinable()) flusher_.join();
+        drain();
+        close_file();
+    }
+
+private:
+    struct Slot {
+        std::atomic<size_t> seq;
+        LogRecord record;
+    };
+
+    bool pop(LogRecord* out) {
+        Slot& slot = slots_[tail_ & (CAPACITY - 1)];
+        if (slot.seq.load(std::memory_order_acquire) != tail_ + 1) return false;
+        *out = slot.record;
+        slot.seq.store(tail_ + CAPACITY, std::memory_order_release);
+        tail_++;
+        return true;
+    }
+
+    void flush_loop() {
+        while (running_.load(std::memory_order_relaxed)) {
+            drain();
+            std::this_thread::sleep_for(std::chrono::milliseconds(flush_interval_ms_));
+        }
+    }
+
+    void drain() {
+        static const char* names[] = { "DEBUG", "INFO", "WARN", "ERROR" };
+        LogRecord record;
+        bool wrote = false;
+        while (pop(&record)) {
+            if (!file_ && !open_file()) continue;
+            time_t wall = wall_base_ + (time_t)((record.time_ms - clock_base_ms_) / 1000.0);
+            char stamp[32];
+            strftime(stamp, sizeof(stamp), "%a %b %d %H:%M:%S %Y", localtime(&wall));
+            int level = record.level >= LOG_DEBUG && record.level <= LOG_ERROR ? record.level : LOG_INFO;
+            int written = fprintf(file_, "[%s] %s %s\n", stamp, names[level], record.text);
+            if (written > 0) file_size_ += written;
+            wrote = true;
+            if (max_bytes_ && file_size_ >= max_bytes_) rotate();
+        }
+        unsigned long long lost = dropped_.exchange(0, std::memory_order_relaxed);
+        if (lost && (file_ || open_file())) {
+            int written = fprintf(file_, "[dropped %llu log records]\n", lost);
+            if (written > 0) file_size_ += written;
+            wrote = true;
+        }
+        if (wrote && file_) fflush(file_);
+    }
+
+    bool open_file() {
+        file_ = fopen(path_.c_str(), "a");
+        if (!file_) return false;
+        fseek(file_, 0, SEEK_END);
+        file_size_ = ftell(file_);
+        return true;
+    }
+
+    void close_file() {
+        if (file_) fclose(file_);
+        file_ = NULL;
+    }
+
+    void rotate() {
+        close_file();
+        if (keep_files_ == 0) {
+            remove(path_.c_str());
+        } else {
+            char from[512], to[512];
+            snprintf(to, sizeof(to), "%s.%d", path_.c_str(), keep_files_);
+            remove(to);
+            for (int i = keep_files_ - 1; i >= 1; i--) {
+                snprintf(from, sizeof(from), "%s.%d", path_.c_str(), i);
+                snprintf(to, sizeof(to), "%s.%d", path_.c_str(), i + 1);
+                rename(from, to);
+            }
+            snprintf(to, sizeof(to), "%s.1", path_.c_str());
+            rename(path_.c_str(), to);
+        }
+        open_file();
+    }
+
+    Slot slots_[CAPACITY];
+    std::atomic<size_t> head_;
+    size_t tail_;
+    std::atomic<unsigned long long> dropped_;
+    std::atomic<int> level_;
+    std::atomic<bool> running_;
+    LogClockFunc clock_;
+    std::string path_;
+    std::thread flusher_;
+    FILE* file_;
+    long file_size_;
+    long max_bytes_;
+    int keep_files_;
+    int flush_interval_ms_;
+    time_t wall_base_;
+    double clock_base_ms_;
+};
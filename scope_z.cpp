@@ -2,18 +2,57 @@
 #include <stdio.h>
 #include <time.h>
 #include <algorithm>
+#include "frame_pacer.h"
+#include "render_state.h"
+#include "hotkeys.h"
+#include "ring_log.h"
+#include "histogram.h"
+#include "stats.h"
+#include "engine_state.h"
+#include "settings_channel.h"
+#include "zoom_anim.h"
+#include "trace.h"
+#include "display_geometry.h"
+
+#pragma comment(lib, "winmm.lib")
 
 #define WC_MAGNIFIERW L"Magnifier"
 
+#ifndef CREATE_WAITABLE_TIMER_HIGH_RESOLUTION
+#define CREATE_WAITABLE_TIMER_HIGH_RESOLUTION 0x00000002
+#endif
+
+RingLog debug_log;
+TraceRecorder trace;
+LatencyHistogram hotkey_latency;
+LatencyHistogram frame_time;
+double frame_time_max = 0.0;
+PacerCounters pacing_counters = {};
+StatePublisher engine_state;
+TripleBuffer<SettingsSnapshot> settings_mailbox;
+SRWLOCK settings_lock = SRWLOCK_INIT;
+unsigned int settings_version = 0;
+float last_snapshot_zoom = 0.0f;
+ZoomAnimator zoom_anim;
+volatile int zoom_anim_ms = (int)ZOOM_ANIM_DEFAULT_MS;
+SourceTracker tracker;
+SRWLOCK track_lock = SRWLOCK_INIT;
+TrackTarget track_request = { TRACK_MONITOR, 0, 0 };
+volatile bool track_dirty = false;
+// Last cursor position seen by the mouse hook, so following it costs no call per frame
+volatile int cursor_x = 0, cursor_y = 0;
+
+void LogMessage(int level, const char* msg) {
+    debug_log.push(level, msg);
+}
+
 void DebugLog(const char* msg) {
-    FILE* f = fopen("scope_z_debug.log", "a");
-    if (f) {
-        time_t now = time(0);
-        char* timestr = ctime(&now);
-        timestr[strlen(timestr)-1] = '\0';
-        fprintf(f, "[%s] %s\n", timestr, msg);
-        fclose(f);
-    }
+    debug_log.push(LOG_INFO, msg);
+}
+
+void ReportEngineError(int code, const char* msg, bool fatal = true) {
+    LogMessage(fatal ? LOG_ERROR : LOG_WARN, msg);
+    engine_state.publish_error(code, msg, fatal);
 }
 
 typedef struct { float v[3][3]; } MAGTRANSFORM;
@@ -33,25 +72,50 @@ HWND hwnd_mag = nullptr;
 int LENS_WIDTH = 300;
 int LENS_HEIGHT = 300;
 float MAG_FACTOR = 3.0f;
-int TOGGLE_KEY = 0x05;
-int ZOOM_IN_KEY = 0x26;
-bool ZOOM_IN_CTRL = true;
-bool ZOOM_IN_SHIFT = false;
-bool ZOOM_IN_ALT = false;
-int ZOOM_OUT_KEY = 0x28;
-bool ZOOM_OUT_CTRL = true;
-bool ZOOM_OUT_SHIFT = false;
-bool ZOOM_OUT_ALT = false;
 int LENS_SHAPE = 0;
 bool DOT_ENABLED = false;
 int DOT_SIZE = 4;
 int DOT_R = 255, DOT_G = 0, DOT_B = 0;
-
-bool running = false;
+int TARGET_FPS = 60;
+bool lens_visible = true;
+
+// running is the requested state: true while the lens is active, false while
+// suspended. The engine thread itself lives until ShutdownMagnifier.
+volatile bool running = false;
+volatile bool shutdown_requested = false;
+HANDLE engine_thread = NULL;
+HANDLE wake_event = NULL;
+HANDLE ack_event = NULL;
+SRWLOCK command_lock = SRWLOCK_INIT;
+#define COMMAND_TIMEOUT_MS 1000
 HHOOK mouse_hook = NULL;
+HHOOK keyboard_hook = NULL;
+HotkeyEngine hotkeys;
+std::vector<HotkeyBinding> base_bindings;
+std::vector<HotkeyBinding> extra_bindings;
+SRWLOCK binding_lock = SRWLOCK_INIT;
+volatile bool bindings_dirty = true;
 static LARGE_INTEGER perf_freq;
 static bool perf_init = false;
 
+RenderState render_state;
+RenderApplied render_applied;
+RenderCounters render_counters = {};
+// What GetStats reads: pacing_counters, render_counters and frame_time_max are
+// engine-thread working copies, published here as one consistent snapshot
+SeqlockCell<EngineCounters> published_counters;
+
+void PublishCounters() {
+    EngineCounters counters = { pacing_counters, render_counters, frame_time_max };
+    published_counters.publish(counters);
+}
+
+static HBRUSH dot_brush = NULL;
+static HPEN dot_pen = NULL;
+static COLORREF dot_color = 0;
+static HRGN lens_rgn = NULL;
+static int lens_rgn_w = 0, lens_rgn_h = 0;
+
 void update();
 
 double GetCurrentTimeMs() {
@@ -64,68 +128,212 @@ double GetCurrentTimeMs() {
     return (double)counter.QuadPart * 1000.0 / perf_freq.QuadPart;
 }
 
-LRESULT CALLBACK MouseHookProc(int nCode, WPARAM wParam, LPARAM lParam) {
-    if (nCode >= 0 && running && wParam == WM_MOUSEWHEEL) {
-        MSLLHOOKSTRUCT* pMouseStruct = (MSLLHOOKSTRUCT*)lParam;
-        short delta = GET_WHEEL_DELTA_WPARAM(pMouseStruct->mouseData);
+static HANDLE frame_timer = NULL;
+static bool coarse_timer = false;
 
-        bool ctrl = (GetAsyncKeyState(VK_CONTROL) & 0x8000) != 0;
-        bool shift = (GetAsyncKeyState(VK_SHIFT) & 0x8000) != 0;
-        bool alt = (GetAsyncKeyState(VK_MENU) & 0x8000) != 0;
+void PumpMessages() {
+    MSG msg;
+    while (PeekMessageW(&msg, NULL, 0, 0, PM_REMOVE)) {
+        TranslateMessage(&msg);
+        DispatchMessageW(&msg);
+    }
+}
 
-        bool zoom_in_mods = (!ZOOM_IN_CTRL || ctrl) && (!ZOOM_IN_SHIFT || shift) && (!ZOOM_IN_ALT || alt);
-        bool zoom_out_mods = (!ZOOM_OUT_CTRL || ctrl) && (!ZOOM_OUT_SHIFT || shift) && (!ZOOM_OUT_ALT || alt);
+double PacerNow(void*) {
+    return GetCurrentTimeMs();
+}
 
-        if (delta > 0 && zoom_in_mods) {
-            double start_time = GetCurrentTimeMs();
-            MAG_FACTOR = std::min(10.0f, MAG_FACTOR + 0.5f);
-            if (hwnd_mag) {
-                MAGTRANSFORM matrix = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-                pMagSetWindowTransform(hwnd_mag, &matrix);
-                update();
-            }
-            double end_time = GetCurrentTimeMs();
-            char msg[100];
-            sprintf(msg, "Zoom in latency: %.2f ms", end_time - start_time);
-            DebugLog(msg);
-            return 1;
-        }
-        else if (delta < 0 && zoom_out_mods) {
+// Also wakes on wake_event so a suspend or shutdown does not wait out the frame
+bool PacerWait(void*, double timeout_ms) {
+    HANDLE handles[2] = { wake_event, frame_timer };
+    if (frame_timer) {
+        LARGE_INTEGER due;
+        due.QuadPart = -(LONGLONG)(timeout_ms * 10000.0);
+        SetWaitableTimer(frame_timer, &due, 0, NULL, NULL, FALSE);
+        MsgWaitForMultipleObjectsEx(2, handles, INFINITE, QS_ALLINPUT, MWMO_INPUTAVAILABLE);
+        CancelWaitableTimer(frame_timer);
+    } else {
+        MsgWaitForMultipleObjectsEx(1, handles, (DWORD)timeout_ms, QS_ALLINPUT, MWMO_INPUTAVAILABLE);
+    }
+    PumpMessages();
+    return running && !shutdown_requested;
+}
+
+void CreateFrameTimer() {
+    frame_timer = CreateWaitableTimerExW(NULL, NULL, CREATE_WAITABLE_TIMER_HIGH_RESOLUTION, TIMER_ALL_ACCESS);
+    if (!frame_timer) {
+        timeBeginPeriod(1);
+        coarse_timer = true;
+        frame_timer = CreateWaitableTimerExW(NULL, NULL, 0, TIMER_ALL_ACCESS);
+    }
+}
+
+void DestroyFrameTimer() {
+    if (frame_timer) CloseHandle(frame_timer);
+    if (coarse_timer) timeEndPeriod(1);
+    frame_timer = NULL;
+    coarse_timer = false;
+}
+
+unsigned ModifierMask(int ctrl, int shift, int alt) {
+    return (ctrl ? HOTKEY_MOD_CTRL : 0) | (shift ? HOTKEY_MOD_SHIFT : 0) | (alt ? HOTKEY_MOD_ALT : 0);
+}
+
+void CompileHotkeys() {
+    AcquireSRWLockExclusive(&binding_lock);
+    std::vector<HotkeyBinding> all(base_bindings);
+    all.insert(all.end(), extra_bindings.begin(), extra_bindings.end());
+    bindings_dirty = false;
+    ReleaseSRWLockExclusive(&binding_lock);
+    hotkeys.compile(all);
+}
+
+void RunHotkeyAction(const HotkeyBinding& binding) {
+    float step = binding.param > 0.0f ? binding.param : 0.5f;
+    switch (binding.action) {
+    case ACTION_TOGGLE:
+        lens_visible = !lens_visible;
+        break;
+    case ACTION_ZOOM_IN:
+        MAG_FACTOR = std::min(10.0f, MAG_FACTOR + step);
+        break;
+    case ACTION_ZOOM_OUT:
+        MAG_FACTOR = std::max(1.0f, MAG_FACTOR - step);
+        break;
+    case ACTION_ZOOM_PRESET:
+        MAG_FACTOR = std::max(1.0f, std::min(10.0f, binding.param));
+        break;
+    case ACTION_LENS_STEP:
+        LENS_WIDTH = std::max(50, std::min(1000, LENS_WIDTH + (int)binding.param));
+        LENS_HEIGHT = LENS_WIDTH;
+        break;
+    case ACTION_CYCLE_SHAPE:
+        LENS_SHAPE = (LENS_SHAPE + 1) % 2;
+        break;
+    }
+    // No Win32 calls from the hook: the next frame applies the change, and a
+    // zoom change becomes the target zoom_anim eases toward
+}
+
+bool MouseEventToInput(WPARAM wParam, const MSLLHOOKSTRUCT* ms, InputEvent* ev) {
+    switch (wParam) {
+    case WM_MOUSEWHEEL:
+        ev->vk = GET_WHEEL_DELTA_WPARAM(ms->mouseData) > 0 ? HOTKEY_WHEEL_UP : HOTKEY_WHEEL_DOWN;
+        ev->down = true;
+        return true;
+    case WM_LBUTTONDOWN: case WM_LBUTTONUP:
+        ev->vk = 0x01;
+        ev->down = wParam == WM_LBUTTONDOWN;
+        return true;
+    case WM_RBUTTONDOWN: case WM_RBUTTONUP:
+        ev->vk = 0x02;
+        ev->down = wParam == WM_RBUTTONDOWN;
+        return true;
+    case WM_MBUTTONDOWN: case WM_MBUTTONUP:
+        ev->vk = 0x04;
+        ev->down = wParam == WM_MBUTTONDOWN;
+        return true;
+    case WM_XBUTTONDOWN: case WM_XBUTTONUP:
+        ev->vk = HIWORD(ms->mouseData) == XBUTTON1 ? 0x05 : 0x06;
+        ev->down = wParam == WM_XBUTTONDOWN;
+        return true;
+    }
+    return false;
+}
+
+LRESULT CALLBACK MouseHookProc(int nCode, WPARAM wParam, LPARAM lParam) {
+    if (nCode >= 0 && running) {
+        const MSLLHOOKSTRUCT* ms = (const MSLLHOOKSTRUCT*)lParam;
+        cursor_x = ms->pt.x;
+        cursor_y = ms->pt.y;
+        InputEvent ev;
+        if (MouseEventToInput(wParam, ms, &ev)) {
             double start_time = GetCurrentTimeMs();
-            MAG_FACTOR = std::max(1.0f, MAG_FACTOR - 0.5f);
-            if (hwnd_mag) {
-                MAGTRANSFORM matrix = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-                pMagSetWindowTransform(hwnd_mag, &matrix);
-                update();
+            const HotkeyBinding* binding = hotkeys.feed(ev);
+            if (binding) RunHotkeyAction(*binding);
+            trace.span(TRACE_HOOK, start_time, binding ? ev.vk : 0, binding ? binding->action : 0);
+            if (binding) {
+                hotkey_latency.record(GetCurrentTimeMs() - start_time);
+                if (wParam == WM_MOUSEWHEEL) return 1;
             }
-            double end_time = GetCurrentTimeMs();
-            char msg[100];
-            sprintf(msg, "Zoom out latency: %.2f ms", end_time - start_time);
-            DebugLog(msg);
-            return 1;
         }
     }
     return CallNextHookEx(mouse_hook, nCode, wParam, lParam);
 }
 
+LRESULT CALLBACK KeyboardHookProc(int nCode, WPARAM wParam, LPARAM lParam) {
+    if (nCode >= 0 && running) {
+        KBDLLHOOKSTRUCT* kb = (KBDLLHOOKSTRUCT*)lParam;
+        InputEvent ev = { (int)kb->vkCode, wParam == WM_KEYDOWN || wParam == WM_SYSKEYDOWN };
+        double start_time = GetCurrentTimeMs();
+        const HotkeyBinding* binding = hotkeys.feed(ev);
+        if (binding) {
+            RunHotkeyAction(*binding);
+            hotkey_latency.record(GetCurrentTimeMs() - start_time);
+        }
+        // Key codes only for hotkeys: a shared trace must not double as a key log
+        trace.span(TRACE_HOOK, start_time, binding ? ev.vk : 0, binding ? binding->action : 0);
+    }
+    return CallNextHookEx(keyboard_hook, nCode, wParam, lParam);
+}
+
+struct MonitorEnumState {
+    MonitorRect* out;
+    int max;
+    int count;
+};
+
+BOOL CALLBACK CollectMonitor(HMONITOR monitor, HDC, LPRECT, LPARAM param) {
+    MonitorEnumState* state = (MonitorEnumState*)param;
+    MONITORINFO info;
+    info.cbSize = sizeof(info);
+    if (state->count < state->max && GetMonitorInfoW(monitor, &info)) {
+        MonitorRect m = { info.rcMonitor.left, info.rcMonitor.top, info.rcMonitor.right, info.rcMonitor.bottom,
+            (info.dwFlags & MONITORINFOF_PRIMARY) != 0 };
+        state->out[state->count++] = m;
+    }
+    return TRUE;
+}
+
+int EnumerateMonitors(void*, MonitorRect* out, int max) {
+    MonitorEnumState state = { out, max, 0 };
+    EnumDisplayMonitors(NULL, NULL, CollectMonitor, (LPARAM)&state);
+    return state.count;
+}
+
+DisplayPlatform display_platform = { EnumerateMonitors, NULL };
+DisplayGeometry displays(display_platform);
+
 LRESULT CALLBACK WndProc(HWND hwnd, UINT msg, WPARAM wParam, LPARAM lParam) {
     if (msg == WM_DESTROY) {
         PostQuitMessage(0);
         return 0;
     }
+    if (msg == WM_DISPLAYCHANGE) {
+        // Sent to every top-level window; the next frame enumerates the new layout
+        displays.invalidate();
+        return 0;
+    }
     if (msg == WM_PAINT) {
         PAINTSTRUCT ps;
         HDC hdc = BeginPaint(hwnd, &ps);
-        if (DOT_ENABLED) {
-            HBRUSH brush = CreateSolidBrush(RGB(DOT_R, DOT_G, DOT_B));
-            HPEN pen = CreatePen(PS_SOLID, 1, RGB(DOT_R, DOT_G, DOT_B));
-            SelectObject(hdc, brush);
-            SelectObject(hdc, pen);
-            int cx = LENS_WIDTH / 2;
-            int cy = LENS_HEIGHT / 2;
-            Ellipse(hdc, cx - DOT_SIZE, cy - DOT_SIZE, cx + DOT_SIZE, cy + DOT_SIZE);
-            DeleteObject(brush);
-            DeleteObject(pen);
+        const OverlayStyle& overlay = render_state.overlay.value;
+        if (overlay.dot_enabled) {
+            COLORREF color = RGB(overlay.r, overlay.g, overlay.b);
+            if (!dot_brush || color != dot_color) {
+                if (dot_brush) DeleteObject(dot_brush);
+                if (dot_pen) DeleteObject(dot_pen);
+                dot_brush = CreateSolidBrush(color);
+                dot_pen = CreatePen(PS_SOLID, 1, color);
+                dot_color = color;
+            }
+            HGDIOBJ old_brush = SelectObject(hdc, dot_brush);
+            HGDIOBJ old_pen = SelectObject(hdc, dot_pen);
+            int cx = render_state.geometry.value.width / 2;
+            int cy = render_state.geometry.value.height / 2;
+            Ellipse(hdc, cx - overlay.dot_size, cy - overlay.dot_size, cx + overlay.dot_size, cy + overlay.dot_size);
+            SelectObject(hdc, old_brush);
+            SelectObject(hdc, old_pen);
         }
         EndPaint(hwnd, &ps);
         return 0;
@@ -133,40 +341,148 @@ LRESULT CALLBACK WndProc(HWND hwnd, UINT msg, WPARAM wParam, LPARAM lParam) {
     return DefWindowProc(hwnd, msg, wParam, lParam);
 }
 
-static int screen_cx = 0;
-static int screen_cy = 0;
+// Runs on the magnifier thread at a frame boundary. Zoom is only taken from the
+// snapshot when the GUI actually changed it, so a lens-size drag cannot undo a
+// wheel zoom the GUI has not seen yet.
+void ApplySettingsSnapshot(const SettingsSnapshot& snap) {
+    LENS_WIDTH = snap.lens_size;
+    LENS_HEIGHT = snap.lens_size;
+    if (snap.zoom != last_snapshot_zoom) {
+        MAG_FACTOR = snap.zoom;
+        last_snapshot_zoom = snap.zoom;
+    }
+    LENS_SHAPE = snap.lens_shape;
+    DOT_ENABLED = snap.dot_enabled;
+    DOT_SIZE = snap.dot_size;
+    DOT_R = snap.dot_r;
+    DOT_G = snap.dot_g;
+    DOT_B = snap.dot_b;
+    TARGET_FPS = snap.fps;
+    trace.event(TRACE_SETTINGS, snap.zoom, snap.lens_size, snap.fps);
+}
 
-void update() {
-    if (screen_cx == 0) {
-        screen_cx = GetSystemMetrics(SM_CXSCREEN) / 2;
-        screen_cy = GetSystemMetrics(SM_CYSCREEN) / 2;
+void ReleaseRenderResources() {
+    if (dot_brush) DeleteObject(dot_brush);
+    if (dot_pen) DeleteObject(dot_pen);
+    if (lens_rgn) DeleteObject(lens_rgn);
+    dot_brush = NULL;
+    dot_pen = NULL;
+    lens_rgn = NULL;
+    lens_rgn_w = lens_rgn_h = 0;
+}
+
+HRGN CopyLensRegion(int width, int height) {
+    if (!lens_rgn || lens_rgn_w != width || lens_rgn_h != height) {
+        if (lens_rgn) DeleteObject(lens_rgn);
+        lens_rgn = CreateEllipticRgn(0, 0, width, height);
+        lens_rgn_w = width;
+        lens_rgn_h = height;
     }
+    // SetWindowRgn takes ownership of the region it is given, so hand it a copy
+    HRGN copy = CreateRectRgn(0, 0, 0, 0);
+    CombineRgn(copy, lens_rgn, NULL, RGN_COPY);
+    return copy;
+}
 
-    float src_w = (float)LENS_WIDTH / MAG_FACTOR;
-    float src_h = (float)LENS_HEIGHT / MAG_FACTOR;
+void ApplyRenderState() {
+    if (!hwnd_host || !hwnd_mag) return;
 
-    RECT rect;
-    rect.left   = (int)(screen_cx - src_w * 0.5f + 0.5f);
-    rect.top    = (int)(screen_cy - src_h * 0.5f + 0.5f);
-    rect.right  = (int)(screen_cx + src_w * 0.5f + 0.5f);
-    rect.bottom = (int)(screen_cy + src_h * 0.5f + 0.5f);
+    unsigned ops = DiffRenderState(render_state, render_applied);
+    unsigned calls = 0;
+    double window_start = trace.now();
 
-    if (hwnd_mag && pMagSetWindowSource) {
+    if (ops & RENDER_OP_BIT(OP_GEOMETRY)) {
+        const LensGeometry& g = render_state.geometry.value;
+        SetWindowPos(hwnd_host, NULL, g.x, g.y, g.width, g.height, SWP_NOZORDER | SWP_NOACTIVATE);
+        SetWindowPos(hwnd_mag, NULL, 0, 0, g.width, g.height, SWP_NOMOVE | SWP_NOZORDER);
+        calls += 2;
+    }
+    if (ops & RENDER_OP_BIT(OP_REGION)) {
+        const LensRegion& r = render_state.region.value;
+        SetWindowRgn(hwnd_host, r.shape == 0 ? CopyLensRegion(r.width, r.height) : NULL, TRUE);
+        calls++;
+    }
+    if (ops & RENDER_OP_BIT(OP_TRANSFORM)) {
+        float zoom = render_state.zoom.value;
+        MAGTRANSFORM matrix = { {{ zoom, 0.0f, 0.0f }, { 0.0f, zoom, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
+        double start = trace.now();
+        pMagSetWindowTransform(hwnd_mag, &matrix);
+        trace.span(TRACE_SET_TRANSFORM, start, (int)(zoom * 1000.0f), 0);
+        calls++;
+    }
+    if (ops & RENDER_OP_BIT(OP_SOURCE)) {
+        const SourceRect& src = render_state.source.value;
+        RECT rect = { src.left, src.top, src.right, src.bottom };
+        double start = trace.now();
         pMagSetWindowSource(hwnd_mag, rect);
+        trace.span(TRACE_SET_SOURCE, start, src.left, src.top);
+        calls++;
     }
-
-    if (DOT_ENABLED && hwnd_host) {
+    if (ops & RENDER_OP_BIT(OP_REFRESH)) {
+        InvalidateRect(hwnd_mag, NULL, FALSE);
+        calls++;
+    }
+    if (ops & RENDER_OP_BIT(OP_VISIBILITY)) {
+        ShowWindow(hwnd_host, render_state.visible.value ? SW_SHOW : SW_HIDE);
+        trace.event(TRACE_VISIBILITY, 0.0f, render_state.visible.value ? 1 : 0, 0);
+        calls++;
+    }
+    if (ops & RENDER_OP_BIT(OP_OVERLAY)) {
         InvalidateRect(hwnd_host, NULL, TRUE);
+        calls++;
     }
+
+    MarkRenderApplied(render_state, render_applied, ops);
+    CountRenderOps(render_counters, ops, calls);
+    // The whole apply; the analyzer takes the Mag call spans inside it out again
+    unsigned window_ops = ops & ~(RENDER_OP_BIT(OP_SOURCE) | RENDER_OP_BIT(OP_TRANSFORM));
+    if (window_ops) trace.span(TRACE_WINDOW_OPS, window_start, (int)window_ops, (int)calls);
 }
 
-DWORD WINAPI MagnifierThread(LPVOID param) {
-    DebugLog("Thread started");
+void update() {
+    if (displays.refresh_if_stale()) trace.event(TRACE_DISPLAYS, 0.0f, displays.count(), (int)displays.refreshes());
+    if (track_dirty) {
+        // Exclusive: clearing track_dirty is a write, and SetSourceTracking must not set it in between
+        AcquireSRWLockExclusive(&track_lock);
+        tracker.set_target(track_request);
+        track_dirty = false;
+        ReleaseSRWLockExclusive(&track_lock);
+    }
+    TrackedView view;
+    tracker.resolve(displays, cursor_x, cursor_y, LENS_WIDTH, LENS_HEIGHT, &view);
+
+    LensGeometry geometry = { view.lens_x, view.lens_y, LENS_WIDTH, LENS_HEIGHT };
+    LensRegion region = { LENS_WIDTH, LENS_HEIGHT, LENS_SHAPE };
+    OverlayStyle overlay = { DOT_ENABLED, DOT_SIZE, DOT_R, DOT_G, DOT_B };
+    render_state.geometry.set(geometry);
+    render_state.region.set(region);
+    render_state.overlay.set(overlay);
+    render_state.visible.set(lens_visible && running);
+    zoom_anim.set_duration(zoom_anim_ms);
+    float zoom = zoom_anim.step(MAG_FACTOR, GetCurrentTimeMs());
+    render_state.set_view(view.cx, view.cy, LENS_WIDTH, LENS_HEIGHT, zoom);
+
+    ApplyRenderState();
+}
 
+void TeardownMagnifier() {
+    DestroyFrameTimer();
+    if (hwnd_mag) DestroyWindow(hwnd_mag);
+    if (hwnd_host) DestroyWindow(hwnd_host);
+    if (pMagUninitialize) pMagUninitialize();
+    if (hMag) FreeLibrary(hMag);
+    ReleaseRenderResources();
+    hwnd_host = hwnd_mag = nullptr;
+    hMag = NULL;
+    pMagInitialize = NULL;
+    pMagUninitialize = NULL;
+}
+
+bool InitMagnifier() {
     hMag = LoadLibraryA("Magnification.dll");
     if (!hMag) {
-        DebugLog("ERROR: Failed to load Magnification.dll");
-        return 1;
+        ReportEngineError(ENGINE_ERR_LOAD_MAGNIFICATION, "Failed to load Magnification.dll");
+        return false;
     }
 
     pMagInitialize = (MagInitializeFunc)GetProcAddress(hMag, "MagInitialize");
@@ -175,9 +491,10 @@ DWORD WINAPI MagnifierThread(LPVOID param) {
     pMagSetWindowTransform = (MagSetWindowTransformFunc)GetProcAddress(hMag, "MagSetWindowTransform");
 
     if (!pMagInitialize || !pMagInitialize()) {
-        DebugLog("ERROR: MagInitialize failed");
-        FreeLibrary(hMag);
-        return 1;
+        ReportEngineError(ENGINE_ERR_MAG_INITIALIZE, "MagInitialize failed");
+        pMagUninitialize = NULL;
+        TeardownMagnifier();
+        return false;
     }
     DebugLog("Magnification initialized");
 
@@ -188,182 +505,341 @@ DWORD WINAPI MagnifierThread(LPVOID param) {
     wc.lpszClassName = L"ScopeZ";
     RegisterClassW(&wc);
 
-    int x = (GetSystemMetrics(SM_CXSCREEN) - LENS_WIDTH) / 2;
-    int y = (GetSystemMetrics(SM_CYSCREEN) - LENS_HEIGHT) / 2;
-
+    // Created hidden; the first resume positions and shows it
     hwnd_host = CreateWindowExW(WS_EX_LAYERED | WS_EX_TRANSPARENT | WS_EX_TOPMOST | WS_EX_NOACTIVATE,
-        wc.lpszClassName, L"", WS_POPUP, x, y, LENS_WIDTH, LENS_HEIGHT, NULL, NULL, instance, NULL);
+        wc.lpszClassName, L"", WS_POPUP, 0, 0, LENS_WIDTH, LENS_HEIGHT, NULL, NULL, instance, NULL);
 
     if (!hwnd_host) {
-        DebugLog("ERROR: Failed to create host window");
-        pMagUninitialize();
-        FreeLibrary(hMag);
-        return 1;
+        ReportEngineError(ENGINE_ERR_HOST_WINDOW, "Failed to create host window");
+        TeardownMagnifier();
+        return false;
     }
 
     SetLayeredWindowAttributes(hwnd_host, RGB(255, 0, 255), 0, LWA_COLORKEY);
 
-    if (LENS_SHAPE == 0) {
-        HRGN region = CreateEllipticRgn(0, 0, LENS_WIDTH, LENS_HEIGHT);
-        SetWindowRgn(hwnd_host, region, TRUE);
-    }
-
     hwnd_mag = CreateWindowExW(0, WC_MAGNIFIERW, L"", WS_CHILD | WS_VISIBLE,
         0, 0, LENS_WIDTH, LENS_HEIGHT, hwnd_host, NULL, instance, NULL);
 
     if (!hwnd_mag) {
-        DebugLog("ERROR: Failed to create magnifier window");
-        DestroyWindow(hwnd_host);
-        pMagUninitialize();
-        FreeLibrary(hMag);
-        return 1;
+        ReportEngineError(ENGINE_ERR_MAG_WINDOW, "Failed to create magnifier window");
+        TeardownMagnifier();
+        return false;
     }
 
-    MAGTRANSFORM matrix = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-    pMagSetWindowTransform(hwnd_mag, &matrix);
+    render_applied = RenderApplied();
+    CreateFrameTimer();
+    return true;
+}
+
+void ResumeEngine(FramePacer& pacer) {
+    lens_visible = true;
+    // The layout may have changed while the thread was not pumping messages
+    displays.invalidate();
+    POINT cursor;
+    if (GetCursorPos(&cursor)) {
+        cursor_x = cursor.x;
+        cursor_y = cursor.y;
+    }
+    render_counters = RenderCounters();
+    // Anything posted while suspended predates the settings StartMagnifier just
+    // set; this thread is the mailbox's only reader, so it drops them here
+    settings_mailbox.discard();
+    zoom_anim.jump(MAG_FACTOR);
     update();
-    ShowWindow(hwnd_host, SW_SHOW);
+    PublishCounters();
 
+    CompileHotkeys();
+    hotkeys.set_modifiers(ModifierMask(GetAsyncKeyState(VK_CONTROL) & 0x8000,
+        GetAsyncKeyState(VK_SHIFT) & 0x8000, GetAsyncKeyState(VK_MENU) & 0x8000));
     mouse_hook = SetWindowsHookEx(WH_MOUSE_LL, MouseHookProc, GetModuleHandle(NULL), 0);
+    keyboard_hook = SetWindowsHookEx(WH_KEYBOARD_LL, KeyboardHookProc, GetModuleHandle(NULL), 0);
+    if (!mouse_hook || !keyboard_hook) {
+        ReportEngineError(ENGINE_ERR_HOOK, "Failed to install input hooks, hotkeys are disabled", false);
+    } else {
+        engine_state.clear_error();
+    }
 
-    bool toggled = true;
-    bool prev_toggle_state = false;
-    MSG msg;
+    pacer.set_fps(TARGET_FPS);
+    pacer.reset();
+    trace.event(TRACE_RESUME, MAG_FACTOR, LENS_WIDTH, TARGET_FPS);
+    DebugLog("Magnifier resumed");
+}
 
-    while (running) {
-        while (PeekMessageW(&msg, NULL, 0, 0, PM_REMOVE)) {
-            TranslateMessage(&msg);
-            DispatchMessageW(&msg);
-        }
+void SuspendEngine(const FramePacer& pacer) {
+    if (mouse_hook) UnhookWindowsHookEx(mouse_hook);
+    if (keyboard_hook) UnhookWindowsHookEx(keyboard_hook);
+    mouse_hook = NULL;
+    keyboard_hook = NULL;
+    update();
+    PublishCounters();
+
+    const PacerCounters& pacing = pacer.counters();
+    char summary[160];
+    sprintf(summary, "Pacing: %llu frames, %llu late, %llu missed deadlines, max lateness %.2f ms",
+        pacing.frames, pacing.late_frames, pacing.missed_deadlines, pacing.max_lateness_ms);
+    DebugLog(summary);
+    sprintf(summary, "Render: %llu frames, %llu syscalls, %llu source updates, %llu transform updates",
+        render_counters.frames, render_counters.syscalls,
+        render_counters.op_calls[OP_SOURCE], render_counters.op_calls[OP_TRANSFORM]);
+    DebugLog(summary);
+    sprintf(summary, "Hotkey latency: %llu events, p50 %.3f ms, p99 %.3f ms",
+        hotkey_latency.count(), hotkey_latency.percentile(50), hotkey_latency.percentile(99));
+    DebugLog(summary);
+    trace.event(TRACE_SUSPEND, 0.0f, 0, 0);
+    DebugLog("Magnifier suspended");
+    engine_state.publish(MAG_FACTOR, LENS_WIDTH, LENS_SHAPE, false, false);
+}
 
-        bool current_toggle = (GetAsyncKeyState(TOGGLE_KEY) & 0x8000) != 0;
-        if (current_toggle && !prev_toggle_state) {
-            toggled = !toggled;
-        }
-        prev_toggle_state = current_toggle;
+// Initializes once, then alternates between the frame loop (active) and an
+// idle wait on wake_event (suspended) until ShutdownMagnifier. Every
+// transition is acknowledged through ack_event.
+DWORD WINAPI MagnifierThread(LPVOID param) {
+    DebugLog("Thread started");
+    if (!InitMagnifier()) {
+        running = false;
+        return 1;
+    }
 
-        bool ctrl = (GetAsyncKeyState(VK_CONTROL) & 0x8000) != 0;
-        bool shift = (GetAsyncKeyState(VK_SHIFT) & 0x8000) != 0;
-        bool alt = (GetAsyncKeyState(VK_MENU) & 0x8000) != 0;
+    PacerPlatform platform = { PacerNow, PacerWait, NULL };
+    FramePacer pacer(platform, TARGET_FPS);
+    bool active = false;
 
-        bool zoom_in_pressed = (GetAsyncKeyState(ZOOM_IN_KEY) & 0x8000) != 0;
-        bool zoom_out_pressed = (GetAsyncKeyState(ZOOM_OUT_KEY) & 0x8000) != 0;
+    while (!shutdown_requested) {
+        if (running != active) {
+            if (running) ResumeEngine(pacer);
+            else SuspendEngine(pacer);
+            active = !active;
+            SetEvent(ack_event);
+        }
+        if (!active) {
+            MsgWaitForMultipleObjectsEx(1, &wake_event, INFINITE, QS_ALLINPUT, MWMO_INPUTAVAILABLE);
+            PumpMessages();
+            continue;
+        }
 
-        bool zoom_in_mods = (!ZOOM_IN_CTRL || ctrl) && (!ZOOM_IN_SHIFT || shift) && (!ZOOM_IN_ALT || alt);
-        bool zoom_out_mods = (!ZOOM_OUT_CTRL || ctrl) && (!ZOOM_OUT_SHIFT || shift) && (!ZOOM_OUT_ALT || alt);
+        pacer.set_fps(TARGET_FPS);
+        bool due = pacer.wait_for_frame();
+        pacing_counters = pacer.counters();
+        if (!due) continue;
 
-        static bool prev_zoom_in = false;
-        static bool prev_zoom_out = false;
+        double frame_start = GetCurrentTimeMs();
+        if (bindings_dirty) CompileHotkeys();
 
-        if (zoom_in_pressed && zoom_in_mods && !prev_zoom_in) {
-            MAG_FACTOR = std::min(10.0f, MAG_FACTOR + 0.5f);
-            MAGTRANSFORM m = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-            pMagSetWindowTransform(hwnd_mag, &m);
-            update();
-        }
-        if (zoom_out_pressed && zoom_out_mods && !prev_zoom_out) {
-            MAG_FACTOR = std::max(1.0f, MAG_FACTOR - 0.5f);
-            MAGTRANSFORM m = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-            pMagSetWindowTransform(hwnd_mag, &m);
-            update();
-        }
-        prev_zoom_in = zoom_in_pressed;
-        prev_zoom_out = zoom_out_pressed;
+        SettingsSnapshot snap;
+        if (settings_mailbox.read(&snap)) ApplySettingsSnapshot(snap);
 
-        if (toggled) {
-            update();
-            ShowWindow(hwnd_host, SW_SHOW);
-        } else {
-            ShowWindow(hwnd_host, SW_HIDE);
-        }
+        update();
 
-        Sleep(1);
-    }
+        double frame_ms = GetCurrentTimeMs() - frame_start;
+        trace.span(TRACE_FRAME, frame_start, (int)pacing_counters.frames, (int)(pacing_counters.last_lateness_ms * 1000.0));
+        frame_time.record(frame_ms);
+        if (frame_ms > frame_time_max) frame_time_max = frame_ms;
+        PublishCounters();
 
-    if (mouse_hook) UnhookWindowsHookEx(mouse_hook);
-    if (hwnd_mag) DestroyWindow(hwnd_mag);
-    if (hwnd_host) DestroyWindow(hwnd_host);
-    if (pMagUninitialize) pMagUninitialize();
-    if (hMag) FreeLibrary(hMag);
+        engine_state.publish(MAG_FACTOR, LENS_WIDTH, LENS_SHAPE, lens_visible, true);
+    }
 
-    hwnd_host = hwnd_mag = nullptr;
-    mouse_hook = NULL;
-    DebugLog("Magnifier stopped");
     running = false;
+    if (active) SuspendEngine(pacer);
+    TeardownMagnifier();
+    DebugLog("Magnifier stopped");
     return 0;
 }
 
-extern "C" __declspec(dllexport) void StartMagnifier(int lens_size, float zoom_factor, int toggle_key, int zoom_in_key, int zoom_in_ctrl, int zoom_in_shift, int zoom_in_alt, int zoom_out_key, int zoom_out_ctrl, int zoom_out_shift, int zoom_out_alt, int lens_shape, int dot_enabled, int dot_size, int dot_r, int dot_g, int dot_b, int fps) {
-    if (running) return;
-
-    LENS_WIDTH = lens_size;
-    LENS_HEIGHT = lens_size;
-    MAG_FACTOR = zoom_factor;
-    TOGGLE_KEY = toggle_key;
-    ZOOM_IN_KEY = zoom_in_key;
-    ZOOM_IN_CTRL = zoom_in_ctrl != 0;
-    ZOOM_IN_SHIFT = zoom_in_shift != 0;
-    ZOOM_IN_ALT = zoom_in_alt != 0;
-    ZOOM_OUT_KEY = zoom_out_key;
-    ZOOM_OUT_CTRL = zoom_out_ctrl != 0;
-    ZOOM_OUT_SHIFT = zoom_out_shift != 0;
-    ZOOM_OUT_ALT = zoom_out_alt != 0;
-    LENS_SHAPE = lens_shape;
-    DOT_ENABLED = dot_enabled != 0;
-    DOT_SIZE = dot_size;
-    DOT_R = dot_r;
-    DOT_G = dot_g;
-    DOT_B = dot_b;
-
-    screen_cx = screen_cy = 0;
-    running = true;
-
-    CreateThread(NULL, 0, MagnifierThread, NULL, 0, NULL);
+bool EnsureEngineThread() {
+    if (engine_thread) {
+        if (WaitForSingleObject(engine_thread, 0) == WAIT_TIMEOUT) return true;
+        // A previous initialization failed; start over
+        CloseHandle(engine_thread);
+        engine_thread = NULL;
+    }
+    if (!wake_event) wake_event = CreateEventW(NULL, FALSE, FALSE, NULL);
+    if (!ack_event) ack_event = CreateEventW(NULL, FALSE, FALSE, NULL);
+    if (!wake_event || !ack_event) return false;
+    shutdown_requested = false;
+    engine_thread = CreateThread(NULL, 0, MagnifierThread, NULL, 0, NULL);
+    return engine_thread != NULL;
 }
 
-extern "C" __declspec(dllexport) void StopMagnifier() {
-    if (running) {
+// Caller holds command_lock. Returns 1 once the engine thread has acknowledged
+// the new state, 0 if it exited (initialization failed) or timed out.
+int SendEngineCommand(bool active) {
+    if (!active && !engine_thread) {
         running = false;
-        Sleep(100);
+        return 1;
+    }
+    if (active && !EnsureEngineThread()) {
+        ReportEngineError(ENGINE_ERR_HOST_WINDOW, "Failed to start magnifier thread");
+        return 0;
     }
+    ResetEvent(ack_event);
+    bool previous = running;
+    running = active;
+    SetEvent(wake_event);
+    HANDLE handles[2] = { ack_event, engine_thread };
+    if (WaitForMultipleObjects(2, handles, FALSE, COMMAND_TIMEOUT_MS) == WAIT_OBJECT_0) return 1;
+    // Not acknowledged: keep reporting the state the engine last confirmed,
+    // and the engine switches back to it if it acts on the request late
+    running = previous;
+    return 0;
 }
 
-extern "C" __declspec(dllexport) void UpdateSettings(int lens_size, float zoom_factor, int lens_shape, int dot_enabled, int dot_size, int dot_r, int dot_g, int dot_b, int fps) {
+extern "C" __declspec(dllexport) int StartMagnifier(int lens_size, float zoom_factor, int toggle_key, int zoom_in_key, int zoom_in_ctrl, int zoom_in_shift, int zoom_in_alt, int zoom_out_key, int zoom_out_ctrl, int zoom_out_shift, int zoom_out_alt, int lens_shape, int dot_enabled, int dot_size, int dot_r, int dot_g, int dot_b, int fps) {
+    AcquireSRWLockExclusive(&command_lock);
+    if (running) {
+        ReleaseSRWLockExclusive(&command_lock);
+        return 1;
+    }
+
     LENS_WIDTH = lens_size;
     LENS_HEIGHT = lens_size;
     MAG_FACTOR = zoom_factor;
+    AcquireSRWLockExclusive(&binding_lock);
+    base_bindings.clear();
+    HotkeyBinding toggle = { toggle_key, 0, ACTION_TOGGLE, 0.0f };
+    HotkeyBinding zoom_in = { zoom_in_key, ModifierMask(zoom_in_ctrl, zoom_in_shift, zoom_in_alt), ACTION_ZOOM_IN, 0.5f };
+    HotkeyBinding zoom_out = { zoom_out_key, ModifierMask(zoom_out_ctrl, zoom_out_shift, zoom_out_alt), ACTION_ZOOM_OUT, 0.5f };
+    base_bindings.push_back(toggle);
+    base_bindings.push_back(zoom_in);
+    base_bindings.push_back(zoom_out);
+    bindings_dirty = true;
+    ReleaseSRWLockExclusive(&binding_lock);
     LENS_SHAPE = lens_shape;
     DOT_ENABLED = dot_enabled != 0;
     DOT_SIZE = dot_size;
     DOT_R = dot_r;
     DOT_G = dot_g;
     DOT_B = dot_b;
+    TARGET_FPS = fps;
+    last_snapshot_zoom = zoom_factor;
+
+    engine_state.clear_error();
+    hotkey_latency.reset();
+    frame_time.reset();
+    frame_time_max = 0.0;
+    pacing_counters = PacerCounters();
+    // The engine is suspended, so this thread is the only writer
+    PublishCounters();
+    debug_log.start("scope_z_debug.log", GetCurrentTimeMs);
+
+    int ok = SendEngineCommand(true);
+    ReleaseSRWLockExclusive(&command_lock);
+    return ok;
+}
 
-    screen_cx = screen_cy = 0;
+// Suspends the engine: the lens is hidden and the input hooks are removed,
+// but Magnification, the windows and the thread stay alive for the next start.
+extern "C" __declspec(dllexport) int StopMagnifier() {
+    AcquireSRWLockExclusive(&command_lock);
+    int ok = running ? SendEngineCommand(false) : 1;
+    ReleaseSRWLockExclusive(&command_lock);
+    return ok;
+}
 
-    if (hwnd_mag && pMagSetWindowTransform) {
-        MAGTRANSFORM matrix = { {{ MAG_FACTOR, 0.0f, 0.0f }, { 0.0f, MAG_FACTOR, 0.0f }, { 0.0f, 0.0f, 1.0f }} };
-        pMagSetWindowTransform(hwnd_mag, &matrix);
+// Tears the engine down and joins its thread. Returns 0 if the thread did not
+// exit within timeout_ms; it can be called again to keep waiting.
+extern "C" __declspec(dllexport) int ShutdownMagnifier(int timeout_ms) {
+    AcquireSRWLockExclusive(&command_lock);
+    int ok = 1;
+    if (engine_thread) {
+        running = false;
+        shutdown_requested = true;
+        SetEvent(wake_event);
+        if (WaitForSingleObject(engine_thread, (DWORD)timeout_ms) == WAIT_OBJECT_0) {
+            CloseHandle(engine_thread);
+            engine_thread = NULL;
+        } else {
+            ok = 0;
+        }
+    }
+    if (ok) {
+        trace.stop();
+        debug_log.stop();
     }
+    ReleaseSRWLockExclusive(&command_lock);
+    return ok;
+}
 
-    if (hwnd_host) {
-        int x = (GetSystemMetrics(SM_CXSCREEN) - LENS_WIDTH) / 2;
-        int y = (GetSystemMetrics(SM_CYSCREEN) - LENS_HEIGHT) / 2;
-        SetWindowPos(hwnd_host, NULL, x, y, LENS_WIDTH, LENS_HEIGHT, SWP_NOZORDER | SWP_NOACTIVATE);
-        SetWindowPos(hwnd_mag, NULL, 0, 0, LENS_WIDTH, LENS_HEIGHT, SWP_NOMOVE | SWP_NOZORDER);
+extern "C" __declspec(dllexport) void UpdateSettings(int lens_size, float zoom_factor, int lens_shape, int dot_enabled, int dot_size, int dot_r, int dot_g, int dot_b, int fps) {
+    AcquireSRWLockExclusive(&settings_lock);
+    SettingsSnapshot snap = { ++settings_version, lens_size, zoom_factor, lens_shape, dot_enabled != 0, dot_size, dot_r, dot_g, dot_b, fps };
+    settings_mailbox.write(snap);
+    ReleaseSRWLockExclusive(&settings_lock);
+}
 
-        if (LENS_SHAPE == 0) {
-            HRGN region = CreateEllipticRgn(0, 0, LENS_WIDTH, LENS_HEIGHT);
-            SetWindowRgn(hwnd_host, region, TRUE);
-        } else {
-            SetWindowRgn(hwnd_host, NULL, TRUE);
-        }
+// 0 applies zoom changes in a single frame
+extern "C" __declspec(dllexport) void SetZoomAnimation(int duration_ms) {
+    zoom_anim_ms = duration_ms;
+}
 
-        update();
-        InvalidateRect(hwnd_host, NULL, TRUE);
-    }
+// mode is a TrackMode: x is the monitor index for TRACK_MONITOR (0 is the
+// primary, then left to right), the desktop point is (x, y) for TRACK_POINT
+extern "C" __declspec(dllexport) void SetSourceTracking(int mode, int x, int y) {
+    TrackTarget target = { mode >= TRACK_MONITOR && mode <= TRACK_POINT ? mode : TRACK_MONITOR, x, y };
+    AcquireSRWLockExclusive(&track_lock);
+    track_request = target;
+    track_dirty = true;
+    ReleaseSRWLockExclusive(&track_lock);
 }
 
 extern "C" __declspec(dllexport) float GetCurrentZoom() {
     return MAG_FACTOR;
 }
+
+extern "C" __declspec(dllexport) void ClearHotkeys() {
+    AcquireSRWLockExclusive(&binding_lock);
+    extra_bindings.clear();
+    bindings_dirty = true;
+    ReleaseSRWLockExclusive(&binding_lock);
+}
+
+extern "C" __declspec(dllexport) void AddHotkey(int vk, int ctrl, int shift, int alt, int action, float param) {
+    HotkeyBinding binding = { vk, ModifierMask(ctrl, shift, alt), action, param };
+    AcquireSRWLockExclusive(&binding_lock);
+    extra_bindings.push_back(binding);
+    bindings_dirty = true;
+    ReleaseSRWLockExclusive(&binding_lock);
+}
+
+// Appends to path, keeping the file under max_bytes (0 for no limit).
+// Returns 0 if the file cannot be opened.
+extern "C" __declspec(dllexport) int StartTrace(const char* path, int max_bytes) {
+    AcquireSRWLockExclusive(&command_lock);
+    int ok = trace.start(path, max_bytes, GetCurrentTimeMs, (int)GetCurrentProcessId()) ? 1 : 0;
+    if (ok && running) trace.event(TRACE_RESUME, MAG_FACTOR, LENS_WIDTH, TARGET_FPS);
+    ReleaseSRWLockExclusive(&command_lock);
+    return ok;
+}
+
+// Flushes and closes the trace; returns the records written this session
+extern "C" __declspec(dllexport) unsigned long long StopTrace() {
+    AcquireSRWLockExclusive(&command_lock);
+    trace.stop();
+    unsigned long long written = trace.written();
+    ReleaseSRWLockExclusive(&command_lock);
+    return written;
+}
+
+extern "C" __declspec(dllexport) void SetLogLevel(int level) {
+    debug_log.set_level(level);
+}
+
+extern "C" __declspec(dllexport) void SetLogRotation(int max_bytes, int keep_files) {
+    debug_log.set_rotation(max_bytes, keep_files);
+}
+
+extern "C" __declspec(dllexport) void GetStats(ScopeZStats* out) {
+    if (!out) return;
+    FillStats(out, frame_time, hotkey_latency, published_counters.read(), TARGET_FPS);
+    out->settings_updates = settings_mailbox.written();
+    out->settings_applied = settings_mailbox.read_count();
+    out->zoom_animations = zoom_anim.animations();
+}
+
+extern "C" __declspec(dllexport) ScopeZState* GetStateBlock() {
+    return engine_state.block();
+}
+
+extern "C" __declspec(dllexport) void SetStateCallback(StateCallback callback) {
+    engine_state.set_callback(callback);
+}
@@ -0,0 +1,61 @@
+#pragma once
+#include <atomic>
+
+struct SettingsSnapshot {
+    unsigned int version;
+    int lens_size;
+    float zoom;
+    int lens_shape;
+    bool dot_enabled;
+    int dot_size;
+    int dot_r, dot_g, dot_b;
+    int fps;
+};
+
+// Single-producer/single-consumer triple buffer. The producer always has a
+// private slot to fill, the consumer always has a private slot to read, and the
+// middle slot holds the newest unread value. A burst of writes between two
+// reads therefore collapses into the last one; nothing blocks or allocates.
+template <typename T>
+class TripleBuffer {
+public:
+    TripleBuffer() : middle_(1), back_(0), front_(2), written_(0), read_(0) {
+        slots_[0] = slots_[1] = slots_[2] = T();
+    }
+
+    void write(const T& value) {
+        slots_[back_] = value;
+        unsigned prev = middle_.exchange(back_ | DIRTY, std::memory_order_acq_rel);
+        back_ = prev & INDEX_MASK;
+        written_.fetch_add(1, std::memory_order_relaxed);
+    }
+
+    bool read(T* out) {
+        if (!(middle_.load(std::memory_order_acquire) & DIRTY)) return false;
+        unsigned prev = middle_.exchange(front_, std::memory_order_acq_rel);
+        front_ = prev & INDEX_MASK;
+        *out = slots_[front_];
+        read_.fetch_add(1, std::memory_order_relaxed);
+        return true;
+    }
+
+    // Consumer side: drops the unread value, if any, without counting it as read
+    void discard() {
+        if (!(middle_.load(std::memory_order_acquire) & DIRTY)) return;
+        unsigned prev = middle_.exchange(front_, std::memory_order_acq_rel);
+        front_ = prev & INDEX_MASK;
+    }
+
+    unsigned long long written() const { return written_.load(std::memory_order_relaxed); }
+    unsigned long long read_count() const { return read_.load(std::memory_order_relaxed); }
+
+private:
+    enum { INDEX_MASK = 3, DIRTY = 4 };
+
+    T slots_[3];
+    std::atomic<unsigned> middle_;
+    unsigned back_;
+    unsigned front_;
+    std::atomic<unsigned long long> written_;
+    std::atomic<unsigned long long> read_;
+};
@@ -0,0 +1,118 @@
+import functools
+import numpy as np
+from filters import expand_region
+from resample import NEAREST, resample
+
+LENS_CIRCLE = 0
+LENS_RECTANGLE = 1
+
+
+def source_rect(screen_cx, screen_cy, lens_width, lens_height, zoom):
+    # Same float32 math and truncation as update() in scope_z.cpp
+    src_w = np.float32(lens_width) / np.float32(zoom)
+    src_h = np.float32(lens_height) / np.float32(zoom)
+    half = np.float32(0.5)
+    left = int(np.float32(screen_cx) - src_w * half + half)
+    top = int(np.float32(screen_cy) - src_h * half + half)
+    right = int(np.float32(screen_cx) + src_w * half + half)
+    bottom = int(np.float32(screen_cy) + src_h * half + half)
+    return left, top, right, bottom
+
+
+@functools.lru_cache(maxsize=64)
+def lens_mask(lens_size, shape):
+    if shape != LENS_CIRCLE:
+        return None
+    # Pixel centres inside the ellipse inscribed in (0, 0, lens, lens), like CreateEllipticRgn
+    r = lens_size / 2.0
+    d = (np.arange(lens_size, dtype=np.float32) + 0.5 - r) / r
+    mask = d[:, None] ** 2 + d[None, :] ** 2 <= 1.0
+    mask.setflags(write=False)
+    return mask
+
+
+@functools.lru_cache(maxsize=64)
+def lens_outside(lens_size, shape):
+    mask = lens_mask(lens_size, shape)
+    if mask is None:
+        return None
+    outside = ~mask
+    outside.setflags(write=False)
+    return outside
+
+
+class SoftwareEngine:
+    def __init__(self, screen_width, screen_height):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.screen_cx = screen_width // 2
+        self.screen_cy = screen_height // 2
+        self.lens_size = 300
+        self.zoom = 3.0
+        self.shape = LENS_CIRCLE
+        self.kernel = NEAREST
+        self.filters = None
+        self.scratch = None
+
+    def configure(self, lens_size, zoom, shape, kernel=NEAREST, filters=None):
+        self.lens_size = int(lens_size)
+        self.zoom = float(zoom)
+        self.shape = int(shape)
+        self.kernel = kernel
+        self.filters = filters if filters is not None and filters.active else None
+
+    def source_rect(self):
+        return source_rect(self.screen_cx, self.screen_cy, self.lens_size, self.lens_size, self.zoom)
+
+    @property
+    def mask(self):
+        return lens_mask(self.lens_size, self.shape)
+
+    def crop(self, frame, origin=(0, 0)):
+        left, top, right, bottom = self.source_rect()
+        ox, oy = origin
+        left, right = max(left - ox, 0), min(right - ox, frame.shape[1])
+        top, bottom = max(top - oy, 0), min(bottom - oy, frame.shape[0])
+        if right <= left or bottom <= top:
+            raise ValueError("source rect lies outside the captured frame")
+        return frame[top:bottom, left:right]
+
+    def prepare(self, frame):
+        # With filters the scaled image goes to a scratch buffer first; allocate
+        # it before bands start writing to it from several threads
+        if self.filters is None:
+            return
+        shape = (self.lens_size, self.lens_size) + frame.shape[2:]
+        if self.scratch is None or self.scratch.shape != shape or self.scratch.dtype != frame.dtype:
+            self.scratch = np.zeros(shape, dtype=frame.dtype)
+
+    def resample_region(self, frame, origin=(0, 0), region=None, out=None):
+        src = self.crop(frame, origin)
+        size = self.lens_size
+        target = self.scratch if self.filters is not None else out
+        return resample(src, (size, size), self.zoom, self.kernel, out=target, region=region)
+
+    def finish_region(self, out, region=None):
+        # Filters (from the scratch buffer) and the lens mask for one region of out
+        size = self.lens_size
+        if self.filters is not None:
+            self.filters.apply(self.scratch, out, region)
+        outside = lens_outside(size, self.shape)
+        if outside is not None:
+            top, bottom, left, right = region if region is not None else (0, size, 0, size)
+            # Clear whole BGRA pixels as 32-bit words, not four bytes each
+            pixels = out.view(np.uint32)[..., 0] if out.ndim == 3 and out.shape[2] == 4 and out.dtype == np.uint8 else out
+            pixels[top:bottom, left:right][outside[top:bottom, left:right]] = 0
+        return out
+
+    def render(self, frame, origin=(0, 0), out=None, region=None):
+        # region is (top, bottom, left, right) in lens pixels; only that part of out is written
+        if self.filters is None:
+            return self.finish_region(self.resample_region(frame, origin, region, out), region)
+        size = self.lens_size
+        if out is None:
+            out = np.empty((size, size) + frame.shape[2:], dtype=frame.dtype)
+        self.prepare(frame)
+        self.resample_region(frame, origin, region)
+        # A filtered pixel depends on its neighbours, so the rim around a partial region is redone too
+        return self.finish_region(out, expand_region(region, self.filters.halo, size))
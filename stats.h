@@ -0,0 +1,100 @@
+#pragma once
+#include <atomic>
+#include <thread>
+#include "frame_pacer.h"
+#include "render_state.h"
+#include "histogram.h"
+
+#define SCOPE_Z_STATS_VERSION 3
+
+// Fixed layout shared with GUI.py (ScopeZStats in backends.py). Only append
+// fields and bump SCOPE_Z_STATS_VERSION when it changes.
+struct ScopeZStats {
+    unsigned int version;
+    unsigned int size;
+    unsigned long long frames_rendered;
+    double frame_ms_p50;
+    double frame_ms_p95;
+    double frame_ms_p99;
+    double frame_ms_max;
+    unsigned long long hook_events;
+    double hook_ms_p50;
+    double hook_ms_p95;
+    double hook_ms_p99;
+    unsigned long long late_frames;
+    unsigned long long missed_deadlines;
+    double max_lateness_ms;
+    double syscalls_per_frame;
+    unsigned int last_frame_syscalls;
+    int target_fps;
+    unsigned long long settings_updates;
+    unsigned long long settings_applied;
+    unsigned long long zoom_animations;
+};
+
+// The engine thread's plain counters, published together once per frame
+struct EngineCounters {
+    PacerCounters pacing;
+    RenderCounters render;
+    double frame_ms_max;
+};
+
+// Seqlock around a plain struct with one writer at a time (the engine thread,
+// or a command while the engine is suspended). seq is odd while the writer is
+// copying; a reader retries until it copied between two equal even values, so
+// GetStats never sees a torn struct and the writer never waits.
+template <typename T>
+class SeqlockCell {
+public:
+    SeqlockCell() : seq_(0), value_() {}
+
+    void publish(const T& value) {
+        unsigned seq = seq_.load(std::memory_order_relaxed);
+        seq_.store(seq + 1, std::memory_order_relaxed);
+        std::atomic_thread_fence(std::memory_order_release);
+        value_ = value;
+        seq_.store(seq + 2, std::memory_order_release);
+    }
+
+    T read() const {
+        for (;;) {
+            unsigned before = seq_.load(std::memory_order_acquire);
+            if (!(before & 1)) {
+                T copy = value_;
+                std::atomic_thread_fence(std::memory_order_acquire);
+                if (seq_.load(std::memory_order_relaxed) == before) return copy;
+            }
+            std::this_thread::yield();
+        }
+    }
+
+private:
+    std::atomic<unsigned> seq_;
+    T value_;
+};
+
+inline void FillStats(ScopeZStats* out, const LatencyHistogram& frame_time, const LatencyHistogram& hook_latency,
+                      const EngineCounters& counters, int target_fps) {
+    const PacerCounters& pacing = counters.pacing;
+    const RenderCounters& render = counters.render;
+    out->version = SCOPE_Z_STATS_VERSION;
+    out->size = sizeof(ScopeZStats);
+    out->frames_rendered = render.frames;
+    out->frame_ms_p50 = frame_time.percentile(50);
+    out->frame_ms_p95 = frame_time.percentile(95);
+    out->frame_ms_p99 = frame_time.percentile(99);
+    out->frame_ms_max = counters.frame_ms_max;
+    out->hook_events = hook_latency.count();
+    out->hook_ms_p50 = hook_latency.percentile(50);
+    out->hook_ms_p95 = hook_latency.percentile(95);
+    out->hook_ms_p99 = hook_latency.percentile(99);
+    out->late_frames = pacing.late_frames;
+    out->missed_deadlines = pacing.missed_deadlines;
+    out->max_lateness_ms = pacing.max_lateness_ms;
+    out->syscalls_per_frame = render.frames ? (double)render.syscalls / (double)render.frames : 0.0;
+    out->last_frame_syscalls = render.last_frame_syscalls;
+    out->target_fps = target_fps;
+    out->settings_updates = 0;
+    out->settings_applied = 0;
+    out->zoom_animations = 0;
+}
@@ -0,0 +1,136 @@
+import numpy as np
+
+from filters import expand_region
+from resample import axis_taps
+
+SOURCE_TILE = 16
+DEST_TILE = 64
+# Above this share of dirty destination tiles one full render is cheaper than many regions
+FULL_RENDER_RATIO = 0.5
+
+
+def _words(src):
+    if src.ndim == 3 and src.shape[2] == 4 and src.dtype == np.uint8:
+        return src.view(np.uint32)[..., 0]
+    return src
+
+
+def _tile_footprints(out_size, zoom, src_size, kernel, source_tile, dest_tile):
+    # For each destination tile along one axis, the first and last source tile it reads
+    taps = axis_taps(out_size, zoom, src_size, kernel)
+    starts = np.arange(0, out_size, dest_tile)
+    ends = np.minimum(starts + dest_tile, out_size)
+    return starts, ends, taps.index0[starts] // source_tile, taps.index1[ends - 1] // source_tile
+
+
+class TileCache:
+    # Change detection for the software pipeline. The captured source rect is
+    # compared with the previous capture in small tiles; the result decides
+    # whether a frame can be skipped outright or which destination tiles need
+    # to be resampled again into the retained output buffer.
+    def __init__(self, source_tile=SOURCE_TILE, dest_tile=DEST_TILE):
+        self.source_tile = source_tile
+        self.dest_tile = dest_tile
+        self.previous = None
+        self.key = None
+        self.buffer = None
+        self.frames_skipped = 0
+        self.frames_partial = 0
+        self.frames_full = 0
+        self.tiles_rendered = 0
+        self.tiles_total = 0
+
+    def reset(self):
+        self.previous = None
+        self.key = None
+
+    def dirty_source_tiles(self, words):
+        changed = words != self.previous
+        if changed.ndim == 3:
+            changed = changed.any(axis=2)
+        if not changed.any():
+            return None
+        np.copyto(self.previous, words)
+        t = self.source_tile
+        rows = np.arange(0, changed.shape[0], t)
+        cols = np.arange(0, changed.shape[1], t)
+        return np.add.reduceat(np.add.reduceat(changed, rows, axis=0), cols, axis=1) > 0
+
+    def plan(self, src, key, lens_size, zoom, kernel):
+        # Returns None for a full render, [] when nothing changed, otherwise a
+        # list of (top, bottom, left, right) regions to render
+        words = _words(src)
+        if key != self.key or self.previous is None or self.previous.shape != words.shape:
+            self.key = key
+            self.previous = words.copy()
+            return None
+        tiles = -(-lens_size // self.dest_tile)
+        self.tiles_total += tiles * tiles
+        dirty = self.dirty_source_tiles(words)
+        if dirty is None:
+            return []
+
+        row_starts, row_ends, row_lo, row_hi = _tile_footprints(lens_size, zoom, src.shape[0], kernel,
+                                                                self.source_tile, self.dest_tile)
+        col_starts, col_ends, col_lo, col_hi = _tile_footprints(lens_size, zoom, src.shape[1], kernel,
+                                                                self.source_tile, self.dest_tile)
+        # Summed-area table: any dirty source tile inside a destination tile's footprint
+        table = np.zeros((dirty.shape[0] + 1, dirty.shape[1] + 1), dtype=np.int32)
+        table[1:, 1:] = dirty.cumsum(axis=0).cumsum(axis=1)
+        r0, r1 = row_lo[:, None], row_hi[:, None] + 1
+        c0, c1 = col_lo[None, :], col_hi[None, :] + 1
+        dest = (table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]) > 0
+
+        count = int(dest.sum())
+        if count > dest.size * FULL_RENDER_RATIO:
+            self.tiles_rendered += dest.size
+            return None
+        self.tiles_rendered += count
+        regions = []
+        for i in np.flatnonzero(dest.any(axis=1)):
+            row = dest[i]
+            # Runs of dirty tiles along the row become one region each
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).astype(np.int8)))
+            for start, end in zip(edges[::2], edges[1::2]):
+                regions.append((int(row_starts[i]), int(row_ends[i]), int(col_starts[start]), int(col_ends[end - 1])))
+        return regions
+
+    def render(self, engine, frame, origin, out=None, renderer=None):
+        # Renders into out (or a buffer kept here), which must still hold the
+        # previous frame. Returns the image and the regions that changed: []
+        # if none, None if all of it was redrawn. renderer is an optional
+        # BandRenderer to spread the work over.
+        size = engine.lens_size
+        if out is None:
+            if self.buffer is None or self.buffer.shape[:2] != (size, size) or self.buffer.shape[2:] != frame.shape[2:]:
+                self.buffer = np.zeros((size, size) + frame.shape[2:], dtype=frame.dtype)
+            out = self.buffer
+        src = engine.crop(frame, origin)
+        filters = engine.filters
+        key = (engine.lens_size, engine.zoom, engine.kernel, engine.shape, engine.source_rect(),
+               filters.key if filters else None, out.__array_interface__['data'][0])
+        regions = self.plan(src, key, engine.lens_size, engine.zoom, engine.kernel)
+        if regions is None:
+            self.frames_full += 1
+        elif not regions:
+            self.frames_skipped += 1
+            return out, regions
+        else:
+            self.frames_partial += 1
+        if renderer is not None:
+            renderer.render(engine, frame, origin, out, regions)
+        else:
+            for region in regions or (None,):
+                engine.render(frame, origin, out=out, region=region)
+        if regions and filters:
+            # Filtering also changed the rim around each region
+            regions = [expand_region(region, filters.halo, size) for region in regions]
+        return out, regions
+
+    def stats(self):
+        return {
+            'tile_frames_skipped': self.frames_skipped,
+            'tile_frames_partial': self.frames_partial,
+            'tile_frames_full': self.frames_full,
+            'tile_render_ratio': self.tiles_rendered / self.tiles_total if self.tiles_total else 1.0
+        }
@@ -0,0 +1,209 @@
+#pragma once
+#include <atomic>
+#include <chrono>
+#include <cstddef>
+#include <cstdio>
+#include <cstring>
+#include <ctime>
+#include <thread>
+
+#define TRACE_MAGIC "SZTRACE"
+#define TRACE_FORMAT_VERSION 1
+
+// Event types. Spans carry their start in time_ms and their length in value;
+// the meaning of a and b depends on the type (see trace_analyzer.py).
+enum TraceType {
+    TRACE_SESSION = 1,      // a = wall clock seconds, b = process id
+    TRACE_FRAME,            // span; a = frame number, b = pacer lateness in us
+    TRACE_SET_SOURCE,       // span around MagSetWindowSource; a, b = source left, top
+    TRACE_SET_TRANSFORM,    // span around MagSetWindowTransform; a = zoom * 1000
+    TRACE_WINDOW_OPS,       // span; a = render op mask, b = calls
+    TRACE_VISIBILITY,       // a = 1 shown, 0 hidden
+    TRACE_HOOK,             // span in a hook proc; a = vk and b = action for hotkeys, else 0
+    TRACE_SETTINGS,         // snapshot applied; value = zoom, a = lens size, b = fps
+    TRACE_RESUME,
+    TRACE_SUSPEND,
+    TRACE_DROPPED,          // a = records lost before this one, b = 1 if the file limit was reached
+    TRACE_DISPLAYS          // monitor layout enumerated; a = monitors, b = enumerations so far
+};
+
+// 24 bytes, little endian, appended as is
+struct TraceEvent {
+    double time_ms;
+    float value;
+    int type;
+    int a;
+    int b;
+};
+
+struct TraceFileHeader {
+    char magic[8];
+    unsigned int version;
+    unsigned int record_size;
+};
+
+typedef double (*TraceClockFunc)();
+
+// Opt-in binary session trace. Same bounded multi-producer ring as RingLog,
+// with fixed 24-byte records: while disabled every call is one relaxed load,
+// while enabled a producer never blocks or allocates, and a full ring drops
+// and counts. A flusher thread appends batches to the file, which is capped
+// at max_bytes; each start adds a TRACE_SESSION record, so one file can hold
+// several sessions.
+class TraceRecorder {
+public:
+    enum { CAPACITY = 4096, BATCH = 256 };
+
+    TraceRecorder() : head_(0), tail_(0), dropped_(0), enabled_(false), clock_(NULL), file_(NULL),
+        file_size_(0), max_bytes_(0), written_(0), full_(false), flush_interval_ms_(50) {
+        for (size_t i = 0; i < CAPACITY; i++) slots_[i].seq.store(i, std::memory_order_relaxed);
+    }
+
+    ~TraceRecorder() { stop(); }
+
+    bool enabled() const { return enabled_.load(std::memory_order_relaxed); }
+    unsigned long long written() const { return written_; }
+
+    // Start of a span, or 0 when not recording so callers skip the clock too
+    double now() const { return enabled() ? clock_() : 0.0; }
+
+    void event(int type, float value, int a, int b) {
+        if (!enabled()) return;
+        push(clock_(), value, type, a, b);
+    }
+
+    void span(int type, double start_ms, int a, int b) {
+        // start_ms is 0 when recording began after the span did
+        if (!enabled() || start_ms == 0.0) return;
+        push(start_ms, (float)(clock_() - start_ms), type, a, b);
+    }
+
+    // Called by one controlling thread at a time (the DLL's command lock)
+    bool start(const char* path, long max_bytes, TraceClockFunc clock, int pid) {
+        if (enabled()) return true;
+        file_ = fopen(path, "ab");
+        if (!file_) return false;
+        fseek(file_, 0, SEEK_END);
+        file_size_ = ftell(file_);
+        if (file_size_ == 0) {
+            TraceFileHeader header = { TRACE_MAGIC, TRACE_FORMAT_VERSION, sizeof(TraceEvent) };
+            file_size_ = (long)fwrite(&header, 1, sizeof(header), file_);
+        }
+        max_bytes_ = max_bytes;
+        clock_ = clock;
+        written_ = 0;
+        full_ = false;
+        // A producer that raced the last stop may have left records behind
+        TraceEvent stale;
+        while (pop(&stale)) {}
+        dropped_.store(0, std::memory_order_relaxed);
+        push(clock_(), 0.0f, TRACE_SESSION, (int)time(NULL), pid);
+        enabled_.store(true, std::memory_order_release);
+        flusher_ = std::thread(&TraceRecorder::flush_loop, this);
+        return true;
+    }
+
+    void stop() {
+        if (!enabled_.exchange(false)) return;
+        if (flusher_.joinable()) flusher_.join();
+        drain();
+        fclose(file_);
+        file_ = NULL;
+    }
+
+private:
+    struct Slot {
+        std::atomic<size_t> seq;
+        TraceEvent event;
+    };
+
+    void push(double time_ms, float value, int type, int a, int b) {
+        size_t pos = head_.load(std::memory_order_relaxed);
+        Slot* slot;
+        for (;;) {
+            slot = &slots_[pos & (CAPACITY - 1)];
+            size_t seq = slot->seq.load(std::memory_order_acquire);
+            ptrdiff_t diff = (ptrdiff_t)seq - (ptrdiff_t)pos;
+            if (diff == 0) {
+                if (head_.compare_exchange_weak(pos, pos + 1, std::memory_order_relaxed)) break;
+            } else if (diff < 0) {
+                dropped_.fetch_add(1, std::memory_order_relaxed);
+                return;
+            } else {
+                pos = head_.load(std::memory_order_relaxed);
+            }
+        }
+        TraceEvent& e = slot->event;
+        e.time_ms = time_ms;
+        e.value = value;
+        e.type = type;
+        e.a = a;
+        e.b = b;
+        slot->seq.store(pos + 1, std::memory_order_release);
+    }
+
+    bool pop(TraceEvent* out) {
+        Slot& slot = slots_[tail_ & (CAPACITY - 1)];
+        if (slot.seq.load(std::memory_order_acquire) != tail_ + 1) return false;
+        *out = slot.event;
+        slot.seq.store(tail_ + CAPACITY, std::memory_order_release);
+        tail_++;
+        return true;
+    }
+
+    void flush_loop() {
+        while (enabled_.load(std::memory_order_relaxed)) {
+            drain();
+            std::this_thread::sleep_for(std::chrono::milliseconds(flush_interval_ms_));
+        }
+    }
+
+    void drain() {
+        TraceEvent batch[BATCH];
+        size_t count = 0;
+        unsigned long long lost = dropped_.exchange(0, std::memory_order_relaxed);
+        if (lost) {
+            // Placed before whatever made it into the ring after the loss
+            TraceEvent note = { clock_(), 0.0f, TRACE_DROPPED, (int)lost, 0 };
+            batch[count++] = note;
+        }
+        for (;;) {
+            while (count < BATCH && pop(&batch[count])) count++;
+            if (!count) break;
+            write(batch, count);
+            count = 0;
+        }
+        fflush(file_);
+    }
+
+    void write(const TraceEvent* events, size_t count) {
+        if (full_) return;
+        long room = max_bytes_ > 0 ? (max_bytes_ - file_size_) / (long)sizeof(TraceEvent) - 1 : (long)count;
+        if (room < (long)count) {
+            count = room > 0 ? (size_t)room : 0;
+            full_ = true;
+        }
+        size_t done = fwrite(events, sizeof(TraceEvent), count, file_);
+        file_size_ += (long)(done * sizeof(TraceEvent));
+        written_ += done;
+        if (full_) {
+            // The last record says why the trace ends here
+            TraceEvent note = { events[count ? count - 1 : 0].time_ms, 0.0f, TRACE_DROPPED, 0, 1 };
+            file_size_ += (long)(fwrite(&note, sizeof(note), 1, file_) * sizeof(note));
+        }
+    }
+
+    Slot slots_[CAPACITY];
+    std::atomic<size_t> head_;
+    size_t tail_;
+    std::atomic<unsigned long long> dropped_;
+    std::atomic<bool> enabled_;
+    TraceClockFunc clock_;
+    std::thread flusher_;
+    FILE* file_;
+    long file_size_;
+    long max_bytes_;
+    unsigned long long written_;
+    bool full_;
+    int flush_interval_ms_;
+};
@@ -0,0 +1,384 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from backends import HOTKEY_ACTIONS
+
+# Mirrors trace.h: a 16-byte file header, then 24-byte records appended by
+# the engine's TraceRecorder. A file can hold several sessions.
+MAGIC = b'SZTRACE'
+FORMAT_VERSION = 1
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4')])
+EVENT = np.dtype([('time_ms', '<f8'), ('value', '<f4'), ('type', '<i4'), ('a', '<i4'), ('b', '<i4')])
+
+(TRACE_SESSION, TRACE_FRAME, TRACE_SET_SOURCE, TRACE_SET_TRANSFORM, TRACE_WINDOW_OPS, TRACE_VISIBILITY,
+ TRACE_HOOK, TRACE_SETTINGS, TRACE_RESUME, TRACE_SUSPEND, TRACE_DROPPED, TRACE_DISPLAYS) = range(1, 13)
+
+ACTION_NAMES = {code: name for name, code in HOTKEY_ACTIONS.items()}
+SPAN_NAMES = {
+    TRACE_FRAME: 'frame',
+    TRACE_SET_SOURCE: 'MagSetWindowSource',
+    TRACE_SET_TRANSFORM: 'MagSetWindowTransform',
+    TRACE_WINDOW_OPS: 'window ops',
+    TRACE_HOOK: 'input hook'
+}
+STALL_CAUSES = ('MagSetWindowSource', 'MagSetWindowTransform', 'window ops', 'frame work', 'input hooks', 'late wake')
+# A hotkey whose change has not shown up within this many frames changed nothing (e.g. zoom in at 10x)
+LATENCY_FRAMES = 5
+
+
+class TraceFormatError(Exception):
+    pass
+
+
+def check_header(data):
+    if len(data) < HEADER.itemsize:
+        raise TraceFormatError("file is too short for a trace header")
+    header = np.frombuffer(data, HEADER, count=1)[0]
+    if header['magic'] != MAGIC:
+        raise TraceFormatError("not a Scope Z trace")
+    if header['version'] != FORMAT_VERSION or header['record_size'] != EVENT.itemsize:
+        raise TraceFormatError(f"unsupported trace version {header['version']} (record size {header['record_size']})")
+
+
+def map_events(path):
+    # The whole file as one array over a read-only map; a record still being
+    # written at the end is left out
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.itemsize:
+            raise TraceFormatError("file is too short for a trace header")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    check_header(data)
+    count = (len(data) - HEADER.itemsize) // EVENT.itemsize
+    yield np.frombuffer(data, EVENT, count=count, offset=HEADER.itemsize)
+
+
+def stream_events(f, chunk_records=4096):
+    # Fixed-size chunks from a pipe or file, for traces too big to map
+    check_header(f.read(HEADER.itemsize))
+    pending = b''
+    while True:
+        data = f.read(chunk_records * EVENT.itemsize)
+        if not data:
+            return
+        data = pending + data
+        whole = len(data) - len(data) % EVENT.itemsize
+        pending = data[whole:]
+        if whole:
+            yield np.frombuffer(data[:whole], EVENT)
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not len(values):
+        return {}
+    values = np.asarray(values)
+    summary = {f'p{p}': float(np.percentile(values, p)) for p in points}
+    summary.update(n=int(len(values)), max=float(values.max()))
+    return summary
+
+
+class TraceAnalysis:
+    # Consumes record arrays in file order. Spans are recorded when they end,
+    # so a frame's Mag calls arrive before the frame itself and the hooks seen
+    # since the previous frame ran in the gap before it.
+    def __init__(self, stall_factor=1.5, stall_ms=0.0, top=10):
+        self.stall_factor = stall_factor
+        self.stall_ms = stall_ms
+        self.top = top
+        self.sessions = 0
+        self.records = 0
+        self.dropped = 0
+        self.truncated = False
+        self.first_ms = None
+        self.last_ms = None
+        self.fps = 60
+        self.frame_ms = []
+        self.interval_ms = []
+        # The same intervals in periods of the rate in force at the time
+        self.interval_periods = []
+        self.calls = {name: [] for name in ('MagSetWindowSource', 'MagSetWindowTransform', 'window ops', 'input hook')}
+        self.latency = {}
+        self.stalls = []
+        self.cause_ms = dict.fromkeys(STALL_CAUSES, 0.0)
+        self.cause_count = dict.fromkeys(STALL_CAUSES, 0)
+        self.reset_run()
+
+    def reset_run(self):
+        # Gaps across a suspend, a new session or lost records are not stalls
+        self.prev_frame = None
+        self.current = self.empty_parts()
+        self.gap_hooks = 0.0
+        self.pending = []
+
+    def empty_parts(self):
+        return {'MagSetWindowSource': 0.0, 'MagSetWindowTransform': 0.0, 'window ops': 0.0, 'ops': 0}
+
+    def feed(self, events):
+        if not len(events):
+            return
+        self.records += len(events)
+        if self.first_ms is None:
+            self.first_ms = float(events['time_ms'][0])
+        self.last_ms = float(events['time_ms'][-1] + events['value'][-1] * (events['type'][-1] in SPAN_NAMES))
+        for time_ms, value, kind, a, b in events.tolist():
+            if kind == TRACE_FRAME:
+                self.on_frame(time_ms, value)
+            elif kind == TRACE_SET_SOURCE or kind == TRACE_SET_TRANSFORM:
+                name = SPAN_NAMES[kind]
+                self.current[name] += value
+                self.current['ops'] += 1
+                self.calls[name].append(value)
+            elif kind == TRACE_WINDOW_OPS:
+                # Spans the whole apply, Mag calls included
+                own = max(0.0, value - self.current['MagSetWindowSource'] - self.current['MagSetWindowTransform'])
+                self.current['window ops'] += own
+                self.current['ops'] += 1
+                self.calls['window ops'].append(own)
+            elif kind == TRACE_HOOK:
+                self.gap_hooks += value
+                self.calls['input hook'].append(value)
+                if b:
+                    self.pending.append([time_ms, ACTION_NAMES.get(b, f'action {b}'), 0])
+            elif kind == TRACE_SETTINGS or kind == TRACE_RESUME:
+                self.fps = b or self.fps
+                if kind == TRACE_RESUME:
+                    self.reset_run()
+            elif kind == TRACE_SESSION:
+                self.sessions += 1
+                self.reset_run()
+            elif kind == TRACE_SUSPEND:
+                self.reset_run()
+            elif kind == TRACE_DROPPED:
+                self.dropped += a
+                self.truncated |= b == 1
+                self.reset_run()
+
+    def on_frame(self, start, duration):
+        self.frame_ms.append(duration)
+        period = 1000.0 / self.fps
+        parts = self.current
+        if self.prev_frame is not None:
+            prev_start, prev_duration, prev_parts = self.prev_frame
+            interval = start - prev_start
+            self.interval_ms.append(interval)
+            self.interval_periods.append(interval / period)
+            limit = self.stall_ms or self.stall_factor * period
+            if interval > limit:
+                self.on_stall(prev_start, interval, period, prev_duration, prev_parts)
+        if parts['ops']:
+            # Input to display: the first frame that changed the lens after the hotkey
+            for hook_ms, action, _ in self.pending:
+                self.latency.setdefault(action, []).append(start + duration - hook_ms)
+            self.pending = []
+        else:
+            for hook in self.pending:
+                hook[2] += 1
+            self.pending = [hook for hook in self.pending if hook[2] < LATENCY_FRAMES]
+        self.prev_frame = (start, duration, parts)
+        self.current = self.empty_parts()
+        self.gap_hooks = 0.0
+
+    def on_stall(self, prev_start, interval, period, prev_duration, prev_parts):
+        # Where the time between two frame starts went: the earlier frame's
+        # work, hook procs run while waiting, and the pacer starting later
+        # than both the deadline and the end of that work allowed
+        work = sum(prev_parts[name] for name in STALL_CAUSES[:3])
+        breakdown = {
+            'MagSetWindowSource': prev_parts['MagSetWindowSource'],
+            'MagSetWindowTransform': prev_parts['MagSetWindowTransform'],
+            'window ops': prev_parts['window ops'],
+            'frame work': max(0.0, prev_duration - work),
+            'input hooks': self.gap_hooks,
+            'late wake': max(0.0, interval - max(period, prev_duration + self.gap_hooks))
+        }
+        cause = max(breakdown, key=breakdown.get)
+        self.cause_ms[cause] += interval - period
+        self.cause_count[cause] += 1
+        self.stalls.append({
+            'at_ms': prev_start - self.first_ms,
+            'interval_ms': interval,
+            'missed_frames': max(0, int(interval / period + 0.5) - 1),
+            'cause': cause,
+            'breakdown_ms': breakdown
+        })
+
+    def report(self):
+        frames = np.asarray(self.frame_ms)
+        intervals = np.asarray(self.interval_ms)
+        buckets = [0.5, 0.9, 1.1, 1.5, 2.0, 3.0, float('inf')]
+        counts = np.histogram(self.interval_periods, bins=[0.0] + buckets)[0]
+        latency = {action: percentiles(values, (50, 95, 99)) for action, values in sorted(self.latency.items())}
+        everything = [v for values in self.latency.values() for v in values]
+        if everything:
+            latency['all'] = percentiles(everything, (50, 95, 99))
+        return {
+            'sessions': self.sessions,
+            'records': self.records,
+            'dropped_records': self.dropped,
+            'truncated': self.truncated,
+            'duration_s': (self.last_ms - self.first_ms) / 1000.0 if self.records else 0.0,
+            'target_fps': self.fps,
+            'frame_ms': percentiles(frames),
+            'interval_ms': percentiles(intervals),
+            'interval_histogram': {f'<{b:g}x' if b != float('inf') else f'>={buckets[-2]:g}x': int(c)
+                                   for b, c in zip(buckets, counts)},
+            'calls_ms': {name: percentiles(values) for name, values in self.calls.items() if values},
+            'input_latency_ms': latency,
+            'stalls': {
+                'count': len(self.stalls),
+                'missed_frames': sum(stall['missed_frames'] for stall in self.stalls),
+                'by_cause': {cause: {'stalls': self.cause_count[cause], 'excess_ms': self.cause_ms[cause]}
+                             for cause in STALL_CAUSES if self.cause_count[cause]},
+                'worst': sorted(self.stalls, key=lambda stall: -stall['interval_ms'])[:self.top]
+            }
+        }
+
+
+class ChromeTraceWriter:
+    # Chrome / Perfetto JSON: one complete event per span, one instant per marker
+    def __init__(self, f):
+        self.f = f
+        self.first_ms = None
+        self.count = 0
+        f.write('{"traceEvents":[\n')
+        self.write({'ph': 'M', 'pid': 1, 'tid': 1, 'name': 'process_name', 'args': {'name': 'Scope Z engine'}})
+        self.write({'ph': 'M', 'pid': 1, 'tid': 1, 'name': 'thread_name', 'args': {'name': 'magnifier thread'}})
+
+    def write(self, event):
+        self.f.write((',\n' if self.count else '') + json.dumps(event, separators=(',', ':')))
+        self.count += 1
+
+    def feed(self, events):
+        if not len(events):
+            return
+        if self.first_ms is None:
+            self.first_ms = float(events['time_ms'][0])
+        for time_ms, value, kind, a, b in events.tolist():
+            event = {'pid': 1, 'tid': 1, 'ts': round((time_ms - self.first_ms) * 1000.0, 3)}
+            if kind in SPAN_NAMES:
+                event.update(ph='X', dur=round(value * 1000.0, 3), name=SPAN_NAMES[kind], args=self.span_args(kind, a, b))
+                if kind == TRACE_HOOK and b:
+                    event['name'] = f"hotkey {ACTION_NAMES.get(b, b)}"
+            else:
+                event.update(ph='i', s='p' if kind in (TRACE_SESSION, TRACE_RESUME, TRACE_SUSPEND) else 't',
+                             **self.marker(kind, value, a, b))
+            self.write(event)
+
+    def span_args(self, kind, a, b):
+        if kind == TRACE_FRAME:
+            return {'frame': a, 'lateness_ms': b / 1000.0}
+        if kind == TRACE_SET_SOURCE:
+            return {'left': a, 'top': b}
+        if kind == TRACE_SET_TRANSFORM:
+            return {'zoom': a / 1000.0}
+        if kind == TRACE_WINDOW_OPS:
+            return {'ops': a, 'calls': b}
+        return {'vk': a} if b else {}
+
+    def marker(self, kind, value, a, b):
+        if kind == TRACE_SESSION:
+            return {'name': 'session start', 'args': {'wall_time': a & 0xffffffff, 'pid': b}}
+        if kind == TRACE_SETTINGS:
+            return {'name': 'settings', 'args': {'zoom': round(value, 3), 'lens_size': a, 'fps': b}}
+        if kind == TRACE_VISIBILITY:
+            return {'name': 'show' if a else 'hide'}
+        if kind == TRACE_RESUME:
+            return {'name': 'resume', 'args': {'zoom': round(value, 3), 'lens_size': a, 'fps': b}}
+        if kind == TRACE_SUSPEND:
+            return {'name': 'suspend'}
+        if kind == TRACE_DROPPED:
+            return {'name': 'file limit reached' if b == 1 else f'{a} records dropped'}
+        if kind == TRACE_DISPLAYS:
+            return {'name': 'display layout', 'args': {'monitors': a}}
+        return {'name': f'unknown event {kind}'}
+
+    def close(self):
+        self.f.write('\n]}\n')
+
+
+def print_report(report):
+    print(f"{report['sessions']} session(s), {report['records']} records over {report['duration_s']:.1f} s, "
+          f"target {report['target_fps']} fps")
+    if report['dropped_records']:
+        print(f"warning: {report['dropped_records']} records dropped, gaps around them are not counted")
+    if report['truncated']:
+        print("warning: the file size limit was reached, the trace ends early")
+
+    def line(label, summary):
+        if summary:
+            print(f"  {label:<24} p50 {summary['p50']:7.3f}  p90/95 {summary.get('p90', summary.get('p95')):7.3f}  "
+                  f"p99 {summary['p99']:7.3f}  max {summary['max']:8.3f} ms  (n={summary['n']})")
+
+    print("Frames")
+    line('work', report['frame_ms'])
+    line('start to start', report['interval_ms'])
+    total = sum(report['interval_histogram'].values()) or 1
+    for bucket, count in report['interval_histogram'].items():
+        print(f"  {bucket:>7} of period {count:8d} {'#' * int(40 * count / total)}")
+    print("Calls")
+    for name, summary in report['calls_ms'].items():
+        line(name, summary)
+    if report['input_latency_ms']:
+        print("Input to display")
+        for action, summary in report['input_latency_ms'].items():
+            line(action, summary)
+    stalls = report['stalls']
+    print(f"Stalls: {stalls['count']} ({stalls['missed_frames']} missed frames)")
+    for cause, totals in sorted(stalls['by_cause'].items(), key=lambda item: -item[1]['excess_ms']):
+        print(f"  {cause:<24} {totals['stalls']:6d} stalls  {totals['excess_ms']:9.2f} ms over period")
+    for stall in stalls['worst']:
+        parts = ', '.join(f"{name} {ms:.2f}" for name, ms in stall['breakdown_ms'].items() if ms >= 0.01)
+        print(f"  at {stall['at_ms'] / 1000.0:9.3f} s  {stall['interval_ms']:7.2f} ms  {stall['cause']:<22} ({parts})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a Scope Z session trace (scope_z_trace.bin)")
+    parser.add_argument('trace', help="trace file, or - to read a stream from stdin")
+    parser.add_argument('--stream', action='store_true', help="read the file in chunks instead of memory-mapping it")
+    parser.add_argument('--chrome', metavar='OUT', help="also write a Chrome trace (chrome://tracing, ui.perfetto.dev)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--stall-factor', type=float, default=1.5, help="a frame interval over this many periods is a stall")
+    parser.add_argument('--stall-ms', type=float, default=0.0, help="fixed stall threshold instead of --stall-factor")
+    parser.add_argument('--top', type=int, default=10, help="worst stalls to list")
+    args = parser.parse_args()
+
+    source = None
+    try:
+        if args.trace == '-':
+            chunks = stream_events(sys.stdin.buffer)
+        elif args.stream:
+            source = open(args.trace, 'rb')
+            chunks = stream_events(source)
+        else:
+            chunks = map_events(args.trace)
+        analysis = TraceAnalysis(args.stall_factor, args.stall_ms, args.top)
+        consumers = [analysis]
+        chrome = None
+        if args.chrome:
+            chrome = ChromeTraceWriter(open(args.chrome, 'w'))
+            consumers.append(chrome)
+        for events in chunks:
+            for consumer in consumers:
+                consumer.feed(events)
+        if chrome:
+            chrome.close()
+            chrome.f.close()
+    except (OSError, TraceFormatError) as e:
+        sys.exit(f"trace_analyzer: {e}")
+    finally:
+        if source:
+            source.close()
+
+    report = analysis.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
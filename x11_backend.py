@@ -0,0 +1,502 @@
+import ctypes
+import ctypes.util
+import time
+from collections import deque
+
+import numpy as np
+
+from backends import SoftwareBackend, _percentile
+
+ZPixmap = 2
+InputOutput = 1
+IsViewable = 2
+CWBackPixel = 1 << 1
+CWBorderPixel = 1 << 3
+CWOverrideRedirect = 1 << 9
+ShapeBounding = 0
+ShapeInput = 2
+ShapeSet = 0
+YXBanded = 3
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+ALL_PLANES = 0xFFFFFFFFFFFFFFFF
+
+# How often to look again for the window under the lens (seconds)
+SOURCE_REFRESH_INTERVAL = 1.0
+
+
+class XImage(ctypes.Structure):
+    # Leading fields of XImage in Xlib.h; the rest is never touched from Python
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int),
+        ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int),
+        ('bits_per_pixel', ctypes.c_int)
+    ]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ('shmseg', ctypes.c_ulong),
+        ('shmid', ctypes.c_int),
+        ('shmaddr', ctypes.c_void_p),
+        ('readOnly', ctypes.c_int)
+    ]
+
+
+class XSetWindowAttributes(ctypes.Structure):
+    _fields_ = [
+        ('background_pixmap', ctypes.c_ulong),
+        ('background_pixel', ctypes.c_ulong),
+        ('border_pixmap', ctypes.c_ulong),
+        ('border_pixel', ctypes.c_ulong),
+        ('bit_gravity', ctypes.c_int),
+        ('win_gravity', ctypes.c_int),
+        ('backing_store', ctypes.c_int),
+        ('backing_planes', ctypes.c_ulong),
+        ('backing_pixel', ctypes.c_ulong),
+        ('save_under', ctypes.c_int),
+        ('event_mask', ctypes.c_long),
+        ('do_not_propagate_mask', ctypes.c_long),
+        ('override_redirect', ctypes.c_int),
+        ('colormap', ctypes.c_ulong),
+        ('cursor', ctypes.c_ulong)
+    ]
+
+
+class XWindowAttributes(ctypes.Structure):
+    _fields_ = [
+        ('x', ctypes.c_int),
+        ('y', ctypes.c_int),
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('border_width', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('visual', ctypes.c_void_p),
+        ('root', ctypes.c_ulong),
+        ('class_', ctypes.c_int),
+        ('bit_gravity', ctypes.c_int),
+        ('win_gravity', ctypes.c_int),
+        ('backing_store', ctypes.c_int),
+        ('backing_planes', ctypes.c_ulong),
+        ('backing_pixel', ctypes.c_ulong),
+        ('save_under', ctypes.c_int),
+        ('colormap', ctypes.c_ulong),
+        ('map_installed', ctypes.c_int),
+        ('map_state', ctypes.c_int),
+        ('all_event_masks', ctypes.c_long),
+        ('your_event_mask', ctypes.c_long),
+        ('do_not_propagate_mask', ctypes.c_long),
+        ('override_redirect', ctypes.c_int),
+        ('screen', ctypes.c_void_p)
+    ]
+
+
+class XRectangle(ctypes.Structure):
+    _fields_ = [
+        ('x', ctypes.c_short),
+        ('y', ctypes.c_short),
+        ('width', ctypes.c_ushort),
+        ('height', ctypes.c_ushort)
+    ]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_int),
+        ('display', ctypes.c_void_p),
+        ('resourceid', ctypes.c_ulong),
+        ('serial', ctypes.c_ulong),
+        ('error_code', ctypes.c_ubyte),
+        ('request_code', ctypes.c_ubyte),
+        ('minor_code', ctypes.c_ubyte)
+    ]
+
+
+X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+_libs = None
+_error_handler = None
+x_errors = deque(maxlen=16)
+
+
+def _on_x_error(display, event):
+    # Xlib's default handler exits the process; record the error instead
+    e = event.contents
+    x_errors.append((e.error_code, e.request_code, e.minor_code))
+    return 0
+
+
+def _load(name, use_errno=False):
+    path = ctypes.util.find_library(name)
+    if not path:
+        raise OSError(f"lib{name} not found")
+    return ctypes.CDLL(path, use_errno=use_errno)
+
+
+def load_xlib():
+    global _libs, _error_handler
+    if _libs is not None:
+        return _libs
+    xlib = _load('X11')
+    xext = _load('Xext')
+    libc = _load('c', use_errno=True)
+    display, window, visual = ctypes.c_void_p, ctypes.c_ulong, ctypes.c_void_p
+    image = ctypes.POINTER(XImage)
+    shm = ctypes.POINTER(XShmSegmentInfo)
+    signatures = [
+        (xlib.XInitThreads, [], ctypes.c_int),
+        (xlib.XOpenDisplay, [ctypes.c_char_p], display),
+        (xlib.XCloseDisplay, [display], ctypes.c_int),
+        (xlib.XDefaultScreen, [display], ctypes.c_int),
+        (xlib.XRootWindow, [display, ctypes.c_int], window),
+        (xlib.XDefaultVisual, [display, ctypes.c_int], visual),
+        (xlib.XDefaultDepth, [display, ctypes.c_int], ctypes.c_int),
+        (xlib.XDisplayWidth, [display, ctypes.c_int], ctypes.c_int),
+        (xlib.XDisplayHeight, [display, ctypes.c_int], ctypes.c_int),
+        (xlib.XCreateWindow, [display, window, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_uint,
+                              ctypes.c_int, ctypes.c_uint, visual, ctypes.c_ulong, ctypes.POINTER(XSetWindowAttributes)], window),
+        (xlib.XDestroyWindow, [display, window], ctypes.c_int),
+        (xlib.XMapRaised, [display, window], ctypes.c_int),
+        (xlib.XUnmapWindow, [display, window], ctypes.c_int),
+        (xlib.XMoveResizeWindow, [display, window, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint], ctypes.c_int),
+        (xlib.XCreateGC, [display, window, ctypes.c_ulong, ctypes.c_void_p], ctypes.c_void_p),
+        (xlib.XFreeGC, [display, ctypes.c_void_p], ctypes.c_int),
+        (xlib.XSync, [display, ctypes.c_int], ctypes.c_int),
+        (xlib.XFree, [ctypes.c_void_p], ctypes.c_int),
+        (xlib.XQueryTree, [display, window, ctypes.POINTER(window), ctypes.POINTER(window),
+                           ctypes.POINTER(ctypes.POINTER(window)), ctypes.POINTER(ctypes.c_uint)], ctypes.c_int),
+        (xlib.XGetWindowAttributes, [display, window, ctypes.POINTER(XWindowAttributes)], ctypes.c_int),
+        (xlib.XSetErrorHandler, [X_ERROR_HANDLER], ctypes.c_void_p),
+        (xext.XShmQueryExtension, [display], ctypes.c_int),
+        (xext.XShmCreateImage, [display, visual, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p, shm,
+                                ctypes.c_uint, ctypes.c_uint], image),
+        (xext.XShmAttach, [display, shm], ctypes.c_int),
+        (xext.XShmDetach, [display, shm], ctypes.c_int),
+        (xext.XShmGetImage, [display, window, image, ctypes.c_int, ctypes.c_int, ctypes.c_ulong], ctypes.c_int),
+        (xext.XShmPutImage, [display, window, ctypes.c_void_p, image, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_int], ctypes.c_int),
+        (xext.XShapeCombineRectangles, [display, window, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                        ctypes.POINTER(XRectangle), ctypes.c_int, ctypes.c_int, ctypes.c_int], None),
+        (xext.XShapeCombineMask, [display, window, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ulong, ctypes.c_int], None),
+        (libc.shmget, [ctypes.c_int, ctypes.c_size_t, ctypes.c_int], ctypes.c_int),
+        (libc.shmat, [ctypes.c_int, ctypes.c_void_p, ctypes.c_int], ctypes.c_void_p),
+        (libc.shmdt, [ctypes.c_void_p], ctypes.c_int),
+        (libc.shmctl, [ctypes.c_int, ctypes.c_int, ctypes.c_void_p], ctypes.c_int)
+    ]
+    for function, argtypes, restype in signatures:
+        function.argtypes = argtypes
+        function.restype = restype
+    # Capture and present run on the render thread, setup and teardown on the
+    # GUI thread. GUI.py calls XInitThreads before QApplication opens its
+    # connection, which makes this a no-op there; it is what covers scripts
+    # that use the backend without the GUI (benchmarks/x11_capture_present.py).
+    xlib.XInitThreads()
+    _error_handler = X_ERROR_HANDLER(_on_x_error)
+    xlib.XSetErrorHandler(_error_handler)
+    _libs = (xlib, xext, libc)
+    return _libs
+
+
+class XDisplay:
+    def __init__(self, name=None):
+        self.xlib, self.xext, self.libc = load_xlib()
+        self.handle = self.xlib.XOpenDisplay(name.encode() if name else None)
+        if not self.handle:
+            raise OSError(f"cannot open X display {name or '(default)'}")
+        if not self.xext.XShmQueryExtension(self.handle):
+            self.xlib.XCloseDisplay(self.handle)
+            self.handle = None
+            raise OSError("X server has no MIT-SHM extension")
+        self.screen = self.xlib.XDefaultScreen(self.handle)
+        self.root = self.xlib.XRootWindow(self.handle, self.screen)
+        self.visual = self.xlib.XDefaultVisual(self.handle, self.screen)
+        self.depth = self.xlib.XDefaultDepth(self.handle, self.screen)
+        self.width = self.xlib.XDisplayWidth(self.handle, self.screen)
+        self.height = self.xlib.XDisplayHeight(self.handle, self.screen)
+
+    def sync(self):
+        self.xlib.XSync(self.handle, 0)
+
+    def close(self):
+        if self.handle:
+            self.xlib.XCloseDisplay(self.handle)
+        self.handle = None
+
+
+class ShmImage:
+    # An XImage whose pixels live in a SysV shared-memory segment the X server
+    # maps too, so XShmGetImage/XShmPutImage move no pixel data over the socket.
+    def __init__(self, display, width, height):
+        self.display = display
+        self.info = XShmSegmentInfo()
+        self.image = display.xext.XShmCreateImage(display.handle, display.visual, display.depth, ZPixmap,
+                                                  None, ctypes.byref(self.info), width, height)
+        if not self.image:
+            raise OSError("XShmCreateImage failed")
+        image = self.image.contents
+        if image.bits_per_pixel != 32:
+            display.xlib.XFree(self.image)
+            raise OSError(f"unsupported visual: {image.bits_per_pixel} bits per pixel")
+        size = image.bytes_per_line * height
+        libc = display.libc
+        self.info.shmid = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if self.info.shmid < 0:
+            display.xlib.XFree(self.image)
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        address = libc.shmat(self.info.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(self.info.shmid, IPC_RMID, None)
+            display.xlib.XFree(self.image)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self.info.shmaddr = address
+        self.info.readOnly = 0
+        image.data = address
+        attached = display.xext.XShmAttach(display.handle, ctypes.byref(self.info))
+        display.sync()
+        # Marked for removal now so the segment cannot leak if we crash
+        libc.shmctl(self.info.shmid, IPC_RMID, None)
+        if not attached:
+            libc.shmdt(address)
+            display.xlib.XFree(self.image)
+            raise OSError("XShmAttach failed")
+        buffer = (ctypes.c_uint8 * size).from_address(address)
+        rows = np.frombuffer(buffer, dtype=np.uint8).reshape(height, image.bytes_per_line // 4, 4)
+        self.pixels = rows[:, :width]
+        self.width = width
+        self.height = height
+
+    def close(self):
+        if self.image:
+            display = self.display
+            display.xext.XShmDetach(display.handle, ctypes.byref(self.info))
+            display.sync()
+            display.libc.shmdt(self.info.shmaddr)
+            self.image.contents.data = None
+            display.xlib.XFree(self.image)
+        self.image = None
+        self.pixels = None
+
+
+class XShmCapture:
+    def __init__(self, display):
+        self.display = display
+        self.image = None
+        self.source = display.root
+        self.source_origin = (0, 0)
+        self.source_checked = 0.0
+
+    def screen_size(self):
+        return self.display.width, self.display.height
+
+    def pick_source(self, rect, exclude=()):
+        # Grab from the topmost window that covers the whole rect rather than
+        # the root. Under a compositor that window's contents do not include
+        # our overlay, so the lens does not magnify itself; without one (or if
+        # no window qualifies) the root is used.
+        xlib, handle = self.display.xlib, self.display.handle
+        root, parent = ctypes.c_ulong(), ctypes.c_ulong()
+        children = ctypes.POINTER(ctypes.c_ulong)()
+        count = ctypes.c_uint()
+        self.source, self.source_origin = self.display.root, (0, 0)
+        if not xlib.XQueryTree(handle, self.display.root, ctypes.byref(root), ctypes.byref(parent),
+                               ctypes.byref(children), ctypes.byref(count)):
+            return self.source
+        try:
+            attributes = XWindowAttributes()
+            left, top, right, bottom = rect
+            # Children are listed bottom to top
+            for i in range(count.value - 1, -1, -1):
+                window = children[i]
+                if window in exclude or not xlib.XGetWindowAttributes(handle, window, ctypes.byref(attributes)):
+                    continue
+                if attributes.map_state != IsViewable:
+                    continue
+                x, y = attributes.x + attributes.border_width, attributes.y + attributes.border_width
+                if x <= left and y <= top and x + attributes.width >= right and y + attributes.height >= bottom:
+                    self.source, self.source_origin = window, (x, y)
+                    break
+        finally:
+            if children:
+                xlib.XFree(children)
+        return self.source
+
+    def grab(self, rect):
+        left, top, right, bottom = rect
+        width, height = right - left, bottom - top
+        if self.image is None or (self.image.width, self.image.height) != (width, height):
+            self.close()
+            self.image = ShmImage(self.display, width, height)
+        ox, oy = self.source_origin
+        if not self.display.xext.XShmGetImage(self.display.handle, self.source, self.image.image,
+                                              left - ox, top - oy, ALL_PLANES):
+            # The source window went away or moved; fall back to the root for this frame
+            self.source, self.source_origin = self.display.root, (0, 0)
+            if not self.display.xext.XShmGetImage(self.display.handle, self.display.root, self.image.image,
+                                                  left, top, ALL_PLANES):
+                raise OSError("XShmGetImage failed")
+        return self.image.pixels
+
+    def close(self):
+        if self.image:
+            self.image.close()
+        self.image = None
+
+
+class ShapedOverlay:
+    # Override-redirect window (no window manager decoration or focus) whose
+    # bounding shape is the lens and whose input shape is empty, like the
+    # WS_EX_TRANSPARENT host window with SetWindowRgn on Windows.
+    def __init__(self, display):
+        self.display = display
+        attributes = XSetWindowAttributes()
+        attributes.override_redirect = 1
+        attributes.background_pixel = 0
+        attributes.border_pixel = 0
+        self.window = display.xlib.XCreateWindow(
+            display.handle, display.root, 0, 0, 1, 1, 0, display.depth, InputOutput, display.visual,
+            CWOverrideRedirect | CWBackPixel | CWBorderPixel, ctypes.byref(attributes))
+        if not self.window:
+            raise OSError("XCreateWindow failed")
+        self.gc = display.xlib.XCreateGC(display.handle, self.window, 0, None)
+        display.xext.XShapeCombineRectangles(display.handle, self.window, ShapeInput, 0, 0, None, 0, ShapeSet, YXBanded)
+        self.image = None
+        self.geometry = None
+        self.shape_key = None
+        self.mapped = False
+
+    def buffer(self, width, height):
+        # Lets the renderer write straight into the shared-memory image
+        if self.image is None or (self.image.width, self.image.height) != (width, height):
+            if self.image:
+                self.image.close()
+            self.image = ShmImage(self.display, width, height)
+        return self.image.pixels
+
+    def set_shape(self, mask):
+        display = self.display
+        if mask is None:
+            display.xext.XShapeCombineMask(display.handle, self.window, ShapeBounding, 0, 0, 0, ShapeSet)
+            return
+        # One rectangle per row span of the mask, which is how an elliptic region is banded anyway
+        rects = []
+        for y, row in enumerate(mask):
+            columns = np.flatnonzero(row)
+            if columns.size:
+                rects.append((int(columns[0]), y, int(columns[-1] - columns[0] + 1), 1))
+        array = (XRectangle * len(rects))(*rects)
+        display.xext.XShapeCombineRectangles(display.handle, self.window, ShapeBounding, 0, 0,
+                                             array, len(rects), ShapeSet, YXBanded)
+
+    def present(self, image, mask, regions=None, position=None):
+        # regions limits the upload to the (top, bottom, left, right) parts that
+        # changed; position is the top-left corner, centred on screen if None
+        display = self.display
+        height, width = image.shape[:2]
+        if position is None:
+            position = ((display.width - width) // 2, (display.height - height) // 2)
+        geometry = (position[0], position[1], width, height)
+        if geometry != self.geometry:
+            display.xlib.XMoveResizeWindow(display.handle, self.window, *geometry)
+            self.geometry = geometry
+        shape_key = None if mask is None else (width, height)
+        if shape_key != self.shape_key or not self.mapped:
+            self.set_shape(mask)
+            self.shape_key = shape_key
+        pixels = self.buffer(width, height)
+        if image is not pixels:
+            pixels[...] = image
+        if not self.mapped:
+            display.xlib.XMapRaised(display.handle, self.window)
+            self.mapped = True
+            regions = None
+        for top, bottom, left, right in regions or ((0, height, 0, width),):
+            display.xext.XShmPutImage(display.handle, self.window, self.gc, self.image.image,
+                                      left, top, left, top, right - left, bottom - top, 0)
+        # The server reads the shared buffer asynchronously; wait before it is reused
+        display.sync()
+
+    def hide(self):
+        if self.mapped:
+            self.display.xlib.XUnmapWindow(self.display.handle, self.window)
+            self.display.sync()
+        self.mapped = False
+
+    def close(self):
+        display = self.display
+        if self.image:
+            self.image.close()
+        self.image = None
+        if self.window:
+            display.xlib.XFreeGC(display.handle, self.gc)
+            display.xlib.XDestroyWindow(display.handle, self.window)
+            display.sync()
+        self.window = None
+
+
+class X11Backend(SoftwareBackend):
+    name = 'x11'
+
+    def __init__(self, display_name=None):
+        self.display = XDisplay(display_name)
+        # One overlay window per lens, created as lenses are added and kept after
+        self.overlays = [ShapedOverlay(self.display)]
+        super().__init__(XShmCapture(self.display), None)
+        self.capture_times = deque(maxlen=1000)
+        self.render_times = deque(maxlen=1000)
+        self.present_times = deque(maxlen=1000)
+
+    def render_once(self):
+        lenses = self.lenses.lenses
+        while len(self.overlays) < len(lenses):
+            self.overlays.append(ShapedOverlay(self.display))
+        for overlay in self.overlays[len(lenses):]:
+            overlay.hide()
+        rect = self.lenses.source_rect()
+        start = time.perf_counter()
+        if start - self.capture.source_checked >= SOURCE_REFRESH_INTERVAL:
+            self.capture.pick_source(rect, exclude=tuple(overlay.window for overlay in self.overlays))
+            self.capture.source_checked = start
+        frame = self.capture.grab(rect)
+        captured = time.perf_counter()
+        buffers = [overlay.buffer(lens.engine.lens_size, lens.engine.lens_size)
+                   for overlay, lens in zip(self.overlays, lenses)]
+        results = self.lenses.render(frame, rect[:2], buffers)
+        rendered = time.perf_counter()
+        for overlay, lens, (image, regions) in zip(self.overlays, lenses, results):
+            if regions != []:
+                overlay.present(image, lens.engine.mask, regions, lens.position())
+        presented = time.perf_counter()
+        self.capture_times.append((captured - start) * 1000.0)
+        self.render_times.append((rendered - captured) * 1000.0)
+        self.present_times.append((presented - rendered) * 1000.0)
+        return results
+
+    def on_suspend(self):
+        for overlay in self.overlays:
+            overlay.hide()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        for name, times in (('capture', self.capture_times), ('render', self.render_times), ('present', self.present_times)):
+            values = sorted(times)
+            stats[f'{name}_ms_p50'] = _percentile(values, 50)
+            stats[f'{name}_ms_p99'] = _percentile(values, 99)
+        return stats
+
+    def shutdown(self, timeout=1.0):
+        if not super().shutdown(timeout):
+            return False
+        for overlay in self.overlays:
+            overlay.close()
+        self.display.close()
+        return True
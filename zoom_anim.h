@@ -0,0 +1,75 @@
+#pragma once
+
+#define ZOOM_EASE_STEPS 64
+#define ZOOM_ANIM_DEFAULT_MS 120.0
+#define ZOOM_ANIM_MAX_MS 1000.0
+
+// Eases the applied zoom toward a target over a fixed duration. The target is
+// whatever MAG_FACTOR holds, so hooks and settings only store a float; the
+// frame loop calls step() once per frame and applies the value it returns.
+// Progress is taken from the clock, not the frame count, so a slow or dropped
+// frame moves further along the curve instead of stretching the animation.
+// A new target mid-flight restarts from the value on screen, so a burst of
+// wheel ticks is one animation toward the last target, not a queue of steps.
+// Not thread safe: the hooks run on the engine thread, between frames.
+class ZoomAnimator {
+public:
+    ZoomAnimator() : from_(0.0f), to_(0.0f), current_(0.0f), start_ms_(0.0), last_ms_(0.0), duration_ms_(ZOOM_ANIM_DEFAULT_MS), animations_(0) {
+        // Ease-out cubic, 1 - (1 - t)^3, sampled once; step() interpolates between samples
+        for (int i = 0; i <= ZOOM_EASE_STEPS; i++) {
+            double u = 1.0 - (double)i / ZOOM_EASE_STEPS;
+            table_[i] = (float)(1.0 - u * u * u);
+        }
+    }
+
+    void set_duration(double ms) {
+        duration_ms_ = ms < 0.0 ? 0.0 : (ms > ZOOM_ANIM_MAX_MS ? ZOOM_ANIM_MAX_MS : ms);
+    }
+
+    double duration() const { return duration_ms_; }
+    bool active() const { return current_ != to_; }
+    float current() const { return current_; }
+    unsigned long long animations() const { return animations_; }
+
+    // Snaps to zoom with no animation, e.g. when the lens is shown
+    void jump(float zoom) {
+        from_ = to_ = current_ = zoom;
+    }
+
+    float step(float target, double now_ms) {
+        double previous_ms = last_ms_;
+        last_ms_ = now_ms;
+        if (target != to_) {
+            if (duration_ms_ <= 0.0 || current_ == 0.0f) {
+                jump(target);
+                return current_;
+            }
+            from_ = current_;
+            to_ = target;
+            // The target arrived during the last frame interval, so this frame
+            // already shows one interval of progress rather than a still frame
+            start_ms_ = now_ms - previous_ms < duration_ms_ ? previous_ms : now_ms;
+            animations_++;
+        }
+        if (current_ == to_) return current_;
+        double t = (now_ms - start_ms_) / duration_ms_;
+        if (t >= 1.0) {
+            current_ = to_;
+            return current_;
+        }
+        if (t < 0.0) t = 0.0;
+        double pos = t * ZOOM_EASE_STEPS;
+        int i = (int)pos;
+        float frac = (float)(pos - i);
+        float ease = table_[i] + (table_[i + 1] - table_[i]) * frac;
+        current_ = from_ + (to_ - from_) * ease;
+        return current_;
+    }
+
+private:
+    float table_[ZOOM_EASE_STEPS + 1];
+    float from_, to_, current_;
+    double start_ms_, last_ms_;
+    double duration_ms_;
+    unsigned long long animations_;
+};